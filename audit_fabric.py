@@ -0,0 +1,346 @@
+#!/usr/bin/env python
+
+# BSD 3-Clause License
+#
+# Copyright (c) 2018, Arista Networks EOS+
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name Arista nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+'''
+This script audits a whole fabric for drift between NSX and the switches.
+Every NSX hardware binding is checked against the interface it lands on, and
+every switch port is checked for logical switch vlans that have no binding.
+Nothing is changed.
+
+All logical switches are read from NSX Manager with parallel page reads and
+their binding lists are pulled in parallel.  At the same time every switch
+is read once: a single eAPI call for its interface config and Mlag domain, or
+its "<switch> Switchports" configlet with --switch-config cvp.  The two are
+joined in memory by switch, port and vlan (see drift_audit.py) and each
+mismatch is written as one JSON line as soon as its switch has been read.
+
+With --scope input only the logical switches of the tenants in the input
+file are looked up, and only the ports in it (Port-channel members included)
+are read from each switch, so the audit costs about as much as a bind run.
+Binding lists still fresh in the --inventory are used without a GET, and the
+ones read from NSX are written back for the next run.
+
+Records are written to --output, or to standard output with every other
+message moved to standard error.  The run ends with a count of each kind
+of mismatch and exits with 1 if there were any.
+
+Please note that all SSL verification is disabled.  If you have signed certs
+in place for NSX Manager, you can set verify=True where the NsxClient is
+built in nsx_client.py.
+
+Created by Dimitri Capetz - dcapetz@arista.com
+'''
+
+# Import the shared NSX client for pooled API Calls to NSX Manager
+# Import the paged logical switch lookup
+# Import the binding index for reading each logical switch's bindings
+# Import the eAPI helpers for switch connections and cached Mlag domain lookups
+# Import the configlet model for reading switchports configlets
+# Import the reconcile helpers for reading configlet blocks
+# Import the drift join
+# Import the streaming port file reader for large inventories
+# Import argparse for pulling in file input via command line
+# Import json for working with json objects
+# Import pyEAPI for error handling on Arista Switches
+# Import CVP REST API Client for reading configlets from CVP
+# Import the CVP client wrapper for retries and request budgets
+# Import the run metrics for per phase timings
+# Import the retry and circuit breaker settings
+# Import the per data center request budgets
+# Import the inventory cache for NSX and fabric state kept between runs
+# Import the credential prompts and the multi data center runner
+# Import the warm pool so the provisioning service keeps the CVP login between jobs
+# Import concurrent.futures for reading NSX and the switches in parallel
+# Import sys for various error handling
+from nsx_client import NsxUnavailable, add_nsx_arguments, nsx_client_from_args
+from nsx_virtualwires import VirtualWireIndex
+from nsx_bindings import BindingIndex
+from eapi_client import MlagDomainCache, add_mlag_cache_arguments, eapi_connect
+from configlet import SwitchportConfiglet
+from reconcile import config_lines
+from drift_audit import BindingAudit, interface_sections, mlag_domain_from_text
+from port_inventory import add_port_arguments, port_configs_from_args
+import argparse
+import json
+import pyeapi
+from cvprac.cvp_client import CvpClient
+from cvprac.cvp_client_errors import CvpApiError, CvpLoginError
+from cvp_tasks import wrap_cvp_client
+from metrics import add_metrics_arguments, metrics_from_args
+from resilience import add_retry_arguments, breaker_from_args, retry_call, retry_policy_from_args
+from rate_limit import EndpointLimits
+from inventory import add_inventory_arguments, inventory_from_args
+from credentials import CVP_CREDENTIALS, NSX_CREDENTIALS, SWITCH_CREDENTIALS, prompt_credential
+from sites import SiteReport, add_site_arguments, run_sites, select_data_center
+from warm_pool import keep_warm
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import sys
+
+def connect_switch(switch):
+    ''' Connect to a switch over eAPI with the credentials, metrics, retry settings and request budget of the run
+
+    Args:
+        switch (str): The IP address or FQDN of the Arista switch
+
+    Returns:
+        switch_node (class): The connected pyeapi node
+    '''
+    return eapi_connect(switch, switch_username, switch_password, switch_addresses.get(switch), metrics=metrics,
+                        retry_policy=retry_policy_from_args(args), breaker=breaker_from_args(args, 'switch ' + switch),
+                        limiter=limits.switch(switch))
+
+def cvp_login():
+    ''' Log in to the CVP cluster.  Logging in is safe to repeat, so a busy or
+        unreachable cluster is retried with backoff.
+
+    Returns:
+        cvp (class): The logged in CvpClient
+    '''
+    cvp = CvpClient(syslog=True, filename='cvprac_log')
+    try:
+        retry_call(lambda: cvp.connect(cvps, cvp_username, cvp_password, port=cvp_port), retry_policy_from_args(args), None,
+                   retry_exceptions=(CvpLoginError,))
+    except CvpLoginError as error:
+        print('Unable to login to CVP. ' + str(error).strip())
+        sys.exit()
+    return cvp
+
+def read_bindings(virtualwire):
+    ''' Read the bindings of one logical switch, from the inventory while they are fresh
+
+    Args:
+        virtualwire (namedtuple): The VirtualWire of the logical switch
+
+    Returns:
+        binding_index (class): Its BindingIndex
+    '''
+    binding_index = BindingIndex(nsx, virtualwire.object_id, inventory=inventory)
+    if not binding_index.from_inventory:
+        binding_index.save()
+    return binding_index
+
+def read_nsx():
+    ''' Read the logical switches to audit and their bindings into the audit index '''
+    if args.scope == 'input':
+        with ThreadPoolExecutor(max_workers=args.nsx_workers) as pool:
+            found = list(pool.map(lambda ls_name: virtualwires.find(ls_name, verify=True), ls_names))
+        for ls_name, virtualwire in zip(ls_names, found):
+            if virtualwire is None:
+                write_records([audit.record('logical_switch_missing', None, None, expected='logical switch in NSX', found='not found', logical_switch=ls_name)])
+        logical_switches = [virtualwire for virtualwire in found if virtualwire is not None]
+    else:
+        logical_switches = list(virtualwires.load_all(args.nsx_workers).values())
+    print('Read ' + str(len(logical_switches)) + ' logical switches from NSX.  Reading their bindings...')
+    with ThreadPoolExecutor(max_workers=args.nsx_workers) as pool:
+        binding_indexes = pool.map(read_bindings, logical_switches)
+        for virtualwire, binding_index in zip(logical_switches, binding_indexes):
+            audit.add_logical_switch(virtualwire, binding_index)
+    print('Read ' + str(audit.bindings) + ' NSX hardware bindings.')
+
+def input_interfaces(switch_ports):
+    ''' List the interfaces of a switch in the input file, each Port-channel's members ahead of it
+
+    Args:
+        switch_ports (dict): A dictionary containing configuration attributes
+
+    Returns:
+        interfaces (list): Interface names
+    '''
+    interfaces = []
+    for port, config in switch_ports.items():
+        if port.startswith('Port'):
+            interfaces.extend(config['local_members'])
+        interfaces.append(port)
+    return interfaces
+
+def read_switch(switch):
+    ''' Read the interface config and mlag domain of one switch in a single request
+
+    Args:
+        switch (str): The IP address or FQDN of the Arista switch
+
+    Returns:
+        mlag_domain (str), interfaces (dict): The mlag domain ID (None if it has none) and interface name to config lines
+    '''
+    if args.switch_config == 'eapi':
+        switch_node = connect_switch(switch)
+        if args.scope == 'input':
+            commands = ['show running-config interfaces ' + interface for interface in input_interfaces(switch_ports.get(switch, {}))]
+        else:
+            commands = ['show running-config interfaces']
+        output = switch_node.enable(['show mlag'] + commands, encoding='text', strict=True)
+        mlag_domain = mlag_domain_from_text(output[0]['result']['output'])
+        if mlag_domain:
+            mlag_cache.learn(switch, mlag_domain)
+        interfaces = {}
+        # An interface that doesn't exist comes back without its "interface" line and is left out.
+        for interface_output in output[1:]:
+            interfaces.update(interface_sections(interface_output['result']['output']))
+        return mlag_domain, interfaces
+    try:
+        switch_configlet_data = cvp.api.get_configlet_by_name(switch + ' Switchports')
+    except CvpApiError:
+        switch_configlet_data = None
+    switch_configlet = SwitchportConfiglet(switch_configlet_data['config'] if switch_configlet_data else '')
+    interfaces = dict((name, config_lines(block.text)) for name, block in switch_configlet.index.items())
+    if args.scope == 'input':
+        scoped = set(input_interfaces(switch_ports.get(switch, {})))
+        interfaces = dict((name, lines) for name, lines in interfaces.items() if name in scoped)
+    # Only switches with an Mlag Port-channel in their configlet need their domain ID.
+    mlag_domain = None
+    if any(name.startswith('Port') and any(line.startswith('mlag ') for line in lines) for name, lines in interfaces.items()):
+        mlag_domain = mlag_cache.lookup(switch)
+    return mlag_domain, interfaces
+
+def write_records(records):
+    ''' Write mismatch records as JSON lines and flush them straight out '''
+    for record in records:
+        output.write(json.dumps(record) + '\n')
+    output.flush()
+
+# Pull in JSON file from command line argument
+parser = argparse.ArgumentParser(description='Audit every NSX hardware binding against the switchport config of the fabric')
+required_arg = parser.add_argument_group('Required Arguments')
+required_arg.add_argument('-j', '--json', dest='json', required=True, help='Input JSON file with the data center to audit', type=open)
+add_nsx_arguments(parser)
+add_mlag_cache_arguments(parser)
+add_inventory_arguments(parser)
+add_site_arguments(parser)
+add_metrics_arguments(parser)
+add_retry_arguments(parser)
+add_port_arguments(parser)
+audit_arg = parser.add_argument_group('Audit Arguments')
+audit_arg.add_argument('--scope', dest='scope', default='fabric', choices=['fabric', 'input'],
+                       help='Audit every logical switch and port (default), or only the logical switches and ports in the input file')
+audit_arg.add_argument('--switch-config', dest='switch_config', default='eapi', choices=['eapi', 'cvp'],
+                       help='Read switchport config from the running-config via eAPI (default) or from the CVP switchports configlets')
+audit_arg.add_argument('--output', dest='output', default=None, help='File to write mismatches to as JSON lines (default standard output)')
+audit_arg.add_argument('--bindings-only', dest='bindings_only', action='store_true', help='Only check NSX bindings, not switch ports that have no binding')
+audit_arg.add_argument('--nsx-workers', dest='nsx_workers', default=8, type=int, help='Maximum number of NSX page and binding reads in flight (default 8)')
+audit_arg.add_argument('--switch-workers', dest='switch_workers', default=0, type=int, help='Maximum number of switches read at once (default all)')
+# The audit never changes anything, so it has no --apply and nothing to resume.
+parser.set_defaults(apply=False, resume=None)
+args = parser.parse_args()
+data = json.load(args.json)
+
+# Run every data center in the input file as its own parallel run when there is more than one
+data_center = select_data_center(args, data)
+if data_center is None:
+    run_sites(args, data, NSX_CREDENTIALS + SWITCH_CREDENTIALS + (CVP_CREDENTIALS if args.switch_config == 'cvp' else []))
+site_report = SiteReport(args.site_report, data_center)
+
+# Keep standard output for the records alone when they are written there
+if args.output:
+    output = open(args.output, 'w')
+else:
+    output = sys.stdout
+    sys.stdout = sys.stderr
+metrics = metrics_from_args(args, 'audit_fabric')
+
+# Set Variables from JSON object
+nsx_manager = data['data_center'][data_center]['nsx_manager']
+switches = data['data_center'][data_center]['switches']
+# Optional map of switch name to IP address (or address:port) for switches without DNS
+switch_addresses = data['data_center'][data_center].get('switch_addresses', {})
+# Optional request budgets for NSX Manager, CVP and each switch
+limits = EndpointLimits(data['data_center'][data_center].get('limits'))
+if args.scope == 'input':
+    # The logical switches of every tenant in the input file, named the way create_logical_switch.py names them
+    if 'tenants' in data:
+        tenants = data['tenants']
+    else:
+        tenants = [{'tenant_name': data['tenant_name'], 'zone_name': data['zone_name']}]
+    ls_names = ['vls' + data_center + tenant['tenant_name'] + tenant['zone_name'] for tenant in tenants]
+    switch_ports = port_configs_from_args(args, data, data_center)
+
+# Set Variables for Login.  Switch credentials are used for Mlag domain lookups with --switch-config cvp.
+nsx_username = prompt_credential('NSX Manager Username: ', 'NSX_USERNAME')
+nsx_password = prompt_credential('NSX Manager Password: ', 'NSX_PASSWORD', secret=True)
+switch_username = prompt_credential('Switch Username: ', 'SWITCH_USERNAME')
+switch_password = prompt_credential('Switch Password: ', 'SWITCH_PASSWORD', secret=True)
+if args.switch_config == 'cvp':
+    cvp_username = prompt_credential('CVP Username: ', 'CVP_USERNAME')
+    cvp_password = prompt_credential('CVP Password: ', 'CVP_PASSWORD', secret=True)
+    cvps = data['data_center'][data_center]['cvps']
+    cvp_port = data['data_center'][data_center].get('cvp_port')
+
+# Open one pooled session to NSX Manager for the whole run
+nsx = nsx_client_from_args(args, nsx_manager, nsx_username, nsx_password, metrics=metrics, limits=limits)
+inventory = inventory_from_args(args)
+virtualwires = VirtualWireIndex(nsx, 'virtualwires', page_size=args.nsx_page_size, inventory=inventory)
+mlag_cache = MlagDomainCache(connect_switch, cache_file=args.mlag_cache, ttl=args.mlag_cache_ttl, inventory=inventory)
+if args.switch_config == 'cvp':
+    # The provisioning service keeps the logged in client for later jobs.
+    cvp = keep_warm(('cvp', tuple(cvps), cvp_port, cvp_username, cvp_password), cvp_login)
+    wrap_cvp_client(cvp, metrics=metrics, retry_policy=retry_policy_from_args(args), breaker=breaker_from_args(args, 'CVP'), limiter=limits.cvp(cvps))
+audit = BindingAudit(data_center, check_unbound=not args.bindings_only)
+
+# Read NSX and every switch at the same time.  Once NSX has been read, each switch is joined
+# against the bindings and its mismatches written out in the order the switches answer.
+metrics.phase('audit')
+with ThreadPoolExecutor(max_workers=1) as nsx_pool, ThreadPoolExecutor(max_workers=args.switch_workers or len(switches) or 1) as switch_pool:
+    nsx_future = nsx_pool.submit(read_nsx)
+    switch_futures = dict((switch_pool.submit(read_switch, switch), switch) for switch in switches)
+    try:
+        nsx_future.result()
+    except NsxUnavailable as error:
+        print('Unable to read NSX Manager. ' + str(error))
+        sys.exit(1)
+    for future in as_completed(switch_futures):
+        switch = switch_futures[future]
+        try:
+            mlag_domain, interfaces = future.result()
+        except (pyeapi.eapilib.ConnectionError, pyeapi.eapilib.CommandError, CvpApiError) as error:
+            print('Unable to read ' + switch + ': ' + str(error))
+            write_records([audit.record('switch_error', switch, None, found=str(error))])
+            continue
+        write_records(audit.audit_switch(switch, mlag_domain, interfaces, interfaces_only=args.scope == 'input'))
+write_records(audit.unaudited())
+if args.output:
+    output.close()
+
+mismatches = sum(count for kind, count in audit.counts.items())
+print('Audited ' + str(audit.bindings) + ' NSX hardware bindings across ' + str(len(switches)) + ' switches.')
+for kind, count in sorted(audit.counts.items()):
+    print('  ' + kind + ': ' + str(count))
+if not mismatches:
+    print('No drift found.')
+mlag_cache.save()
+site_report.finish('drift' if mismatches else 'audited', failures=[kind + ': ' + str(count) for kind, count in sorted(audit.counts.items())])
+
+# Report NSX Manager connection reuse and any throttling for the run
+nsx.print_stats()
+limits.print_stats()
+inventory.print_stats()
+inventory.close()
+nsx.close()
+sys.exit(1 if mismatches else 0)
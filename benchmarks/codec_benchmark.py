@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+
+# BSD 3-Clause License
+#
+# Copyright (c) 2018, Arista Networks EOS+
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name Arista nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+'''
+Micro-benchmark of the NSX XML codec against xmltodict and dicttoxml.
+
+Builds NSX-shaped documents in memory (logical switch pages, binding lists,
+a single logical switch, an auth token) and times reading them into the
+same records both ways, from memory and, for the lists, streamed the way
+the scripts read them.  Then it times building the two POST bodies both ways.
+For each case it reports microseconds and bytes allocated per object.
+xmltodict and dicttoxml are only needed for the comparison.
+
+    python benchmarks/codec_benchmark.py --objects 1 100 1000
+
+Created by Dimitri Capetz - dcapetz@arista.com
+'''
+
+# Import the codec under test
+# Import xmltodict and dicttoxml for the old path
+# Import argparse for the benchmark options
+# Import io for streaming documents from memory
+# Import os and sys for finding the repo modules
+# Import timeit and tracemalloc for time and allocation per object
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from nsx_xml import (HardwareGatewayBinding, VirtualWire, first_object_id, hardware_gateway_binding, parse_auth_token,
+                     parse_bindings, parse_virtualwire, parse_virtualwire_page, virtualwire_create_spec)
+try:
+    import xmltodict
+    from dicttoxml import dicttoxml
+except ImportError:
+    print('Install xmltodict and dicttoxml to compare against them.')
+    sys.exit()
+import argparse
+import io
+import timeit
+import tracemalloc
+
+def virtualwire_xml(index):
+    return ('<virtualWire><objectId>virtualwire-' + str(index) + '</objectId><name>vlsdc01tenant' + str(index) + 'zone1</name>'
+            '<tenantId>tenant' + str(index) + '</tenantId><vdnScopeId>vdnscope-1</vdnScopeId><vdsContextWithBacking><switch>'
+            '<objectId>dvs-1</objectId><name>DSwitch</name></switch><backingValue>dvportgroup-' + str(index) + '</backingValue>'
+            '</vdsContextWithBacking><vdnId>' + str(5000 + index) + '</vdnId></virtualWire>')
+
+def page_xml(count):
+    return ('<virtualWires><dataPage><pagingInfo><pageSize>' + str(count) + '</pageSize><startIndex>0</startIndex><totalCount>' +
+            str(count) + '</totalCount></pagingInfo>' + ''.join(virtualwire_xml(index) for index in range(count)) +
+            '</dataPage></virtualWires>').encode('utf-8')
+
+def bindings_xml(count):
+    return ('<list>' + ''.join('<hardwareGatewayBinding><id>binding-' + str(index) + '</id><hardwareGatewayId>hardwarewgateway1'
+                               '</hardwareGatewayId><vlan>501</vlan><switchName>leaf' + str(index // 48) + '</switchName>'
+                               '<portName>Ethernet' + str(index % 48 + 1) + '</portName></hardwareGatewayBinding>'
+                               for index in range(count)) + '</list>').encode('utf-8')
+
+def as_list(value):
+    # xmltodict hands back a dict instead of a list when only one element exists.
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+def xmltodict_page(body):
+    page = xmltodict.parse(body, dict_constructor=dict)['virtualWires']['dataPage']
+    return [VirtualWire(wire['name'], wire['objectId'], wire['vdnId']) for wire in as_list(page.get('virtualWire'))]
+
+def xmltodict_bindings(body):
+    bind_dict = xmltodict.parse(body, dict_constructor=dict)
+    return [HardwareGatewayBinding(binding['switchName'], binding['portName'], binding.get('vlan') or '', binding.get('id'))
+            for binding in as_list((bind_dict['list'] or {}).get('hardwareGatewayBinding'))]
+
+def xmltodict_virtualwire(body):
+    wire = xmltodict.parse(body, dict_constructor=dict)['virtualWire']
+    return VirtualWire(wire['name'], wire['objectId'], wire['vdnId'])
+
+def measure(function, objects, seconds):
+    ''' Time and allocation of one call, divided by the objects it handles
+
+    Args:
+        function (function): The call to measure
+        objects (int): Objects handled by one call
+        seconds (float): Roughly how long to spend timing it
+
+    Returns:
+        microseconds (float), allocated (float): Per object, best of 5 for time and peak traced bytes for allocation
+    '''
+    number = max(1, int(seconds / 5 / max(timeit.timeit(function, number=1), 1e-6)))
+    best = min(timeit.repeat(function, number=number, repeat=5)) / number
+    tracemalloc.start()
+    function()
+    allocated = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best * 1e6 / objects, allocated / float(objects)
+
+def print_report(rows):
+    header = ('Case', 'Objects', 'Old us/obj', 'Codec us/obj', 'Speedup', 'Old B/obj', 'Codec B/obj')
+    widths = [max(len(row[column]) for row in [header] + rows) for column in range(len(header))]
+    for row in [header] + rows:
+        print('  '.join(row[column].ljust(widths[column]) for column in range(len(header))).rstrip())
+
+parser = argparse.ArgumentParser(description='Benchmark the NSX XML codec against xmltodict and dicttoxml')
+parser.add_argument('--objects', dest='objects', nargs='+', type=int, default=[1, 100, 1000], help='Logical switches and bindings per list (default 1 100 1000)')
+parser.add_argument('--seconds', dest='seconds', default=0.5, type=float, help='Rough time spent timing each case (default 0.5)')
+options = parser.parse_args()
+
+cases = []
+for count in options.objects:
+    page = page_xml(count)
+    bindings = bindings_xml(count)
+    assert xmltodict_page(page) == parse_virtualwire_page(page)[0]
+    assert xmltodict_bindings(bindings) == parse_bindings(bindings)
+    cases.append(('parse virtualwire page', count, lambda page=page: xmltodict_page(page), lambda page=page: parse_virtualwire_page(page)))
+    cases.append(('parse binding list', count, lambda bindings=bindings: xmltodict_bindings(bindings), lambda bindings=bindings: parse_bindings(bindings)))
+    # The scripts stream pages and binding lists straight off the socket.
+    cases.append(('stream virtualwire page', count, lambda page=page: xmltodict_page(page), lambda page=page: parse_virtualwire_page(io.BytesIO(page))))
+    cases.append(('stream binding list', count, lambda bindings=bindings: xmltodict_bindings(bindings), lambda bindings=bindings: parse_bindings(io.BytesIO(bindings))))
+single = virtualwire_xml(1).encode('utf-8')
+scopes = b'<vdnScopes><vdnScope><objectId>vdnscope-1</objectId><name>Transport Zone</name></vdnScope></vdnScopes>'
+token = b'<authToken><value>6a3e1c2b-token</value><expiresOn>1700000000000</expiresOn></authToken>'
+binding = {'hardwareGatewayId': 'hardwarewgateway1', 'vlan': '501', 'switchName': 'leaf01', 'portName': 'Ethernet1'}
+create_spec = {'name': 'vlsdc01tenantzone1', 'tenantId': 'tenant'}
+assert dicttoxml(binding, custom_root='hardwareGatewayBinding', attr_type=False) == hardware_gateway_binding('hardwarewgateway1', 'leaf01', 'Ethernet1', '501')
+assert dicttoxml(create_spec, custom_root='virtualWireCreateSpec', attr_type=False) == virtualwire_create_spec('vlsdc01tenantzone1', 'tenant')
+cases += [
+    ('parse virtualwire', 1, lambda: xmltodict_virtualwire(single), lambda: parse_virtualwire(single)),
+    ('parse transport zone', 1, lambda: xmltodict.parse(scopes, dict_constructor=dict)['vdnScopes']['vdnScope']['objectId'],
+     lambda: first_object_id(scopes, 'vdnScope')),
+    ('parse auth token', 1, lambda: xmltodict.parse(token, dict_constructor=dict)['authToken']['value'], lambda: parse_auth_token(token)),
+    ('build binding POST', 1, lambda: dicttoxml(binding, custom_root='hardwareGatewayBinding', attr_type=False),
+     lambda: hardware_gateway_binding('hardwarewgateway1', 'leaf01', 'Ethernet1', '501')),
+    ('build create POST', 1, lambda: dicttoxml(create_spec, custom_root='virtualWireCreateSpec', attr_type=False),
+     lambda: virtualwire_create_spec('vlsdc01tenantzone1', 'tenant')),
+]
+rows = []
+for name, count, old, codec in cases:
+    old_time, old_bytes = measure(old, count, options.seconds)
+    codec_time, codec_bytes = measure(codec, count, options.seconds)
+    rows.append((name, str(count), '{:.2f}'.format(old_time), '{:.2f}'.format(codec_time), '{:.1f}x'.format(old_time / codec_time),
+                 '{:.0f}'.format(old_bytes), '{:.0f}'.format(codec_bytes)))
+print_report(rows)
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+
+# BSD 3-Clause License
+#
+# Copyright (c) 2018, Arista Networks EOS+
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name Arista nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+'''
+Memory benchmark of reading ports from the input file against streaming
+them from a --ports file.
+
+Writes a batch of ports spread over 48 port switches as a JSON input file
+with port_configs, and as NDJSON and CSV port files, in a temporary
+directory.  Each is read the way the scripts read it: json.load of the
+whole input file, and load_ports for the port files.  The records from all
+three are checked to match first.  For each case it reports the time to
+read, and the peak and retained bytes traced per port.
+
+    python benchmarks/input_benchmark.py --ports 1000 10000 100000
+
+Created by Dimitri Capetz - dcapetz@arista.com
+'''
+
+# Import the port file reader under test
+# Import argparse for the benchmark options
+# Import csv and json for writing the files
+# Import os, sys and tempfile for finding the repo modules and holding the files
+# Import time and tracemalloc for time and memory per port
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from port_inventory import CSV_FIELDS, load_ports
+import argparse
+import csv
+import json
+import tempfile
+import time
+import tracemalloc
+
+PORTS_PER_SWITCH = 48
+
+def make_rows(count):
+    ''' count ports as port file rows, cycling through every mode, Ethernet and Port-channel, Mlag and not '''
+    modes = ('trunk', 'trunk native', 'access')
+    for index in range(count):
+        switch = 'leaf' + str(index // PORTS_PER_SWITCH + 1)
+        number = index % PORTS_PER_SWITCH + 1
+        row = {'switch': switch, 'description': 'server ' + str(index), 'mode': modes[index % 3], 'speed': '10gfull'}
+        if index % 4 == 3:
+            row.update({'port': 'Port-channel' + str(number), 'local_members': ['Ethernet' + str(number) + '/1'], 'is_mlag': index % 8 == 3})
+        else:
+            row['port'] = 'Ethernet' + str(number)
+        yield row
+
+def write_files(directory, count):
+    ''' Write the JSON input file and both port files for count ports
+
+    Args:
+        directory (str): Where to write them
+        count (int): Ports to write
+
+    Returns:
+        input_path (str), ndjson_path (str), csv_path (str), switches (list): The three files and the switch names
+    '''
+    paths = [os.path.join(directory, name + str(count) + extension) for name, extension in
+             (('input', '.json'), ('ports', '.ndjson'), ('ports', '.csv'))]
+    port_configs = {}
+    with open(paths[1], 'w') as ndjson_file, open(paths[2], 'w', newline='') as csv_file:
+        writer = csv.DictWriter(csv_file, CSV_FIELDS)
+        writer.writeheader()
+        for row in make_rows(count):
+            ndjson_file.write(json.dumps(row) + '\n')
+            csv_row = dict(row, local_members=';'.join(row.get('local_members', [])))
+            if 'is_mlag' in row:
+                csv_row['is_mlag'] = 'true' if row['is_mlag'] else 'false'
+            writer.writerow(csv_row)
+            config = dict((field, value) for field, value in row.items() if field not in ('switch', 'port'))
+            port_configs.setdefault(row['switch'], {})[row['port']] = config
+    switches = list(port_configs)
+    with open(paths[0], 'w') as input_file:
+        json.dump({'data_center': {'dc1': {'switches': switches}}, 'port_configs': port_configs}, input_file)
+    return paths[0], paths[1], paths[2], switches
+
+def read_input(path):
+    with open(path) as input_file:
+        return json.load(input_file)['port_configs']
+
+def as_dicts(port_configs):
+    # The fields every reader hands the scripts, for checking they agree
+    records = {}
+    for switch, ports in port_configs.items():
+        for port, config in ports.items():
+            record = [config['description'], config['mode'], config['speed']]
+            if port.startswith('Port'):
+                record += [list(config['local_members']), config['is_mlag']]
+            records[switch, port] = record
+    return records
+
+def measure(function, objects):
+    ''' Time and memory of one call, divided by the objects it handles
+
+    Args:
+        function (function): The call to measure
+        objects (int): Objects handled by one call
+
+    Returns:
+        microseconds (float), peak (float), retained (float): Per object, for time, peak traced bytes and traced bytes still held by the result
+    '''
+    start = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    result = function()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return elapsed * 1e6 / objects, peak / float(objects), retained / float(objects)
+
+def print_report(rows):
+    header = ('Case', 'Ports', 'us/port', 'Peak B/port', 'Held B/port', 'Peak MB')
+    widths = [max(len(row[column]) for row in [header] + rows) for column in range(len(header))]
+    for row in [header] + rows:
+        print('  '.join(row[column].ljust(widths[column]) for column in range(len(header))).rstrip())
+
+parser = argparse.ArgumentParser(description='Benchmark reading ports from the input file against streaming a port file')
+parser.add_argument('--ports', dest='ports', nargs='+', type=int, default=[1000, 10000, 100000], help='Ports per file (default 1000 10000 100000)')
+options = parser.parse_args()
+
+rows = []
+with tempfile.TemporaryDirectory() as directory:
+    for count in options.ports:
+        input_path, ndjson_path, csv_path, switches = write_files(directory, count)
+        known_switches = set(switches)
+        expected = as_dicts(read_input(input_path))
+        assert as_dicts(load_ports(ndjson_path, 'ndjson', switches, known_switches)[0]) == expected
+        assert as_dicts(load_ports(csv_path, 'csv', switches, known_switches)[0]) == expected
+        cases = [
+            ('input file json.load', lambda: read_input(input_path)),
+            ('ndjson load_ports', lambda: load_ports(ndjson_path, 'ndjson', switches, known_switches)),
+            ('csv load_ports', lambda: load_ports(csv_path, 'csv', switches, known_switches)),
+        ]
+        for name, function in cases:
+            microseconds, peak, retained = measure(function, count)
+            rows.append((name, str(count), '{:.2f}'.format(microseconds), '{:.0f}'.format(peak), '{:.0f}'.format(retained),
+                         '{:.1f}'.format(peak * count / 1e6)))
+print_report(rows)
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+
+# BSD 3-Clause License
+#
+# Copyright (c) 2018, Arista Networks EOS+
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name Arista nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+'''
+Offline benchmark for the scripts in this repo.
+
+Each scenario starts a fresh set of local NSX Manager, eAPI and CVP
+stand-ins (see standins.py), writes an input file pointing at them and runs
+the script as a child process with canned credentials on stdin.  For every
+script and port count it reports the wall time, the number of requests each
+stand-in served and the peak memory of the script process.  The audit_fabric
+scenario binds the ports with eapi_add_hardware_binding.py first and only
+measures the audit.  audit_input does the same with --scope input.
+
+    python benchmarks/run_benchmarks.py --ports 1 10 100 --latency 0.02
+
+Created by Dimitri Capetz - dcapetz@arista.com
+'''
+
+# Import the stand-ins for NSX Manager, eAPI and CVP
+# Import argparse for the benchmark options
+# Import json for writing input files and results
+# Import os, subprocess, sys and tempfile for running the scripts
+# Import time for wall clock measurements
+from standins import StandInFabric
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS = ['create_logical_switch', 'eapi_add_hardware_binding', 'cvp_add_hardware_binding', 'audit_fabric', 'audit_input']
+PORT_MODES = ['trunk', 'access', 'trunk native']
+
+def build_port_configs(port_count, ports_per_switch):
+    ''' Spread port_count switchports over as many leaf switches as needed.
+        Every eighth port is an Mlag port-channel with one local member.
+
+    Args:
+        port_count (int): Total number of ports to configure and bind
+        ports_per_switch (int): Maximum number of ports on one switch
+
+    Returns:
+        port_configs (dict): The port_configs section of an input file
+    '''
+    port_configs = {}
+    switch_count = (port_count + ports_per_switch - 1) // ports_per_switch
+    for switch_index in range(switch_count):
+        switch = 'leaf' + '{:02d}'.format(switch_index + 1)
+        port_configs[switch] = {}
+        for port_index in range(1, min(ports_per_switch, port_count - switch_index * ports_per_switch) + 1):
+            mode = PORT_MODES[port_index % len(PORT_MODES)]
+            if port_index % 8 == 0:
+                port_configs[switch]['Port-channel' + str(port_index)] = {
+                    'description': 'Port-Channel Interface', 'mode': mode, 'speed': '10gfull',
+                    'local_members': ['Ethernet' + str(port_index)], 'is_mlag': True}
+            else:
+                port_configs[switch]['Ethernet' + str(port_index)] = {
+                    'description': 'Server Interface', 'mode': mode, 'speed': '10gfull'}
+    return port_configs
+
+def run_script(script, input_file, credentials, arguments=('--apply',)):
+    ''' Run one of the repo scripts to completion and measure it
+
+    Args:
+        script (str): The script name without .py
+        input_file (str): Path of the JSON input file
+        credentials (str): Text fed to the username and password prompts
+        arguments (list): Arguments added after the input file
+
+    Returns:
+        result (dict): exit code, wall time and peak memory of the run
+    '''
+    with tempfile.TemporaryFile() as output:
+        started = time.monotonic()
+        # A new session has no controlling terminal, so getpass falls back to stdin.
+        process = subprocess.Popen([sys.executable, os.path.join(REPO_DIR, script + '.py'), '-j', input_file] + list(arguments),
+                                   cwd=tempfile.gettempdir(), stdin=subprocess.PIPE, stdout=output,
+                                   stderr=subprocess.STDOUT, start_new_session=True)
+        process.stdin.write(credentials.encode('utf-8'))
+        process.stdin.close()
+        _, status, usage = os.wait4(process.pid, 0)
+        wall_time = time.monotonic() - started
+        process.returncode = os.waitstatus_to_exitcode(status)
+        output.seek(0)
+        log = output.read().decode('utf-8', 'replace')
+    return {'exit_code': process.returncode, 'wall_time': round(wall_time, 3),
+            'peak_memory_kb': usage.ru_maxrss, 'log': log}
+
+def run_scenario(script, port_count, options):
+    ''' Benchmark one script at one port count against fresh stand-ins
+
+    Args:
+        script (str): The script name without .py
+        port_count (int): Number of ports in the input file
+        options (class): The parsed benchmark arguments
+
+    Returns:
+        result (dict): The measurements for the report
+    '''
+    port_configs = build_port_configs(port_count, options.ports_per_switch)
+    filler = [('vlsbenchfiller' + str(index), 'filler') for index in range(options.existing_switches)]
+    if script != 'create_logical_switch':
+        # The binding scripts expect the tenant logical switch to exist already.
+        filler.append(('vlsdc01benchtenantzone1', 'benchtenant'))
+    fabric = StandInFabric(list(port_configs.keys()), latency=options.latency, virtualwires=filler, fail_rate=options.fail_rate,
+                           max_concurrency=options.max_concurrency)
+    try:
+        data = {'tenant_name': 'benchtenant', 'zone_name': 'zone1',
+                'data_center': {'dc01': fabric.data_center()}, 'port_configs': port_configs}
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as input_file:
+            json.dump(data, input_file)
+        try:
+            if script in ('audit_fabric', 'audit_input'):
+                run_script('eapi_add_hardware_binding', input_file.name, 'admin\n' * 8)
+                fabric.reset_counts()
+                scope = ['--scope', 'input'] if script == 'audit_input' else []
+                result = run_script('audit_fabric', input_file.name, 'admin\n' * 8, ['--output', os.devnull] + scope)
+            else:
+                result = run_script(script, input_file.name, 'admin\n' * 8)
+        finally:
+            os.remove(input_file.name)
+        result['requests'] = fabric.request_counts
+    finally:
+        fabric.stop()
+    result.update({'script': script, 'ports': port_count, 'switches': len(port_configs)})
+    return result
+
+def print_report(results):
+    ''' Print one table of every scenario
+
+    Args:
+        results (list): Result dictionaries from run_scenario
+    '''
+    header = ('Script', 'Ports', 'Switches', 'Wall (s)', 'NSX req', 'eAPI req', 'CVP req', '429s', 'Peak MB', 'Exit')
+    rows = []
+    for result in results:
+        rows.append((result['script'], str(result['ports']), str(result['switches']), '{:.2f}'.format(result['wall_time']),
+                     str(result['requests']['nsx']), str(result['requests']['eapi']), str(result['requests']['cvp']),
+                     str(result['requests']['throttled']),
+                     '{:.1f}'.format(result['peak_memory_kb'] / 1024.0), str(result['exit_code'])))
+    widths = [max(len(row[column]) for row in [header] + rows) for column in range(len(header))]
+    for row in [header] + rows:
+        print('  '.join(row[column].ljust(widths[column]) for column in range(len(header))).rstrip())
+
+parser = argparse.ArgumentParser(description='Benchmark the NSX binding scripts against local stand-ins')
+parser.add_argument('--ports', dest='ports', nargs='+', type=int, default=[1, 10, 100, 1000], help='Port counts to run (default 1 10 100 1000)')
+parser.add_argument('--scripts', dest='scripts', nargs='+', choices=SCRIPTS, default=SCRIPTS, help='Scripts to run (default all)')
+parser.add_argument('--latency', dest='latency', default=0.02, type=float, help='Seconds added to every stand-in request (default 0.02)')
+parser.add_argument('--ports-per-switch', dest='ports_per_switch', default=48, type=int, help='Ports configured per leaf switch (default 48)')
+parser.add_argument('--existing-switches', dest='existing_switches', default=500, type=int, help='Unrelated logical switches already in NSX (default 500)')
+parser.add_argument('--fail-rate', dest='fail_rate', default=0, type=float, help='Fraction of NSX and CVP requests answered with a 503 (default 0)')
+parser.add_argument('--max-concurrency', dest='max_concurrency', default=0, type=int, help='Requests NSX and CVP serve at once before answering 429 (default no limit)')
+parser.add_argument('--output', dest='output', help='Write the results to this JSON file')
+parser.add_argument('--show-log', dest='show_log', action='store_true', help='Print the output of every script run')
+options = parser.parse_args()
+
+results = []
+for script in options.scripts:
+    for port_count in options.ports:
+        print('Running ' + script + ' with ' + str(port_count) + ' port(s)...')
+        result = run_scenario(script, port_count, options)
+        if options.show_log or result['exit_code'] != 0:
+            print(result['log'])
+        results.append(result)
+print_report(results)
+if options.output:
+    with open(options.output, 'w') as output_file:
+        json.dump([dict((key, value) for key, value in result.items() if key != 'log') for result in results], output_file, indent=2)
@@ -0,0 +1,489 @@
+#!/usr/bin/env python
+
+# BSD 3-Clause License
+#
+# Copyright (c) 2018, Arista Networks EOS+
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name Arista nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+'''
+Local HTTPS stand-ins for NSX Manager, Arista eAPI and CloudVision Portal.
+
+These are just enough of each API for the scripts in this repo to run end to
+end on a laptop.  Every stand-in counts the requests it serves and can add a
+fixed latency to each one, so that round trip savings show up in wall time
+the way they would against the real thing.  State lives in memory and is
+thrown away with the server.
+
+Created by Dimitri Capetz - dcapetz@arista.com
+'''
+
+# Import http.server and ssl for the HTTPS listeners
+# Import ElementTree for building and reading NSX XML
+# Import json for eAPI and CVP bodies
+# Import urllib.parse for query strings
+# Import subprocess, os and tempfile for the throwaway certificate
+# Import threading and time for latency and task progress
+# Import random for injected failures
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from xml.etree import ElementTree
+from urllib.parse import urlsplit, parse_qs
+import json
+import os
+import random
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+
+def make_certificate(directory):
+    ''' Generate a throwaway self-signed certificate with openssl
+
+    Args:
+        directory (str): Where to write cert.pem and key.pem
+
+    Returns:
+        cert_file (str), key_file (str): Paths of the certificate and key
+    '''
+    cert_file = os.path.join(directory, 'cert.pem')
+    key_file = os.path.join(directory, 'key.pem')
+    subprocess.check_call(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                           '-subj', '/CN=localhost', '-keyout', key_file, '-out', cert_file],
+                          stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return cert_file, key_file
+
+class StandInHandler(BaseHTTPRequestHandler):
+    ''' Request handler that hands every call to the owning stand-in '''
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def handle_any(self, method):
+        standin = self.server.standin
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        standin.count_request()
+        throttled = not standin.enter()
+        try:
+            if standin.latency:
+                time.sleep(standin.latency)
+            url = urlsplit(self.path)
+            query = dict((key, values[0]) for key, values in parse_qs(url.query).items())
+            if throttled:
+                status, content_type, response_body = 429, 'text/plain', 'Too Many Requests'
+            elif standin.fail_rate and random.random() < standin.fail_rate:
+                status, content_type, response_body = 503, 'text/plain', 'Service Unavailable'
+            else:
+                status, content_type, response_body = standin.handle(method, url.path, query, body, self.headers)
+        finally:
+            standin.leave()
+        if isinstance(response_body, str):
+            response_body = response_body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(response_body)))
+        self.end_headers()
+        self.wfile.write(response_body)
+
+    def do_GET(self):
+        self.handle_any('GET')
+
+    def do_POST(self):
+        self.handle_any('POST')
+
+    def do_DELETE(self):
+        self.handle_any('DELETE')
+
+class StandIn(object):
+    ''' Base HTTPS stand-in server
+
+    Args:
+        ssl_context (class): Server side SSL context to wrap the listener in
+        latency (float): Seconds added to every request
+        fail_rate (float): Fraction of requests answered with a 503 instead
+        max_concurrency (int): Requests served at once before the rest get a 429, 0 for no limit
+    '''
+
+    def __init__(self, ssl_context, latency=0, fail_rate=0, max_concurrency=0):
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.max_concurrency = max_concurrency
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.active = 0
+        self.throttled = 0
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+        self.server.daemon_threads = True
+        self.server.socket = ssl_context.wrap_socket(self.server.socket, server_side=True)
+        self.server.standin = self
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def address(self):
+        return '127.0.0.1:' + str(self.server.server_address[1])
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def count_request(self):
+        with self.lock:
+            self.requests += 1
+
+    def enter(self):
+        ''' Start serving a request.  Returns False if it is over the concurrency limit. '''
+        with self.lock:
+            self.active += 1
+            if self.max_concurrency and self.active > self.max_concurrency:
+                self.throttled += 1
+                return False
+            return True
+
+    def leave(self):
+        with self.lock:
+            self.active -= 1
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def handle(self, method, path, query, body, headers):
+        return 404, 'text/plain', 'not found'
+
+def xml_text(tag, text):
+    element = ElementTree.Element(tag)
+    element.text = text
+    return element
+
+class NsxStandIn(StandIn):
+    ''' NSX Manager stand-in serving the /api/2.0/vdn/ XML endpoints the scripts use
+
+    Args:
+        ssl_context (class): Server side SSL context
+        latency (float): Seconds added to every request
+        virtualwires (list): (name, tenantId) pairs of logical switches that already exist
+    '''
+
+    def __init__(self, ssl_context, latency=0, virtualwires=()):
+        super(NsxStandIn, self).__init__(ssl_context, latency)
+        self.scope_id = 'vdnscope-1'
+        self.hw_id = 'hardwarewgateway1'
+        self.virtualwires = []
+        self.bindings = {}
+        for name, tenant_id in virtualwires:
+            self.add_virtualwire(name, tenant_id)
+
+    def add_virtualwire(self, name, tenant_id):
+        with self.lock:
+            index = len(self.virtualwires) + 1
+            virtualwire = {'objectId': 'virtualwire-' + str(index), 'name': name, 'tenantId': tenant_id,
+                           'vdnId': str(5000 + index)}
+            self.virtualwires.append(virtualwire)
+            self.bindings[virtualwire['objectId']] = []
+            return virtualwire
+
+    def virtualwire_element(self, virtualwire):
+        element = ElementTree.Element('virtualWire')
+        element.append(xml_text('objectId', virtualwire['objectId']))
+        element.append(xml_text('name', virtualwire['name']))
+        element.append(xml_text('tenantId', virtualwire['tenantId']))
+        element.append(xml_text('vdnScopeId', self.scope_id))
+        backing = ElementTree.SubElement(element, 'vdsContextWithBacking')
+        switch = ElementTree.SubElement(backing, 'switch')
+        switch.append(xml_text('objectId', 'dvs-1'))
+        switch.append(xml_text('name', 'DSwitch'))
+        backing.append(xml_text('backingValue', 'dvportgroup-' + virtualwire['vdnId']))
+        element.append(xml_text('vdnId', virtualwire['vdnId']))
+        return element
+
+    def find_virtualwire(self, object_id):
+        for virtualwire in self.virtualwires:
+            if virtualwire['objectId'] == object_id:
+                return virtualwire
+        return None
+
+    def handle(self, method, path, query, body, headers):
+        xml = 'application/xml'
+        if path == '/api/2.0/services/auth/token' and method == 'POST':
+            return 200, xml, '<authToken><value>standin-token</value><expiresOn>0</expiresOn></authToken>'
+        if not path.startswith('/api/2.0/vdn/'):
+            return 404, xml, ''
+        parts = path[len('/api/2.0/vdn/'):].strip('/').split('/')
+        if parts == ['scopes']:
+            return 200, xml, ('<vdnScopes><vdnScope><objectId>' + self.scope_id +
+                              '</objectId><name>Transport Zone</name></vdnScope></vdnScopes>')
+        if parts == ['hardwaregateways']:
+            return 200, xml, ('<list><hardwareGateway><objectId>' + self.hw_id +
+                              '</objectId><name>CVX</name></hardwareGateway></list>')
+        if parts == ['virtualwires'] or parts == ['scopes', self.scope_id, 'virtualwires']:
+            if method == 'POST':
+                spec = ElementTree.fromstring(body)
+                virtualwire = self.add_virtualwire(spec.findtext('name'), spec.findtext('tenantId'))
+                return 201, 'text/plain', virtualwire['objectId']
+            start = int(query.get('startindex', 0))
+            size = int(query.get('pagesize', 20))
+            with self.lock:
+                page = self.virtualwires[start:start + size]
+                total = len(self.virtualwires)
+            root = ElementTree.Element('virtualWires')
+            data_page = ElementTree.SubElement(root, 'dataPage')
+            paging = ElementTree.SubElement(data_page, 'pagingInfo')
+            paging.append(xml_text('pageSize', str(size)))
+            paging.append(xml_text('startIndex', str(start)))
+            paging.append(xml_text('totalCount', str(total)))
+            for virtualwire in page:
+                data_page.append(self.virtualwire_element(virtualwire))
+            return 200, xml, ElementTree.tostring(root)
+        if len(parts) >= 2 and parts[0] == 'virtualwires':
+            virtualwire = self.find_virtualwire(parts[1])
+            if virtualwire is None:
+                return 404, xml, ''
+            if len(parts) == 2 and method == 'GET':
+                return 200, xml, ElementTree.tostring(self.virtualwire_element(virtualwire))
+            if len(parts) == 2 and method == 'DELETE':
+                with self.lock:
+                    self.virtualwires.remove(virtualwire)
+                return 200, xml, ''
+            if parts[2:] == ['hardwaregateways']:
+                bindings = self.bindings[virtualwire['objectId']]
+                if method == 'POST':
+                    binding = ElementTree.fromstring(body)
+                    key = (binding.findtext('switchName'), binding.findtext('portName'))
+                    with self.lock:
+                        if key in [(entry['switchName'], entry['portName']) for entry in bindings]:
+                            return 400, xml, '<error><details>Binding already exists</details></error>'
+                        bindings.append({'id': 'binding-' + str(len(bindings) + 1), 'hardwareGatewayId': binding.findtext('hardwareGatewayId'),
+                                         'vlan': binding.findtext('vlan'), 'switchName': key[0], 'portName': key[1]})
+                    return 200, xml, ''
+                root = ElementTree.Element('list')
+                with self.lock:
+                    for entry in bindings:
+                        element = ElementTree.SubElement(root, 'hardwareGatewayBinding')
+                        for field in ('id', 'hardwareGatewayId', 'vlan', 'switchName', 'portName'):
+                            element.append(xml_text(field, entry[field]))
+                return 200, xml, ElementTree.tostring(root)
+            if len(parts) == 4 and parts[2] == 'hardwaregateways' and method == 'DELETE':
+                with self.lock:
+                    bindings = self.bindings[virtualwire['objectId']]
+                    self.bindings[virtualwire['objectId']] = [entry for entry in bindings if entry['id'] != parts[3]]
+                return 200, xml, ''
+        return 404, xml, ''
+
+class EapiStandIn(StandIn):
+    ''' eAPI JSON-RPC stand-in for a single switch.  Interface config pushed to
+        it is remembered so show running-config reflects earlier changes.
+
+    Args:
+        ssl_context (class): Server side SSL context
+        latency (float): Seconds added to every request
+        mlag_domain (str): The mlag domain ID reported by show mlag
+    '''
+
+    def __init__(self, ssl_context, latency=0, mlag_domain='pod1'):
+        super(EapiStandIn, self).__init__(ssl_context, latency)
+        self.mlag_domain = mlag_domain
+        self.interfaces = {}
+
+    def run_command(self, command, output_format, state):
+        if isinstance(command, dict):
+            command = command['cmd']
+        if command.startswith('show running-config interfaces '):
+            port = command[len('show running-config interfaces '):]
+            lines = self.interfaces.get(port, [])
+            output = 'interface ' + port + '\n' + ''.join('   ' + line + '\n' for line in lines)
+            return {'output': output} if output_format == 'text' else {'cmds': {}}
+        if command in ('show running-config', 'show running-config interfaces'):
+            output = ''.join('interface ' + port + '\n' + ''.join('   ' + line + '\n' for line in lines) + '!\n'
+                             for port, lines in sorted(self.interfaces.items()))
+            return {'output': output} if output_format == 'text' else {'cmds': {}}
+        if command == 'show mlag':
+            if output_format == 'text':
+                return {'output': 'MLAG Configuration:\ndomain-id                          :  ' + self.mlag_domain + '\n\nMLAG Status:\nstate                              :  Active\n'}
+            return {'domainId': self.mlag_domain, 'state': 'active'}
+        if command.startswith('interface '):
+            state['interface'] = command[len('interface '):]
+            self.interfaces.setdefault(state['interface'], [])
+        elif command.startswith('no interface '):
+            self.interfaces.pop(command[len('no interface '):], None)
+        elif command.startswith('default interface '):
+            self.interfaces[command[len('default interface '):]] = []
+        elif state.get('interface') and command not in ('exit', 'end', 'commit'):
+            self.interfaces[state['interface']].append(command)
+        return {'output': ''} if output_format == 'text' else {}
+
+    def handle(self, method, path, query, body, headers):
+        request = json.loads(body.decode('utf-8'))
+        params = request['params']
+        state = {}
+        with self.lock:
+            results = [self.run_command(command, params.get('format', 'json'), state) for command in params['cmds']]
+        return 200, 'application/json', json.dumps({'jsonrpc': '2.0', 'id': request.get('id'), 'result': results})
+
+class CvpStandIn(StandIn):
+    ''' CloudVision Portal stand-in serving the configlet, inventory and task
+        APIs cvprac calls on a 2018.2 cluster.
+
+    Args:
+        ssl_context (class): Server side SSL context
+        latency (float): Seconds added to every request
+        switches (list): Device hostnames in the inventory
+        task_duration (float): Seconds an executed task takes to complete
+    '''
+
+    def __init__(self, ssl_context, latency=0, switches=(), task_duration=0.2):
+        super(CvpStandIn, self).__init__(ssl_context, latency)
+        self.task_duration = task_duration
+        self.devices = dict((switch, '00:1c:73:00:00:' + '{:02x}'.format(index)) for index, switch in enumerate(switches))
+        self.configlets = {}
+        self.tasks = {}
+        self.user = None
+        self.pending_assign = None
+
+    def add_task(self, switch, user):
+        task_id = str(len(self.tasks) + 1)
+        self.tasks[task_id] = {'workOrderId': task_id, 'description': 'Configlet Assign: to Device ' + switch,
+                               'workOrderDetails': {'netElementHostName': switch}, 'createdBy': user,
+                               'workOrderUserDefinedStatus': 'Pending', 'executed': None}
+        return task_id
+
+    def task_view(self, task):
+        if task['executed'] is not None and time.time() - task['executed'] >= self.task_duration:
+            task['workOrderUserDefinedStatus'] = 'Completed'
+        return dict((key, value) for key, value in task.items() if key != 'executed')
+
+    def handle(self, method, path, query, body, headers):
+        reply = lambda data: (200, 'application/json', json.dumps(data))
+        path = path[len('/web'):] if path.startswith('/web') else path
+        data = json.loads(body.decode('utf-8')) if body else {}
+        with self.lock:
+            if path == '/login/authenticate.do':
+                self.user = data.get('userId')
+                return reply({'sessionId': 'standin-session', 'username': data.get('userId')})
+            if path == '/cvpInfo/getCvpInfo.do':
+                return reply({'version': '2018.2.5'})
+            if path == '/configlet/getConfigletByName.do':
+                configlet = self.configlets.get(query['name'])
+                if configlet is None:
+                    return reply({'errorCode': '132801', 'errorMessage': 'Entity does not exist'})
+                return reply(configlet)
+            if path == '/configlet/addConfiglet.do':
+                key = 'configlet_' + str(len(self.configlets) + 1)
+                self.configlets[data['name']] = {'name': data['name'], 'key': key, 'config': data['config']}
+                return reply({'data': key})
+            if path == '/configlet/updateConfiglet.do':
+                self.configlets[data['name']]['config'] = data['config']
+                switch = data['name'].rsplit(' ', 1)[0]
+                if switch in self.devices:
+                    self.add_task(switch, self.user)
+                return reply({'data': 'Configlet Updated'})
+            if path.startswith('/provisioning/') and 'searchTopology' in path:
+                switch = query.get('queryParam', '')
+                if switch not in self.devices:
+                    return reply({'netElementList': []})
+                return reply({'netElementList': [{'fqdn': switch, 'hostname': switch, 'systemMacAddress': self.devices[switch],
+                                                  'ipAddress': '127.0.0.1', 'deviceStatus': 'Registered',
+                                                  'parentContainerId': 'container_1', 'mlagEnabled': False}]})
+            if path == '/provisioning/getConfigletsByNetElementId.do':
+                return reply({'configletList': []})
+            if path == '/provisioning/addTempAction.do':
+                self.pending_assign = data['data'][0]['toName']
+                return reply({'data': 'success'})
+            if path == '/provisioning/v2/saveTopology.do':
+                task_id = self.add_task(self.pending_assign, self.user)
+                return reply({'data': {'taskIds': [task_id], 'status': 'success'}})
+            if path == '/task/getTasks.do':
+                tasks = [self.task_view(task) for task in self.tasks.values()]
+                return reply({'data': [task for task in tasks if task['workOrderUserDefinedStatus'] == query.get('queryparam')]})
+            if path == '/task/executeTask.do':
+                for task_id in data['data']:
+                    self.tasks[task_id]['executed'] = time.time()
+                    self.tasks[task_id]['workOrderUserDefinedStatus'] = 'In-Progress'
+                return reply({'data': 'success'})
+            if path == '/task/getTaskById.do':
+                return reply(self.task_view(self.tasks[query['taskId']]))
+            if path == '/task/getLogsById.do':
+                task = self.tasks[query['id']]
+                switch = task['workOrderDetails']['netElementHostName']
+                return reply({'data': [{'logDetails': 'Configlet push response: success', 'objectName': switch}]})
+        return reply({'data': []})
+
+class StandInFabric(object):
+    ''' One NSX Manager, one CVP cluster and an eAPI stand-in per switch
+
+    Args:
+        switches (list): Switch hostnames
+        latency (float): Seconds added to every request on every stand-in
+        virtualwires (list): (name, tenantId) pairs of logical switches that already exist
+        mlag_domain (str): Prefix of the mlag domain IDs.  Each pair of switches in order is one Mlag pair, pod1, pod2 and so on
+        fail_rate (float): Fraction of NSX and CVP requests answered with a 503
+        max_concurrency (int): Requests NSX and CVP serve at once before answering 429, 0 for no limit
+    '''
+
+    def __init__(self, switches, latency=0, virtualwires=(), mlag_domain='pod', fail_rate=0, max_concurrency=0):
+        self.directory = tempfile.mkdtemp(prefix='arista-nsx-bench-')
+        cert_file, key_file = make_certificate(self.directory)
+        ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        ssl_context.load_cert_chain(cert_file, key_file)
+        self.nsx = NsxStandIn(ssl_context, latency, virtualwires).start()
+        self.cvp = CvpStandIn(ssl_context, latency, switches).start()
+        for standin in (self.nsx, self.cvp):
+            standin.fail_rate = fail_rate
+            standin.max_concurrency = max_concurrency
+        self.switches = dict((switch, EapiStandIn(ssl_context, latency, mlag_domain + str(index // 2 + 1)).start())
+                             for index, switch in enumerate(switches))
+
+    @property
+    def request_counts(self):
+        return {'nsx': self.nsx.requests, 'cvp': self.cvp.requests,
+                'eapi': sum(switch.requests for switch in self.switches.values()),
+                'throttled': self.nsx.throttled + self.cvp.throttled}
+
+    def reset_counts(self):
+        ''' Zero the request counts of every stand-in, after a setup run '''
+        for standin in [self.nsx, self.cvp] + list(self.switches.values()):
+            with standin.lock:
+                standin.requests = 0
+                standin.throttled = 0
+
+    def data_center(self):
+        ''' Build the data_center section of an input file pointing at the stand-ins '''
+        return {'nsx_manager': self.nsx.address, 'switches': list(self.switches.keys()),
+                'switch_addresses': dict((name, switch.address) for name, switch in self.switches.items()),
+                'cvps': ['127.0.0.1'], 'cvp_port': self.cvp.port}
+
+    def stop(self):
+        for standin in [self.nsx, self.cvp] + list(self.switches.values()):
+            standin.stop()
+        for name in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, name))
+        os.rmdir(self.directory)
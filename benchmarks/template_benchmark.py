@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+
+# BSD 3-Clause License
+#
+# Copyright (c) 2018, Arista Networks EOS+
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name Arista nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+'''
+Micro-benchmark of the switchport config templates against the
+if/elif string building the eAPI and CVP scripts used before.
+
+Builds a batch of ports that cycles through every mode, Ethernet and
+Port-channel, Mlag and not, and renders it both ways: as eAPI commands
+and as configlet interface blocks.  The output of both is checked to be
+identical first.  Each target is timed from the input file dict, and again
+from records that were already read.  For each case it reports microseconds
+and bytes allocated per port.
+
+    python benchmarks/template_benchmark.py --ports 1 100 1000 10000
+
+Created by Dimitri Capetz - dcapetz@arista.com
+'''
+
+# Import the templates under test
+# Import argparse for the benchmark options
+# Import os and sys for finding the repo modules
+# Import timeit and tracemalloc for time and allocation per port
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from switchport_config import configlet_blocks, eapi_commands, switch_port_records
+import argparse
+import timeit
+import tracemalloc
+
+def make_ports(count):
+    ''' A port_configs entry of count ports covering every template '''
+    switch_ports = {}
+    modes = ('trunk', 'trunk native', 'access')
+    for index in range(count):
+        mode = modes[index % 3]
+        if index % 4 == 3:
+            switch_ports['Port-channel' + str(index + 1)] = {'description': 'server ' + str(index), 'mode': mode, 'speed': '10gfull',
+                                                           'local_members': ['Ethernet' + str(index + 1) + '/1'], 'is_mlag': index % 8 == 3}
+        else:
+            switch_ports['Ethernet' + str(index + 1)] = {'description': 'server ' + str(index), 'mode': mode, 'speed': '10gfull'}
+    return switch_ports
+
+def old_eapi_commands(switch_ports, vlan_id):
+    # The command list switchport_config_update used to build
+    commands = []
+    for port, config in switch_ports.items():
+        if port.startswith('Port'):
+            port_channel_id = (port.split('l'))[1]
+            for index in range(len(config['local_members'])):
+                commands.extend(
+                    [
+                        'interface ' + config['local_members'][index],
+                        'description ' + config['description'],
+                        'channel-group ' + port_channel_id + ' mode active',
+                        'speed forced ' + config['speed'],
+                        'no shutdown'
+                    ]
+                )
+        commands.extend(['interface ' + port, 'description ' + config['description']])
+        if config['mode'] == 'trunk':
+            commands.extend(['switchport trunk allowed vlan ' + vlan_id, 'switchport mode trunk'])
+        elif config['mode'] == 'trunk native':
+            commands.extend(['switchport trunk native vlan ' + vlan_id, 'switchport mode trunk'])
+        elif config['mode'] == 'access':
+            commands.extend(['switchport access vlan ' + vlan_id, 'switchport mode access'])
+        commands.append('no shutdown')
+        if port.startswith('Port'):
+            if config['is_mlag'] == True:
+                commands.append('mlag ' + port_channel_id)
+        else:
+            commands.append('speed forced ' + config['speed'])
+    return commands
+
+def old_configlet_blocks(switch_ports, vlan_id):
+    # The configlet blocks switch_configlet_plan used to build
+    switch_eth_config_to_add = []
+    switch_pc_config_to_add = []
+    for port, config in switch_ports.items():
+        if port.startswith('Port'):
+            port_channel_id = (port.split('l'))[1]
+            for index in range(len(config['local_members'])):
+                switch_eth_config_to_add.extend(['interface ' + config['local_members'][index] + '\n   description ' + config['description'] + '\n   channel-group ' + port_channel_id + ' mode active\n   speed forced ' + config['speed'] + '\n   no shutdown'])
+            if config['mode'] == 'trunk':
+                if config['is_mlag'] == True:
+                    switch_pc_config_to_add.extend(['interface ' + port + '\n   description ' + config['description'] + '\n   switchport trunk allowed vlan ' + vlan_id + '\n   switchport mode trunk' + '\n   mlag ' + port_channel_id + '\n   no shutdown'])
+                else:
+                    switch_pc_config_to_add.extend(['interface ' + port + '\n   description ' + config['description'] + '\n   switchport trunk allowed vlan ' + vlan_id + '\n   switchport mode trunk' + '\n   no shutdown'])
+            elif config['mode'] == 'trunk native':
+                if config['is_mlag'] == True:
+                    switch_pc_config_to_add.extend(['interface ' + port + '\n   description ' + config['description'] + '\n   switchport trunk native vlan ' + vlan_id + '\n   switchport mode trunk' + '\n   mlag ' + port_channel_id + '\n   no shutdown'])
+                else:
+                    switch_pc_config_to_add.extend(['interface ' + port + '\n   description ' + config['description'] + '\n   switchport trunk native vlan ' + vlan_id + '\n   switchport mode trunk' + '\n   no shutdown'])
+            elif config['mode'] == 'access':
+                if config['is_mlag'] == True:
+                    switch_pc_config_to_add.extend(['interface ' + port + '\n   description ' + config['description'] + '\n   switchport access vlan ' + vlan_id + '\n   switchport mode access' + '\n   mlag ' + port_channel_id + '\n   no shutdown'])
+                else:
+                    switch_pc_config_to_add.extend(['interface ' + port + '\n   description ' + config['description'] + '\n   switchport access vlan ' + vlan_id + '\n   switchport mode access' + '\n   no shutdown'])
+        else:
+            if config['mode'] == 'trunk':
+                switch_eth_config_to_add.extend(['interface ' + port + '\n   description ' + config['description'] + '\n   speed forced ' +     config['speed'] + '\n   switchport trunk allowed vlan ' + vlan_id + '\n   switchport mode trunk' + '\n   no shutdown'])
+            elif config['mode'] == 'trunk native':
+                switch_eth_config_to_add.extend(['interface ' + port + '\n   description ' + config['description'] + '\n   speed forced ' +     config['speed'] + '\n   switchport trunk native vlan ' + vlan_id + '\n   switchport mode trunk' + '\n   no shutdown'])
+            elif config['mode'] == 'access':
+                switch_eth_config_to_add.extend(['interface ' + port + '\n   description ' + config['description'] + '\n   speed forced ' +     config['speed'] + '\n   switchport access vlan ' + vlan_id + '\n   switchport mode access' + '\n   no shutdown'])
+    return switch_pc_config_to_add, switch_eth_config_to_add
+
+def measure(function, objects, seconds):
+    ''' Time and allocation of one call, divided by the objects it handles
+
+    Args:
+        function (function): The call to measure
+        objects (int): Objects handled by one call
+        seconds (float): Roughly how long to spend timing it
+
+    Returns:
+        microseconds (float), allocated (float): Per object, best of 5 for time and peak traced bytes for allocation
+    '''
+    number = max(1, int(seconds / 5 / max(timeit.timeit(function, number=1), 1e-6)))
+    best = min(timeit.repeat(function, number=number, repeat=5)) / number
+    tracemalloc.start()
+    function()
+    allocated = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best * 1e6 / objects, allocated / float(objects)
+
+def print_report(rows):
+    header = ('Case', 'Ports', 'Old us/port', 'Template us/port', 'Speedup', 'Old B/port', 'Template B/port')
+    widths = [max(len(row[column]) for row in [header] + rows) for column in range(len(header))]
+    for row in [header] + rows:
+        print('  '.join(row[column].ljust(widths[column]) for column in range(len(header))).rstrip())
+
+parser = argparse.ArgumentParser(description='Benchmark the switchport templates against the old string building')
+parser.add_argument('--ports', dest='ports', nargs='+', type=int, default=[1, 100, 1000, 10000], help='Ports per batch (default 1 100 1000 10000)')
+parser.add_argument('--seconds', dest='seconds', default=0.5, type=float, help='Rough time spent timing each case (default 0.5)')
+options = parser.parse_args()
+
+rows = []
+for count in options.ports:
+    switch_ports = make_ports(count)
+    assert old_eapi_commands(switch_ports, '501') == eapi_commands(switch_port_records(switch_ports), '501')
+    old_blocks = old_configlet_blocks(switch_ports, '501')
+    assert old_blocks == configlet_blocks(switch_port_records(switch_ports), '501')
+    ports = switch_port_records(switch_ports)
+    # Reading the input into records is counted in the first two cases and left out of the render cases.
+    cases = [
+        ('eapi commands', lambda: old_eapi_commands(switch_ports, '501'), lambda: eapi_commands(switch_port_records(switch_ports), '501')),
+        ('configlet blocks', lambda: old_configlet_blocks(switch_ports, '501'), lambda: configlet_blocks(switch_port_records(switch_ports), '501')),
+        ('eapi render', lambda: old_eapi_commands(switch_ports, '501'), lambda: eapi_commands(ports, '501')),
+        ('configlet render', lambda: old_configlet_blocks(switch_ports, '501'), lambda: configlet_blocks(ports, '501')),
+    ]
+    for name, old, template in cases:
+        old_time, old_bytes = measure(old, count, options.seconds)
+        template_time, template_bytes = measure(template, count, options.seconds)
+        rows.append((name, str(count), '{:.2f}'.format(old_time), '{:.2f}'.format(template_time), '{:.1f}x'.format(old_time / template_time),
+                     '{:.0f}'.format(old_bytes), '{:.0f}'.format(template_bytes)))
+print_report(rows)
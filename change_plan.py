@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+
+# BSD 3-Clause License
+#
+# Copyright (c) 2018, Arista Networks EOS+
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name Arista nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+'''
+Change plans for the scripts in this repo.
+
+Each script reads everything it needs up front (NSX bindings and logical
+switches, switch running-configs or CVP configlets, mlag domains) and builds
+a ChangePlan before anything is written.  The plan is printed for review and
+nothing is changed unless the script is run with --apply.  A conflict found
+while planning stops the run with every switch and NSX still untouched.
+With --reconcile nothing already in place counts as a conflict.  The plan
+holds only the difference from the input file, so a fabric that already
+matches it plans no changes at all.
+
+Created by Dimitri Capetz - dcapetz@arista.com
+'''
+
+# Import difflib for configlet diffs
+import difflib
+
+class ConfigletChange(object):
+    ''' A planned update to, or creation of, a switch's configlet '''
+    __slots__ = ('switch', 'name', 'key', 'old_config', 'new_config', 'device')
+
+    def __init__(self, switch, name, key, old_config, new_config, device=None):
+        self.switch = switch
+        self.name = name
+        self.key = key
+        self.old_config = old_config
+        self.new_config = new_config
+        self.device = device
+
+    @property
+    def created(self):
+        return self.key is None
+
+    def diff(self):
+        ''' Unified diff of the configlet before and after the change
+
+        Returns:
+            diff (list): The diff lines
+        '''
+        return list(difflib.unified_diff(self.old_config.splitlines(), self.new_config.splitlines(),
+                                         self.name + ' (current)', self.name + ' (planned)', lineterm=''))
+
+class ChangePlan(object):
+    ''' Every change a run will make, gathered before the first write '''
+
+    def __init__(self):
+        self.logical_switches = []
+        self.switch_commands = []
+        self.configlets = []
+        self.binding_executors = []
+        self.unbinding_executors = []
+        self.deleted_logical_switches = []
+
+    def add_logical_switch(self, ls_name):
+        self.logical_switches.append(ls_name)
+
+    def add_switch_commands(self, switch, commands):
+        self.switch_commands.append((switch, commands))
+
+    def add_configlet(self, configlet_change):
+        self.configlets.append(configlet_change)
+
+    def add_bindings(self, binding_executor):
+        self.binding_executors.append(binding_executor)
+
+    def add_unbindings(self, unbind_executor):
+        self.unbinding_executors.append(unbind_executor)
+
+    def delete_logical_switch(self, ls_name):
+        self.deleted_logical_switches.append(ls_name)
+
+    def empty(self):
+        ''' Check if the run has nothing to change '''
+        if self.logical_switches or self.switch_commands or self.configlets or self.deleted_logical_switches:
+            return False
+        return not any(result.status == 'planned' for binding_executor in self.binding_executors + self.unbinding_executors
+                       for result in binding_executor.results())
+
+    def print_plan(self):
+        ''' Print every planned change in the order it will be applied '''
+        if self.empty():
+            print('Nothing to change.  Everything already matches the input file.')
+            return
+        print('Planned changes:')
+        for unbind_executor in self.unbinding_executors:
+            unbind_executor.print_summary('plan')
+        for ls_name in self.logical_switches:
+            print('Create NSX logical switch ' + ls_name)
+        for switch, commands in self.switch_commands:
+            print('Configure ' + switch + ' via eAPI:')
+            for command in commands:
+                if command.startswith('interface '):
+                    print('  ' + command)
+                else:
+                    print('     ' + command)
+        for configlet_change in self.configlets:
+            if configlet_change.created:
+                print('Create ' + configlet_change.name + ' configlet and apply to ' + configlet_change.switch + ':')
+            else:
+                print('Update ' + configlet_change.name + ' configlet:')
+            for line in configlet_change.diff():
+                print('  ' + line)
+        for binding_executor in self.binding_executors:
+            binding_executor.print_summary('plan')
+        for ls_name in self.deleted_logical_switches:
+            print('Delete NSX logical switch ' + ls_name)
+
+def add_plan_arguments(parser):
+    ''' Add the --apply and --reconcile arguments to a script's parser
+
+    Args:
+        parser (class): The argparse parser of the calling script
+    '''
+    plan_arg = parser.add_argument_group('Plan Arguments')
+    plan_arg.add_argument('--apply', dest='apply', action='store_true', help='Make the planned changes.  Without it the plan is only printed')
+    plan_arg.add_argument('--reconcile', dest='reconcile', action='store_true',
+                          help='Treat the input file as the desired state.  Existing config and bindings are compared with it and only the difference is planned')
+
+def review_plan(plan, apply):
+    ''' Print the plan and say whether the run should go on to change anything
+
+    Args:
+        plan (class): The ChangePlan for the run
+        apply (bool): True if the script was run with --apply
+
+    Returns:
+        apply (bool): True if the plan should be applied
+    '''
+    plan.print_plan()
+    if not apply:
+        print('Dry run only.  No changes were made.  Re-run with --apply to make these changes.')
+    return apply
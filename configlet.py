@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+
+# BSD 3-Clause License
+#
+# Copyright (c) 2018, Arista Networks EOS+
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name Arista nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+'''
+Parsed model of a "<switch> Switchports" configlet.
+
+The configlet is a list of interface blocks separated by blank lines.  Each
+block is parsed once into its interface name, its text and a natural sort
+key, and indexed by name.  Duplicate checks are exact name lookups instead of
+substring searches over the whole configlet (which matched Ethernet1 inside
+Ethernet10), and new blocks are merged into the already sorted list without
+re-running a regex over every block.  Blocks that aren't touched are written
+back out exactly as they were read.  In reconcile mode outdated() compares
+the blocks from the input file with the ones already there, line by line.
+
+Created by Dimitri Capetz - dcapetz@arista.com
+'''
+
+# Import the reconcile helpers for comparing interface blocks
+# Import re for splitting interface names into a natural sort key
+from reconcile import config_lines, missing_lines
+import re
+
+def interface_sort_key(name):
+    ''' Natural sort key for an interface name so Ethernet2 sorts before Ethernet10
+
+    Args:
+        name (str): The interface name, like Ethernet49/1 or Port-channel10
+
+    Returns:
+        sort_key (tuple): The numbers in the name as integers, in order
+    '''
+    return tuple(int(number) for number in re.findall('[0-9]+', name))
+
+class InterfaceBlock(object):
+    ''' One interface section of a configlet '''
+    __slots__ = ('name', 'text', 'sort_key')
+
+    def __init__(self, text):
+        self.text = text
+        self.name = text.split('\n', 1)[0][len('interface '):].strip()
+        self.sort_key = interface_sort_key(self.name)
+
+    @property
+    def is_port_channel(self):
+        return self.name.startswith('Port')
+
+class SwitchportConfiglet(object):
+    ''' Interface blocks of a switchports configlet, indexed by interface name.
+        Port-channels are kept ahead of Ethernet interfaces, each sorted by
+        interface number.  Sections that aren't interface blocks are kept in
+        their original order and written after the interfaces.
+
+    Args:
+        config (str): The existing configlet text, empty for a new configlet
+    '''
+
+    def __init__(self, config=''):
+        self.port_channels = []
+        self.ethernets = []
+        self.other = []
+        self.index = {}
+        if config:
+            for text in config.split('\n\n'):
+                if text.startswith('interface Eth') or text.startswith('interface Port'):
+                    block = InterfaceBlock(text)
+                    self.blocks_for(block).append(block)
+                    self.index[block.name] = block
+                elif text.strip():
+                    self.other.append(text)
+            # Existing configlets were written sorted, so this is a single linear pass in practice.
+            self.port_channels.sort(key=lambda block: block.sort_key)
+            self.ethernets.sort(key=lambda block: block.sort_key)
+
+    def blocks_for(self, block):
+        if block.is_port_channel:
+            return self.port_channels
+        return self.ethernets
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def conflicts(self, names):
+        ''' Find which of the given interfaces already have a block in the configlet
+
+        Args:
+            names (list): Interface names about to be added
+
+        Returns:
+            conflicts (list): The names that already exist, in the order given
+        '''
+        return [name for name in names if name in self.index]
+
+    def outdated(self, texts):
+        ''' Find which interface blocks are missing from the configlet or are
+            missing any of their lines.  Lines the configlet has on top of the
+            input file don't count as a difference.
+
+        Args:
+            texts (list): Config text of each interface block from the input file
+
+        Returns:
+            outdated (list): The texts that need to be merged, in the order given
+        '''
+        outdated = []
+        for text in texts:
+            existing = self.index.get(InterfaceBlock(text).name)
+            if existing is None or missing_lines(config_lines(text), config_lines(existing.text), eos_defaults=False):
+                outdated.append(text)
+        return outdated
+
+    def remove(self, names):
+        ''' Take interface blocks out of the configlet
+
+        Args:
+            names (list): Interface names to remove
+
+        Returns:
+            removed (list): The names that had a block, in the order given
+        '''
+        removed = []
+        for name in names:
+            block = self.index.pop(name, None)
+            if block is not None:
+                self.blocks_for(block).remove(block)
+                removed.append(name)
+        return removed
+
+    def merge(self, texts):
+        ''' Add new interface blocks in sorted position.  Callers check
+            conflicts() first, an existing block with the same name is replaced.
+
+        Args:
+            texts (list): Config text of each new interface block
+        '''
+        new_port_channels = []
+        new_ethernets = []
+        for text in texts:
+            block = InterfaceBlock(text)
+            existing = self.index.get(block.name)
+            if existing is not None:
+                self.blocks_for(existing).remove(existing)
+            self.index[block.name] = block
+            if block.is_port_channel:
+                new_port_channels.append(block)
+            else:
+                new_ethernets.append(block)
+        # Sorting the short new list and merging is O(n log n) at worst.
+        # Timsort finds the two sorted runs so the merge itself is linear.
+        new_port_channels.sort(key=lambda block: block.sort_key)
+        new_ethernets.sort(key=lambda block: block.sort_key)
+        self.port_channels = sorted(self.port_channels + new_port_channels, key=lambda block: block.sort_key)
+        self.ethernets = sorted(self.ethernets + new_ethernets, key=lambda block: block.sort_key)
+
+    def render(self):
+        ''' Build the configlet text, Port-channels first, then Ethernets, then
+            any non-interface sections of the existing configlet
+
+        Returns:
+            config (str): The configlet text to send to CVP
+        '''
+        texts = [block.text for block in self.port_channels]
+        texts.extend(block.text for block in self.ethernets)
+        texts.extend(self.other)
+        return '\n\n'.join(texts)
@@ -37,197 +37,255 @@ and as such requires you to have admin access there.  I'm sure there's some
 RBAC stuff documented by VMware for the minimum necessary access, but I did
 my testing with the admin account itself.
 
+Nothing is created unless the script is run with --apply.  Without it, the
+planned logical switches and bindings are printed for review.  With
+--reconcile a logical switch that already exists is kept, and only the
+bindings it is missing are planned.
+
 Please note that all SSL verification is disabled.  If you have signed certs
-in place for NSX Manager, you can remove the urllib3 section and verify option
-in the requests calls.
+in place for NSX Manager, you can set verify=True where the NsxClient is
+built in nsx_client.py.
 
 Created by Dimitri Capetz - dcapetz@arista.com
 '''
 
-# Import requests for API Calls to NSX Manager
-# Import xmltodict and dicttoxml for working with XML
-# Import pyEAPI for retrieval of switch attributes
-# Import getpass for masked password prompt
+# Import the shared NSX client for pooled API Calls to NSX Manager
+# Import the paged logical switch lookup
+# Import the NSX XML codec for reading responses and building request bodies
+# Import the binding index and executor for concurrent hardware bindings
+# Import the eAPI helpers for cached Mlag domain lookups
+# Import the streaming port file reader for large inventories
+# Import the change plan for reviewing changes before they are made
+# Import the run metrics for per phase timings
+# Import the retry and circuit breaker settings
+# Import the per data center request budgets
+# Import the inventory cache for NSX and fabric state kept between runs
+# Import the run journal for resuming interrupted runs
+# Import the credential prompts and the multi data center runner
 # Import argparse for pulling in file input via command line
 # Import json for working with json objects
+# Import concurrent.futures for bulk logical switch creation
 # Import sys for various error handling
-import requests
-import xmltodict
-from dicttoxml import dicttoxml
-import pyeapi
-import getpass
+from nsx_client import NsxUnavailable, add_nsx_arguments, busy_retry_after, nsx_client_from_args
+from nsx_virtualwires import VirtualWireIndex
+from nsx_xml import VirtualWire, first_object_id, parse_virtualwire, virtualwire_create_spec
+from nsx_bindings import BindingIndex, HardwareBindingExecutor, add_binding_arguments
+from eapi_client import MlagDomainCache, add_mlag_cache_arguments, eapi_connect
+from metrics import add_metrics_arguments, metrics_from_args
+from rate_limit import EndpointLimits
+from inventory import add_inventory_arguments, inventory_from_args
+from journal import add_journal_arguments, journal_from_args
+from credentials import NSX_CREDENTIALS, SWITCH_CREDENTIALS, prompt_credential
+from sites import SiteReport, add_site_arguments, run_sites, select_data_center
+from resilience import add_retry_arguments, breaker_from_args, retry_policy_from_args
+from port_inventory import add_port_arguments, has_mlag_ports, port_configs_from_args
+from change_plan import ChangePlan, add_plan_arguments, review_plan
 import argparse
 import json
+from concurrent.futures import ThreadPoolExecutor
 import sys
 
-#Disable Cert Warnings for Test Environment
-import urllib3
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+class LogicalSwitchResult(object):
+    ''' Outcome of creating and binding one tenant/zone logical switch '''
+    __slots__ = ('tenant_name', 'zone_name', 'ls_name', 'ls_id', 'vni', 'vlan', 'status', 'bindings')
 
-def nsx_get(uri):
-    ''' Make generic HTTP GET to NSX Manager
-        
-        Args:
-            uri (str): The uri to call
-        
-        Returns:
-            response (dict): The response body of the HTTP GET
-    '''
-    nsx_url = 'https://' + nsx_manager + '/api/2.0/vdn/' # All calls will be to this base URL
-    try:
-        get_response = requests.get(nsx_url + uri, auth=(nsx_username, nsx_password), verify=False, timeout=5)
-        if get_response.status_code == 403:
-            print('Unable to login to NSX Manager. Verify username and password.')
-            sys.exit()
-        if get_response.status_code == 404:
-            print('URI not found. Verify NSX Manager IP and JSON input file. If NSX was recently upgraded, verify any API changes in release notes.')
-            sys.exit()
-        else:
-            get_dict = xmltodict.parse(get_response.content, dict_constructor=dict)
-            return get_dict
-    except requests.ConnectionError:
-        print('Failed to connect to NSX Manager. Verify reachability.')
-        sys.exit()
+    def __init__(self, tenant_name, zone_name, ls_name):
+        self.tenant_name = tenant_name
+        self.zone_name = zone_name
+        self.ls_name = ls_name
+        self.ls_id = ''
+        self.vni = ''
+        self.vlan = ''
+        self.status = 'pending'
+        self.bindings = []
 
-def nsx_post(uri, body_dict, xml_root):
-    ''' Make generic HTTP POST to NSX Manager
-        
-        Args:
-            uri (str): The uri to call
-            body_dict (dict): A dictionary containing the body of the request to be sent
-            xml_root (str): The custom XML Root need to place the body in the correct structure
-        
-        Returns:
-            response (str): The response of the HTTP POST
-    '''
-    nsx_url = 'https://' + nsx_manager + '/api/2.0/vdn/' # All calls will be to this base URL
-    headers = {'Content-Type': 'application/xml'} # Headers required for HTTP POSTs
-    try:
-        post_xml = dicttoxml(body_dict, custom_root=xml_root, attr_type=False)
-        post_response = requests.post(nsx_url + uri, auth=(nsx_username, nsx_password), headers=headers, data=post_xml, verify=False, timeout=5)
-        return post_response
-    except requests.ConnectionError:
-        print('Failed to connect to NSX Manager. Verify reachability.')
-        sys.exit()
+def post_logical_switch(ls_name, ls_body):
+    ''' POST a new logical switch, retrying with backoff when NSX Manager is busy
+        or unreachable.  NSX allows duplicate names, so if an attempt may have
+        landed without an answer, NSX is searched by name before trying again.
 
-def eapi_connect(switch):
-    ''' Connect to eAPI interface of Arista Switch
-    
     Args:
-        switch (str): The IP address or FQDN of the Arista switch
-    
+        ls_name (str): The name of the new logical switch
+        ls_body (bytes): The body of the create POST
+
     Returns:
-        switch_node (class): The connected node of the function call that can be used for show or config commands.
+        ls_id (str): The objectId of the logical switch, None if it couldn't be created
     '''
-    switch_conn = pyeapi.client.connect(transport='https', host=switch, username=switch_username, password=switch_password)
-    switch_node = pyeapi.client.Node(switch_conn)
-    return switch_node
+    policy = nsx.retry_policy
+    retry_after = None
+    maybe_landed = False
+    for attempt in range(policy.retries + 1):
+        if attempt:
+            policy.sleep(attempt, retry_after)
+            if maybe_landed:
+                virtualwire = VirtualWireIndex(nsx, 'scopes/' + tz_scope_id + '/virtualwires', page_size=args.nsx_page_size).find(ls_name)
+                if virtualwire is not None:
+                    return virtualwire.object_id
+        try:
+            ls_response = nsx.post_once('scopes/' + tz_scope_id + '/virtualwires', ls_body)
+        except NsxUnavailable:
+            maybe_landed = True
+            retry_after = None
+            continue
+        if ls_response.status_code == 201:
+            return ls_response.content.decode('utf-8')
+        retry_after = busy_retry_after(ls_response)
+        if retry_after is None:
+            return None
+    return None
+
+def create_logical_switch(tenant_name, zone_name):
+    ''' Create one logical switch for a tenant/zone pair and bind it to the
+        pre-configured switchports.  Scope ID, hardware gateway ID and the
+        existing name index are shared by every call in the run.
 
-def eapi_mlag_config_check(switch):
-    ''' Connect and check mlag domain ID for use with NSX bindings
-    
     Args:
-        switch (str): The IP address or FQDN of the Arista switch
-    
+        tenant_name (str): The tenant the logical switch belongs to
+        zone_name (str): The zone of the tenant
+
     Returns:
-        mlag_domain (str): The mlag domain ID of the switch
+        ls_result (class): A LogicalSwitchResult for the consolidated report
     '''
-    switch_node = eapi_connect(switch)
-    # Check mlag configuration and parse out mlag domain ID.
-    show_mlag_output = switch_node.enable('show mlag')
-    mlag_domain = show_mlag_output[0]['result']['domainId']
-    return mlag_domain
+    ls_name = 'vls' + data_center + tenant_name + zone_name
+    ls_result = LogicalSwitchResult(tenant_name, zone_name, ls_name)
+    created = journal.get('logical_switch', ls_name)
+    existing = existing_switches.get(ls_name)
+    binding_executor = None
+    if existing is not None:
+        # Reconcile mode found it in NSX already.  Send only the bindings planned for it.
+        print('Logical Switch ' + ls_name + ' already exists in NSX.')
+        ls_id = existing.object_id
+        ls_vni_id = existing.vdn_id
+        binding_executor = planned_executors[ls_name]
+        binding_index = binding_executor.binding_index
+    elif created is not None:
+        # An earlier attempt of this run created it.  Pick up its bindings from NSX and carry on.
+        print('Logical Switch ' + ls_name + ' was created by an earlier attempt of this run.')
+        ls_id = created['ls_id']
+        ls_vni_id = created['vni']
+        binding_index = BindingIndex(nsx, ls_id, inventory=inventory)
+    else:
+        # POST to create new Logical Switch
+        # Fill in the Request Body and feed into POST Function
+        ls_id = post_logical_switch(ls_name, virtualwire_create_spec(ls_name, tenant_name))
+        if ls_id is not None:
+            print('Logical Switch ' + ls_name + ' created.')
+        else:
+            print('Error Creating Logical Switch ' + ls_name + '.')
+            ls_result.status = 'create failed'
+            return ls_result
+        # GET the details of the new Logical Switch to pull out the VNI ID and map to a VLAN ID
+        virtualwire = parse_virtualwire(nsx.get('virtualwires/' + ls_id))
+        ls_vni_id = virtualwire.vdn_id
+        journal.record('logical_switch', ls_name, ls_id=ls_id, vni=ls_vni_id)
+        virtualwires.remember(VirtualWire(ls_name, ls_id, ls_vni_id))
+        # A logical switch created in this run has no bindings yet, so there is nothing to GET
+        binding_index = BindingIndex(nsx, ls_id, bindings={}, inventory=inventory)
+    vlan_id = ls_vni_id[0] + ls_vni_id[-2:]
+    ls_result.ls_id = ls_id
+    ls_result.vni = ls_vni_id
+    ls_result.vlan = vlan_id
+    # Queue bindings for every switch and send them to NSX concurrently
+    if binding_executor is None:
+        binding_executor = HardwareBindingExecutor(nsx, ls_id, ls_name, hw_id, binding_index, mlag_lookup=mlag_cache.lookup, max_workers=args.binding_workers,
+                                                   journal=journal, reconcile=args.reconcile)
+        for index in range(len(switches)):
+            binding_executor.add_switch(switches[index], switch_ports[(switches[index])], vlan_id)
+    ls_result.bindings = binding_executor.run()
+    binding_executor.print_summary()
+    binding_index.save()
+    if binding_executor.failures():
+        ls_result.status = 'binding failed'
+    elif existing is not None:
+        ls_result.status = 'existing'
+    else:
+        ls_result.status = 'created'
+    return ls_result
+
+def connect_switch(switch):
+    ''' Connect to a switch over eAPI with the credentials, metrics, retry settings and request budget of the run
 
-def nsx_binding_check(switch, port):
-    ''' Checks existing NSX hardware bindings for any conflict
-    
     Args:
-        switch (str): The name of the Arista switch or mlag_domain
-        port (str): The name of the port to check for
+        switch (str): The IP address or FQDN of the Arista switch
+
+    Returns:
+        switch_node (class): The connected pyeapi node
     '''
-    bind_check_dict = nsx_get('virtualwires/' + ls_id + '/hardwaregateways')
-    if bool(bind_check_dict['list']) == True:
-        try:
-            for i in range(len(bind_check_dict['list']['hardwareGatewayBinding'])):
-                if bind_check_dict['list']['hardwareGatewayBinding'][i]['switchName'] == switch:
-                    if bind_check_dict['list']['hardwareGatewayBinding'][i]['portName'] == port:
-                        print(switch + ' ' + port + ' was already bound to ' + ls_name)
-                        print('This is expected if the port is the second Mlag port in a switch pair')
-                        print('If it is not, please verify input file and switch config')
-        except KeyError:
-            if bind_check_dict['list']['hardwareGatewayBinding']['switchName'] == switch:
-                if bind_check_dict['list']['hardwareGatewayBinding']['portName'] == port:
-                    print(switch + ' ' + port + ' was already bound to ' + ls_name)
-                    print('This is expected if the port is the second Mlag port in a switch pair')
-                    print('If it is not, please verify input file and switch config')
-    
+    return eapi_connect(switch, switch_username, switch_password, switch_addresses.get(switch), metrics=metrics,
+                        retry_policy=retry_policy_from_args(args), breaker=breaker_from_args(args, 'switch ' + switch),
+                        limiter=limits.switch(switch))
+
+def print_results_table(ls_results):
+    ''' Print one consolidated table of every logical switch in the run
 
-def nsx_hardware_binding(switch, switch_ports, vlan):
-    ''' Generate body and POST to NSX Manager if ports are present
-    
     Args:
-        switch (str): The name of the switch to perform bindings for
-        switch_ports (dict): A dictionary containing configuration attributes
-        vlan (str): The vlan ID to bind the logical switch to
+        ls_results (list): LogicalSwitchResult objects in input order
     '''
-    # Loop to Generate Request Body from Dictionary for all switch bindings and POST
-    # So far as I can tell, these can only be done one switch per request and must be looped through.
-    hw_bind_uri = 'virtualwires/' + ls_id + '/hardwaregateways'
-    for port, config in switch_ports.items():
-        # Check if port to bind is an MLAG interface.  If yes, rewrite switch and port variables to match what NSX expects.
-        if port.startswith('Port'):
-            if config['is_mlag'] == True:
-                mlag_port = 'Mlag' + (port.split('l'))[1]
-                mlag_switch = 'mlag-' + eapi_mlag_config_check(switch)
-        # Check existing hardware bindings to see if there is a duplicate. Notify user but continue.
-        if port.startswith('Port'):
-            if config['is_mlag'] == True:
-                nsx_binding_check(mlag_switch, mlag_port)
-            else:
-                nsx_binding_check(switch, port)
-        else:
-            nsx_binding_check(switch, port)
-        # Set vlan ID for binding and apply
-        if config['mode'] == 'access':
-            port_vlan_id = '0'
-        else:
-            port_vlan_id = vlan
-        # Perform harware bindings. Check if mlag is present to ensure names are correct when sent to NSX.
-        if port.startswith('Port'):
-            if config['is_mlag'] == True:
-                hw_bind_dict = {'hardwareGatewayId': hw_id, 'vlan': port_vlan_id, 'switchName': mlag_switch, 'portName': mlag_port}
-                hw_bind_response = nsx_post(hw_bind_uri, hw_bind_dict, 'hardwareGatewayBinding')
-            else:
-                hw_bind_dict = {'hardwareGatewayId': hw_id, 'vlan': port_vlan_id, 'switchName': switch, 'portName': port}
-                hw_bind_response = nsx_post(hw_bind_uri, hw_bind_dict, 'hardwareGatewayBinding')
-        else:
-            hw_bind_dict = {'hardwareGatewayId': hw_id, 'vlan': port_vlan_id, 'switchName': switch, 'portName': port}
-            hw_bind_response = nsx_post(hw_bind_uri, hw_bind_dict, 'hardwareGatewayBinding')
-        if hw_bind_response.status_code == 200:
-            print('NSX hardware binding complete for ' + switch + ' ' + port)
-        else:
-            print('Error binding NSX logical switch to ' + switch + ' ' + port)
+    header = ('Logical Switch', 'Object ID', 'VNI', 'VLAN', 'Bound', 'Skipped', 'Failed', 'Status')
+    rows = []
+    for ls_result in ls_results:
+        statuses = [binding.status for binding in ls_result.bindings]
+        rows.append((ls_result.ls_name, ls_result.ls_id, ls_result.vni, ls_result.vlan, str(statuses.count('bound')),
+                     str(statuses.count('skipped')), str(statuses.count('failed')), ls_result.status))
+    widths = [max(len(row[column]) for row in [header] + rows) for column in range(len(header))]
+    for row in [header] + rows:
+        print('  '.join(row[column].ljust(widths[column]) for column in range(len(header))).rstrip())
 
 # Pull in JSON file from command line argument
 parser = argparse.ArgumentParser(description='Create NSX logical switch and bind to pre-configured switchports')
 required_arg = parser.add_argument_group('Required Arguments')
 required_arg.add_argument('-j', '--json', dest='json', required=True, help='Input JSON file with data for configuration', type=open)
+add_port_arguments(parser)
+add_nsx_arguments(parser)
+add_binding_arguments(parser)
+add_mlag_cache_arguments(parser)
+add_inventory_arguments(parser)
+add_plan_arguments(parser)
+add_journal_arguments(parser)
+add_site_arguments(parser)
+add_metrics_arguments(parser)
+add_retry_arguments(parser)
+bulk_arg = parser.add_argument_group('Bulk Arguments')
+bulk_arg.add_argument('--bulk-workers', dest='bulk_workers', default=4, type=int, help='Maximum number of logical switches created at once when the input has a tenants list (default 4)')
 args = parser.parse_args()
 data = json.load(args.json)
 
+# Run every data center in the input file as its own parallel run when there is more than one
+data_center = select_data_center(args, data)
+if data_center is None:
+    mlag_ports = has_mlag_ports(args, data)
+    run_sites(args, data, NSX_CREDENTIALS + (SWITCH_CREDENTIALS if mlag_ports else []))
+site_report = SiteReport(args.site_report, data_center)
+metrics = metrics_from_args(args, 'create_logical_switch')
+# Ports come from --ports when it is given.  Its digest goes into data so a resumed run must use the same file.
+switch_ports = port_configs_from_args(args, data, data_center)
+journal = journal_from_args(args, 'create_logical_switch', data)
+
 # Set Variables for Login.
-nsx_username = input('NSX Manager Username: ')
-nsx_password = getpass.getpass(prompt='NSX Manager Password: ')
+nsx_username = prompt_credential('NSX Manager Username: ', 'NSX_USERNAME')
+nsx_password = prompt_credential('NSX Manager Password: ', 'NSX_PASSWORD', secret=True)
 
 # Set Variables from JSON object for switchport configurations and API Calls.  Ports must be spelled out fully
 # Leave JSON object empty if no ports on that switch need to be configured.  Would need to look like this {}
-tenant_name = data['tenant_name']
-zone_name = data['zone_name']
-data_center = list(data['data_center'].keys())[0]
+# An optional "tenants" list of tenant_name/zone_name entries creates them all in one run.
+if 'tenants' in data:
+    tenants = data['tenants']
+else:
+    tenants = [{'tenant_name': data['tenant_name'], 'zone_name': data['zone_name']}]
 nsx_manager = data['data_center'][data_center]['nsx_manager']
 switches = data['data_center'][data_center]['switches']
-switch_ports = data['port_configs']
-ls_name = 'vls' + data_center + tenant_name + zone_name
+# Optional map of switch name to IP address (or address:port) for switches without DNS
+switch_addresses = data['data_center'][data_center].get('switch_addresses', {})
+# Optional request budgets for NSX Manager, CVP and each switch
+limits = EndpointLimits(data['data_center'][data_center].get('limits'))
+
+# Open one pooled session to NSX Manager for the whole run
+nsx = nsx_client_from_args(args, nsx_manager, nsx_username, nsx_password, metrics=metrics, limits=limits)
+inventory = inventory_from_args(args)
+nsx_scope = 'nsx:' + nsx_manager
+
+# Resolve each switch's Mlag Domain ID at most once, optionally from a cache file.
+mlag_cache = MlagDomainCache(connect_switch, cache_file=args.mlag_cache, ttl=args.mlag_cache_ttl, inventory=inventory)
 
 # Check if any ports designated for binding are Mlag interfaces.
 # If so, have user specify login info for switch to pull Mlag Domain ID.
@@ -235,47 +293,101 @@ for index in range(len(switches)):
     switch_ports_mlag_check = switch_ports[(switches[index])]
     for port, config in switch_ports_mlag_check.items():
         if port.startswith('Port'):
-            if config['is_mlag'] == True:
+            if config['is_mlag'] == True and not mlag_cache.cached(switches[index]):
                 try:
                     switch_username
                 except NameError:
                     print('Mlag port identified for binding. Please enter switch login info for Mlag ID retrieval')
-                    switch_username = input('Switch Username: ')
-                    switch_password = getpass.getpass(prompt='Switch Password: ')
+                    switch_username = prompt_credential('Switch Username: ', 'SWITCH_USERNAME')
+                    switch_password = prompt_credential('Switch Password: ', 'SWITCH_PASSWORD', secret=True)
 
-# GET NSX Manager Transport Zone info to pull out Scope ID
-tz_dict = nsx_get('scopes')
-# Parse out Transport Zone Scope ID for later use
-tz_scope_id = tz_dict['vdnScopes']['vdnScope']['objectId']
+metrics.phase('lookup')
 
-# GET Hardware Binding ID for CVX
-hw_dict = nsx_get('hardwaregateways')
-# Parse out Hardware Binfing ID for later use
-hw_id = hw_dict['list']['hardwareGateway']['objectId']
+# Read everything the plan needs before anything is created.  Mlag Domain IDs are
+# resolved in the background while NSX Manager is read.
+mlag_switches = [switch for switch in switches if any(port.startswith('Port') and config['is_mlag'] == True for port, config in switch_ports[switch].items())]
+with ThreadPoolExecutor(max_workers=3) as pool:
+    mlag_future = pool.submit(mlag_cache.prefetch, mlag_switches, len(mlag_switches) or 1)
+    # GET NSX Manager Transport Zone info and the Hardware Binding ID for CVX, unless the inventory has them
+    tz_future = pool.submit(inventory.fetch, nsx_scope, 'transport_zone', '', lambda: first_object_id(nsx.get('scopes'), 'vdnScope'))
+    hw_future = pool.submit(inventory.fetch, nsx_scope, 'hardware_gateway', '', lambda: first_object_id(nsx.get('hardwaregateways'), 'hardwareGateway'))
+    # Parse out Transport Zone Scope ID for later use
+    tz_scope_id = tz_future.result()
 
-# GET all logical switches to check for duplicate by name.
-# Note that NSX will let you create logical switches with the same name.
-all_ls_dict = nsx_get('scopes/' + tz_scope_id + '/virtualwires')
-for index in range(len(all_ls_dict['virtualWires']['dataPage']['virtualWire'])):
-    if all_ls_dict['virtualWires']['dataPage']['virtualWire'][index]['name'] == ls_name:
-        print('Logical Switch already exists in NSX.  Please verify naming and input file.')
-        sys.exit()
+    # GET all logical switches to check for duplicates by name, once for the whole batch.
+    # Note that NSX will let you create logical switches with the same name.
+    virtualwires = VirtualWireIndex(nsx, 'scopes/' + tz_scope_id + '/virtualwires', page_size=args.nsx_page_size, inventory=inventory)
+    ls_names = ['vls' + data_center + tenant['tenant_name'] + tenant['zone_name'] for tenant in tenants]
+    # In reconcile mode logical switches that already exist are kept and only their missing bindings are planned.
+    existing_switches = {}
+    for ls_name in ls_names:
+        if ls_names.count(ls_name) > 1:
+            print('Logical Switch ' + ls_name + ' is listed more than once.  Please verify naming and input file.')
+            sys.exit()
+        # A name found in the inventory is checked against NSX, in case it was removed since.
+        # Logical switches an earlier attempt of this run created are expected to exist.
+        if journal.done('logical_switch', ls_name):
+            continue
+        virtualwire = virtualwires.find(ls_name, verify=True)
+        if virtualwire is not None:
+            if not args.reconcile:
+                print('Logical Switch ' + ls_name + ' already exists in NSX.  Please verify naming and input file.')
+                sys.exit()
+            existing_switches[ls_name] = virtualwire
+# Parse out Hardware Binding ID for later use
+hw_id = hw_future.result()
+mlag_future.result()
 
-# POST to create new Logical Switch
-# Generate Dictionary for Request Body and feed into POST Function
-ls_dict = {'name': ls_name, 'tenantId': tenant_name}
-ls_response = nsx_post('scopes/' + tz_scope_id + '/virtualwires', ls_dict, 'virtualWireCreateSpec')
-if ls_response.status_code == 201:
-    print('Logical Switch ' + ls_name + ' created.')
-    ls_id = ls_response.content.decode('utf-8')
-else:
-    print('Error Creating Logical Switch.')
+# Plan every logical switch and its bindings.  The VLAN comes from the VNI NSX assigns at creation.
+plan = ChangePlan()
+planned_executors = {}
+for ls_name in ls_names:
+    created = journal.get('logical_switch', ls_name)
+    existing = existing_switches.get(ls_name)
+    if existing is not None:
+        # Its bindings are read from NSX now, and the same plan is sent on --apply.
+        ls_id = existing.object_id
+        binding_index = BindingIndex(nsx, ls_id, inventory=inventory)
+        vlan_id = existing.vdn_id[0] + existing.vdn_id[-2:]
+    elif created is not None:
+        ls_id = created['ls_id']
+        binding_index = BindingIndex(nsx, ls_id, bindings={})
+        vlan_id = created['vni'][0] + created['vni'][-2:]
+    else:
+        plan.add_logical_switch(ls_name)
+        ls_id = ''
+        binding_index = BindingIndex(nsx, ls_id, bindings={})
+        vlan_id = 'from new VNI'
+    planned_bindings = HardwareBindingExecutor(nsx, ls_id, ls_name, hw_id, binding_index, mlag_lookup=mlag_cache.lookup, max_workers=args.binding_workers,
+                                               journal=journal, reconcile=args.reconcile)
+    for index in range(len(switches)):
+        planned_bindings.add_switch(switches[index], switch_ports[(switches[index])], vlan_id)
+    planned_bindings.plan()
+    plan.add_bindings(planned_bindings)
+    planned_executors[ls_name] = planned_bindings
+if not review_plan(plan, args.apply):
+    site_report.finish('planned')
+    mlag_cache.save()
+    inventory.close()
+    nsx.close()
+    sys.exit()
+journal.announce()
 
-# GET the details of the new Logical Switch to pull out the VNI ID and map to a VLAN ID
-ls_config_dict = nsx_get('virtualwires/' + ls_id)
-ls_vni_id = ls_config_dict['virtualWire']['vdnId']
-vlan_id = ls_vni_id[0] + ls_vni_id[-2:]
+# Create the logical switches and their bindings with bounded parallelism
+metrics.phase('binding')
+with ThreadPoolExecutor(max_workers=args.bulk_workers) as pool:
+    ls_results = list(pool.map(lambda tenant: create_logical_switch(tenant['tenant_name'], tenant['zone_name']), tenants))
+print_results_table(ls_results)
+mlag_cache.save()
+if all(ls_result.status in ('created', 'existing') for ls_result in ls_results):
+    journal.finish()
+site_report.finish('applied' if all(ls_result.status in ('created', 'existing') for ls_result in ls_results) else 'partial',
+                   [binding for ls_result in ls_results for binding in ls_result.bindings],
+                   [(ls_result.ls_name, ls_result.status) for ls_result in ls_results])
 
-# Call function to add Hardware Bindings to new Logical Switch
-for index in range(len(switches)):
-    nsx_hardware_binding(switches[index], switch_ports[(switches[index])], vlan_id)
\ No newline at end of file
+# Report NSX Manager connection reuse and any throttling for the run
+nsx.print_stats()
+limits.print_stats()
+inventory.print_stats()
+inventory.close()
+nsx.close()
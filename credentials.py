@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+
+# BSD 3-Clause License
+#
+# Copyright (c) 2018, Arista Networks EOS+
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name Arista nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+'''
+Credential prompts shared by all of the scripts in this repo.
+
+Each credential is read from an environment variable when one is set, and
+prompted for otherwise.  That lets a multi data center run prompt once and
+hand the answers to the run of every site, and lets scheduled runs go
+without a terminal.  The provisioning service can also load them from a
+JSON file of variable names and values.
+
+    NSX_USERNAME / NSX_PASSWORD
+    SWITCH_USERNAME / SWITCH_PASSWORD
+    CVP_USERNAME / CVP_PASSWORD
+
+Created by Dimitri Capetz - dcapetz@arista.com
+'''
+
+# Import getpass for masked password prompt
+# Import json for reading credentials files
+# Import os for reading credentials from the environment
+# Import sys for various error handling
+import getpass
+import json
+import os
+import sys
+
+# The prompt, environment variable and whether it is a secret for each credential
+NSX_CREDENTIALS = [('NSX Manager Username: ', 'NSX_USERNAME', False), ('NSX Manager Password: ', 'NSX_PASSWORD', True)]
+SWITCH_CREDENTIALS = [('Switch Username: ', 'SWITCH_USERNAME', False), ('Switch Password: ', 'SWITCH_PASSWORD', True)]
+CVP_CREDENTIALS = [('CVP Username: ', 'CVP_USERNAME', False), ('CVP Password: ', 'CVP_PASSWORD', True)]
+
+def prompt_credential(prompt, env_var, secret=False):
+    ''' Read one credential from the environment, or prompt for it
+
+    Args:
+        prompt (str): The prompt shown when the variable isn't set
+        env_var (str): The environment variable to check first
+        secret (bool): Mask the input, for passwords
+
+    Returns:
+        value (str): The credential
+    '''
+    value = os.environ.get(env_var)
+    if value:
+        return value
+    if secret:
+        return getpass.getpass(prompt=prompt)
+    return input(prompt)
+
+def site_credentials(credentials, data_center, environ):
+    ''' Pick the value of each credential for one data center.  A site specific
+        variable like NSX_PASSWORD_DC02 wins over the plain one.
+
+    Args:
+        credentials (list): (prompt, environment variable, secret) of each credential
+        data_center (str): The data center the values are for
+        environ (dict): The variables to pick from
+
+    Returns:
+        values (dict): Environment variable to value, for each credential that is set
+    '''
+    values = {}
+    for prompt, env_var, secret in credentials:
+        value = environ.get(env_var + '_' + data_center.upper()) or environ.get(env_var)
+        if value:
+            values[env_var] = value
+    return values
+
+def load_credentials_file(path):
+    ''' Load credentials from a JSON file of environment variable names and
+        values into the environment.  Variables that are already set win.
+
+    Args:
+        path (str): The credentials file
+    '''
+    try:
+        with open(path) as credentials_file:
+            values = json.load(credentials_file)
+    except (IOError, ValueError) as error:
+        print('Unable to read credentials file ' + path + '. ' + str(error))
+        sys.exit()
+    if not isinstance(values, dict) or not all(isinstance(value, str) for value in values.values()):
+        print('Credentials file ' + path + ' must be a JSON object of variable names and values, like {"NSX_USERNAME": "admin"}.')
+        sys.exit()
+    for env_var, value in values.items():
+        os.environ.setdefault(env_var, value)
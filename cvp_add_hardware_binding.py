@@ -44,397 +44,375 @@ into a pre-existing configlet.  I have assumed the configlets for the device
 specific ports will be called '<switchname> Switchports' but this can be changed to
 whatever naming standard you like.
 
+Nothing is changed unless the script is run with --apply.  Without it, every
+configlet and NSX Manager is read and the planned configlet diffs and
+bindings are printed for review.  With --reconcile the input file is the
+desired state: interface blocks already in the configlet are compared with it
+and only missing or changed blocks are planned, so a configlet that already
+matches isn't updated and no CVP task is created for it.
+
 Please note that all SSL verification is disabled.  If you have signed certs
-in place for NSX Manager, you can remove the urllib3 section and verify option
-in the requests.
+in place for NSX Manager, you can set verify=True where the NsxClient is
+built in nsx_client.py.
 
 Created by Dimitri Capetz - dcapetz@arista.com
 '''
 
-# Import requests for API Calls to NSX Manager
-# Import xmltodict and dicttoxml for working with XML
-# Import getpass for password prompt
+# Import the shared NSX client for pooled API Calls to NSX Manager
+# Import the paged logical switch lookup
+# Import the NSX XML codec for reading the hardware gateway
+# Import the binding index and executor for concurrent hardware bindings
+# Import the eAPI helpers for cached Mlag domain lookups
 # Import argparse for pulling in file input via command line
 # Import json for working with json objects
-# Import pyEAPI for retrieving switch config details
 # Import CVP REST API Client for configuration of Arista Switches through CVP
-# Import re for parsing and sorting configs
-# Import time for waiting to ensure tasks complete
+# Import the CVP task helpers for polling task completion
+# Import the configlet model for merging switchport configlets
+# Import the switchport config templates shared with the eAPI script
+# Import the streaming port file reader for large inventories
+# Import the change plan for reviewing changes before they are made
+# Import the run metrics for per phase timings
+# Import the retry and circuit breaker settings
+# Import the per data center request budgets
+# Import the inventory cache for NSX and fabric state kept between runs
+# Import the run journal for resuming interrupted runs
+# Import the credential prompts and the multi data center runner
+# Import the warm pool so the provisioning service keeps the CVP login between jobs
+# Import concurrent.futures and threading for reading and writing configlets in parallel
 # Import sys for various error handling
-import requests
-import xmltodict
-from dicttoxml import dicttoxml
-import getpass
+from nsx_client import add_nsx_arguments, nsx_client_from_args
+from nsx_virtualwires import VirtualWireIndex
+from nsx_xml import first_object_id
+from nsx_bindings import BindingIndex, HardwareBindingExecutor, add_binding_arguments
+from eapi_client import MlagDomainCache, add_mlag_cache_arguments, eapi_connect
 import argparse
 import json
-import pyeapi
 from cvprac.cvp_client import CvpClient
-from cvprac.cvp_client_errors import CvpApiError
-import re
-import time
+from cvprac.cvp_client_errors import CvpApiError, CvpLoginError
+from cvp_tasks import execute_tasks, incomplete_switches, wait_for_pending_tasks, wrap_cvp_client
+from configlet import SwitchportConfiglet
+from switchport_config import PORT_MODES, configlet_blocks, switch_port_records
+from metrics import add_metrics_arguments, metrics_from_args
+from rate_limit import EndpointLimits
+from inventory import add_inventory_arguments, inventory_from_args
+from journal import add_journal_arguments, journal_from_args
+from credentials import CVP_CREDENTIALS, NSX_CREDENTIALS, SWITCH_CREDENTIALS, prompt_credential
+from sites import SiteReport, add_site_arguments, run_sites, select_data_center
+from resilience import add_retry_arguments, breaker_from_args, retry_call, retry_policy_from_args
+from port_inventory import add_port_arguments, has_mlag_ports, port_configs_from_args
+from change_plan import ChangePlan, ConfigletChange, add_plan_arguments, review_plan
+from warm_pool import keep_warm
+from concurrent.futures import ThreadPoolExecutor
+import threading
 import sys
 
-# Disable Cert Warnings for Test Environment
-import urllib3
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-
-def nsx_get(uri):
-    ''' Make generic HTTP GET to NSX Manager
-        
-        Args:
-            uri (str): The uri to call
-        
-        Returns:
-            response (dict): The response body of the HTTP GET
-    '''
-    nsx_url = 'https://' + nsx_manager + '/api/2.0/vdn/' # All calls will be to this base URL
-    try:
-        get_response = requests.get(nsx_url + uri, auth=(nsx_username, nsx_password), verify=False, timeout=5)
-        if get_response.status_code == 403:
-            print('Unable to login to NSX Manager. Verify username and password.')
-            sys.exit()
-        if get_response.status_code == 404:
-            print('URI not found. Verify NSX Manager IP and JSON input file. If NSX was recently upgraded, verify any API changes in release notes.')
-            sys.exit()
-        else:
-            get_dict = xmltodict.parse(get_response.content, dict_constructor=dict)
-            return get_dict
-    except requests.ConnectionError:
-        print('Failed to connect to NSX Manager. Verify reachability.')
-        sys.exit()
-
-def nsx_post(uri, body_dict, xml_root):
-    ''' Make generic HTTP POST to NSX Manager
-        
-        Args:
-            uri (str): The uri to call
-            body_dict (dict): A dictionary containing the body of the request to be sent
-            xml_root (str): The custom XML Root need to place the body in the correct structure
-        
-        Returns:
-            response (str): The response of the HTTP POST
-    '''
-    nsx_url = 'https://' + nsx_manager + '/api/2.0/vdn/' # All calls will be to this base URL
-    headers = {'Content-Type': 'application/xml'} # Headers required for HTTP POSTs
-    try:
-        post_xml = dicttoxml(body_dict, custom_root=xml_root, attr_type=False)
-        post_response = requests.post(nsx_url + uri, auth=(nsx_username, nsx_password), headers=headers, data=post_xml, verify=False, timeout=5)
-        return post_response
-    except requests.ConnectionError:
-        print('Failed to connect to NSX Manager. Verify reachability.')
-        sys.exit()
-
-def switch_configlet_update(switch, switch_ports):
-    ''' Generate switch config if ports are present, convert to configlet
-        Extends config if preexisting, creates new configlet if not
+def switch_configlet_plan(switch, switch_ports):
+    ''' Generate switch config if ports are present and plan the configlet change.
+        Extends config if preexisting, plans a new configlet if not.
+        Only reads from CVP, nothing is changed.
         
         Args:
             switch (str): The name of the switch to be configured
             switch_ports (dict): A dictionary containing configuration attributes
+
+        Returns:
+            configlet_change (class): The planned ConfigletChange, 1 if ports already exist in the configlet,
+                or None if the configlet already matches the input file in reconcile mode
     '''
-    switch_eth_config_to_add = []
-    switch_pc_config_to_add = []
     if bool(switch_ports) == True:
-        # Generate Switch Configurations as list items.
         for port, config in switch_ports.items():
-            if port.startswith('Port'):
-                port_channel_id = (port.split('l'))[1]
-                for index in range(len(config['local_members'])):
-                    switch_eth_config_to_add.extend(['interface ' + config['local_members'][index] + '\n   description ' + config['description'] + '\n   channel-group ' + port_channel_id + ' mode active\n   speed forced ' + config['speed'] + '\n   no shutdown'])
-                if config['mode'] == 'trunk':
-                    if config['is_mlag'] == True:
-                        switch_pc_config_to_add.extend(['interface ' + port + '\n   description ' + config['description'] + '\n   switchport trunk allowed vlan ' + vlan_id + '\n   switchport mode trunk' + '\n   mlag ' + port_channel_id + '\n   no shutdown'])
-                    else:
-                        switch_pc_config_to_add.extend(['interface ' + port + '\n   description ' + config['description'] + '\n   switchport trunk allowed vlan ' + vlan_id + '\n   switchport mode trunk' + '\n   no shutdown'])
-                elif config['mode'] == 'trunk native':
-                    if config['is_mlag'] == True:
-                        switch_pc_config_to_add.extend(['interface ' + port + '\n   description ' + config['description'] + '\n   switchport trunk native vlan ' + vlan_id + '\n   switchport mode trunk' + '\n   mlag ' + port_channel_id + '\n   no shutdown'])
-                    else:
-                        switch_pc_config_to_add.extend(['interface ' + port + '\n   description ' + config['description'] + '\n   switchport trunk native vlan ' + vlan_id + '\n   switchport mode trunk' + '\n   no shutdown'])
-                elif config['mode'] == 'access':
-                    if config['is_mlag'] == True:
-                        switch_pc_config_to_add.extend(['interface ' + port + '\n   description ' + config['description'] + '\n   switchport access vlan ' + vlan_id + '\n   switchport mode access' + '\n   mlag ' + port_channel_id + '\n   no shutdown'])
-                    else:
-                        switch_pc_config_to_add.extend(['interface ' + port + '\n   description ' + config['description'] + '\n   switchport access vlan ' + vlan_id + '\n   switchport mode access' + '\n   no shutdown'])
-                else:
-                    print('Incorrect Port Mode Selection for ' + switch +
-                    '.  Please verify port configurations.  Valid options are trunk, trunk native and access.')
-                    sys.exit()
-            else:
-                if config['mode'] == 'trunk':
-                    switch_eth_config_to_add.extend(['interface ' + port + '\n   description ' + config['description'] + '\n   speed forced ' +     config['speed'] + '\n   switchport trunk allowed vlan ' + vlan_id + '\n   switchport mode trunk' + '\n   no shutdown'])
-                elif config['mode'] == 'trunk native':
-                    switch_eth_config_to_add.extend(['interface ' + port + '\n   description ' + config['description'] + '\n   speed forced ' +     config['speed'] + '\n   switchport trunk native vlan ' + vlan_id + '\n   switchport mode trunk' + '\n   no shutdown'])
-                elif config['mode'] == 'access':
-                    switch_eth_config_to_add.extend(['interface ' + port + '\n   description ' + config['description'] + '\n   speed forced ' +     config['speed'] + '\n   switchport access vlan ' + vlan_id + '\n   switchport mode access' + '\n   no shutdown'])
-                else:
-                    print('Incorrect Port Mode Selection for ' + switch + '.  Please verify port configurations.  Valid options are trunk, trunk native and access.')
-                    sys.exit()
+            if config['mode'] not in PORT_MODES:
+                print('Incorrect Port Mode Selection for ' + switch + '.  Please verify port configurations.  Valid options are trunk, trunk native and access.')
+                sys.exit()
+        # Render every port's interface block from the shared templates in one batch.
+        switch_pc_config_to_add, switch_eth_config_to_add = configlet_blocks(switch_port_records(switch_ports), vlan_id)
+        switch_configlet_name = switch + ' Switchports'
         try:
-            switch_configlet_data = cvp.api.get_configlet_by_name(switch + ' Switchports')
-            # Check if configlet has existing data.  If so, append new config.
-            if bool(switch_configlet_data['config']) == True:
-                # Check if any ports already exist in configlet.  If so, skip loop iteration.
-                for port, config in switch_ports.items():
-                    if port.startswith('Port'):
-                        for index in range(len(config['local_members'])):
-                            if config['local_members'][index] in switch_configlet_data['config']:
-                                print(switch + ' ' + config['local_members'][index] + ' already exists in ' + switch + ' Switchports configlet.  Verify config.')
-                                print('Skipping edits for ' + switch + ' Switchports configlet.')
-                                port_config_exception = 1
-                                return port_config_exception
-                    if port in switch_configlet_data['config']:
-                        print(switch + ' ' + port + ' already exists in ' + switch + ' Switchports configlet.  Verify config.')
-                        print('Skipping edits for ' + switch + ' Switchports configlet.')
-                        port_config_exception = 1
-                        return port_config_exception
-                # Take existing configlet data and split into list for sorting.
-                # Separate Eths and PCs into separate list for desired placement in configlet.
-                switch_configlet = switch_configlet_data['config'].split('\n\n')
-                switch_eth_configlet = []
-                switch_pc_configlet = []
-                for index in range(len(switch_configlet)):
-                    if switch_configlet[index].startswith('interface Eth'):
-                        switch_eth_configlet.extend([switch_configlet[index]])
-                    elif switch_configlet[index].startswith('interface Port'):
-                        switch_pc_configlet.extend([switch_configlet[index]])
-                switch_eth_configlet.extend(switch_eth_config_to_add)
-                if (bool(switch_pc_configlet) == True) or (bool(switch_pc_config_to_add) == True):
-                    switch_pc_configlet.extend(switch_pc_config_to_add)
-                # Sort configlet data so interfaces show up in proper order.
-                switch_eth_configlet = sorted(switch_eth_configlet, key=lambda x:list(map(int, re.findall('[0-9/]+(?=\n\s\s\s)', x)[0].split('/'))))
-                switch_eth_configlet = '\n\n'.join(switch_eth_configlet)
-                if bool(switch_pc_configlet) == True:
-                    switch_pc_configlet = sorted(switch_pc_configlet, key=lambda x:list(map(int, re.findall('[0-9/]+(?=\n\s\s\s)', x)[0].split('/'))))
-                    switch_pc_configlet = '\n\n'.join(switch_pc_configlet)
-                    switch_configlet = switch_pc_configlet + '\n\n' + switch_eth_configlet
-                else:
-                    switch_configlet = switch_eth_configlet
-            else:
-                # Sort configlet data so interfaces show up in proper order.
-                switch_eth_configlet = sorted(switch_eth_config_to_add, key=lambda x:list(map(int, re.findall('[0-9/]+(?=\n\s\s\s)', x)[0].split('/'))))
-                switch_eth_configlet = '\n\n'.join(switch_eth_configlet)
-                if bool(switch_pc_config_to_add) == True:
-                    switch_pc_configlet = sorted(switch_pc_config_to_add, key=lambda x:list(map(int, re.findall('[0-9/]+(?=\n\s\s\s)', x)[0].split('/'))))
-                    switch_pc_configlet = '\n\n'.join(switch_pc_configlet)
-                    switch_configlet = switch_pc_configlet + '\n\n' + switch_eth_configlet
-                else:
-                    switch_configlet = switch_eth_configlet
-            cvp.api.update_configlet(switch_configlet, switch_configlet_data['key'], switch + ' Switchports')
-            print('Adding config to ' + switch + ' Switchports configlet...')
-            return
-        # Exception to create configlet and apply to switch if it doesn't yet exist.
+            switch_configlet_data = cvp.api.get_configlet_by_name(switch_configlet_name)
         except CvpApiError:
-            print(switch + ' Switchports configlet doesn\'t exist.  Creating and applying to ' + switch)
-            switch_configlet_name = switch + ' Switchports'
-            # Sort new configlet data so interfaces show up in proper order
-            switch_eth_configlet = sorted(switch_eth_config_to_add, key=lambda x:list(map(int, re.findall('[0-9/]+(?=\n\s\s\s)', x)[0].split('/'))))
-            switch_eth_configlet = '\n\n'.join(switch_eth_configlet)
-            if bool(switch_pc_config_to_add) == True:
-                switch_pc_configlet = sorted(switch_pc_config_to_add, key=lambda x:list(map(int, re.findall('[0-9/]+(?=\n\s\s\s)', x)[0].split('/'))))
-                switch_pc_configlet = '\n\n'.join(switch_pc_configlet)
-                switch_configlet = switch_pc_configlet + '\n\n' + switch_eth_configlet
-            else:
-                switch_configlet = switch_eth_configlet
-            switch_configlet_push = cvp.api.add_configlet(switch_configlet_name, switch_configlet)
-            switch_configlet_data = cvp.api.get_configlet_by_name(switch + ' Switchports')
-            # Pull down switch info to attach new configlet.
-            switch_info = cvp.api.get_device_by_name(switch)
-            switch_response = cvp.api.apply_configlets_to_device('NSX Binding Script', switch_info, [switch_configlet_data], create_task=True)
-            return
-
-def execute_pending_tasks():
-    ''' Executes pending tasks in CVP.  Use carefully in active environment.
-        It will provide some checking to make sure the pending tasks are on the switches
-        from the input file and created by the same user running the script, etc.
-        It could still execute tasks that were previously created from the same user.
-        Waits inserted to ensure logs are complete and push complete before moving on.
-    
-    Returns:
-    
+            switch_configlet_data = None
+        if switch_configlet_data is not None:
+            # Parse the existing configlet once and index it by interface name.
+            switch_configlet = SwitchportConfiglet(switch_configlet_data['config'])
+            if args.reconcile:
+                # Replace only the blocks that differ from the input file.  Nothing to change means no update and no task.
+                outdated_config = switch_configlet.outdated(switch_pc_config_to_add + switch_eth_config_to_add)
+                if not outdated_config:
+                    return None
+                switch_configlet.merge(outdated_config)
+                return ConfigletChange(switch, switch_configlet_name, switch_configlet_data['key'], switch_configlet_data['config'], switch_configlet.render())
+            # Check if any ports already exist in configlet.  If so, skip edits for this switch.
+            port_names = []
+            for port, config in switch_ports.items():
+                if port.startswith('Port'):
+                    port_names.extend(config['local_members'])
+                port_names.append(port)
+            port_conflicts = switch_configlet.conflicts(port_names)
+            if bool(port_conflicts) == True:
+                for port in port_conflicts:
+                    print(switch + ' ' + port + ' already exists in ' + switch_configlet_name + ' configlet.  Verify config.')
+                print('Skipping edits for ' + switch_configlet_name + ' configlet.')
+                port_config_exception = 1
+                return port_config_exception
+            # Merge new interfaces into place.  Untouched interfaces are written back as they were.
+            switch_configlet.merge(switch_pc_config_to_add + switch_eth_config_to_add)
+            return ConfigletChange(switch, switch_configlet_name, switch_configlet_data['key'], switch_configlet_data['config'], switch_configlet.render())
+        # Plan to create the configlet and apply it to the switch if it doesn't yet exist.
+        switch_configlet = SwitchportConfiglet()
+        switch_configlet.merge(switch_pc_config_to_add + switch_eth_config_to_add)
+        # Pull down switch info now so a missing device stops the run before anything is written.
+        switch_info = inventory.fetch(cvp_scope, 'device', switch, lambda: cvp.api.get_device_by_name(switch))
+        if bool(switch_info) == False:
+            print(switch + ' not found in CVP inventory.  Verify input file.')
+            port_config_exception = 1
+            return port_config_exception
+        return ConfigletChange(switch, switch_configlet_name, None, '', switch_configlet.render(), device=switch_info)
+
+def switch_configlet_apply(configlet_change):
+    ''' Push a planned configlet change to CVP
+
+        Args:
+            configlet_change (class): The ConfigletChange from switch_configlet_plan
     '''
-    pending_tasks = cvp.api.get_tasks_by_status('Pending')
-    for index in range(len(pending_tasks)):
-        if pending_tasks[index]['description'].startswith('Configlet Assign'):
-            if pending_tasks[index]['workOrderDetails']['netElementHostName'] in data['data_center'][data_center]['switches']:
-                if pending_tasks[index]['createdBy'] == cvp_username:
-                    task_id = pending_tasks[index]['workOrderId']
-                    push_task = cvp.api.execute_task(task_id)
-                    # Wait to ensure task push is complete so full logs are available.
-                    print('Waiting for task execution to complete...')
-                    time.sleep(15)
-                    task_logs = cvp.api.get_logs_by_id(task_id)
-                    for index in range(len(task_logs['data'])):
-                        if task_logs['data'][index]['logDetails'].startswith('Configlet push response') == True:
-                            print('Task '+ task_id + ' - ' + task_logs['data'][index]['logDetails'] + ' - ' + task_logs['data'][index]['objectName'])
-
-def eapi_connect(switch):
-    ''' Connect to eAPI interface of Arista Switch
-    
+    if configlet_change.created == False:
+        print('Adding config to ' + configlet_change.name + ' configlet...')
+        cvp.api.update_configlet(configlet_change.new_config, configlet_change.key, configlet_change.name)
+        journal.record('configlet', configlet_change.switch, name=configlet_change.name)
+        return
+    print(configlet_change.name + ' configlet doesn\'t exist.  Creating and applying to ' + configlet_change.switch)
+    # Configlet assignment goes through CVP's per-session temp actions, so only one switch at a time.
+    with configlet_assign_lock:
+        switch_configlet_push = cvp.api.add_configlet(configlet_change.name, configlet_change.new_config)
+        switch_configlet_data = cvp.api.get_configlet_by_name(configlet_change.name)
+        switch_response = cvp.api.apply_configlets_to_device('NSX Binding Script', configlet_change.device, [switch_configlet_data], create_task=True)
+    journal.record('configlet', configlet_change.switch, name=configlet_change.name)
+
+def connect_switch(switch):
+    ''' Connect to a switch over eAPI with the credentials, metrics, retry settings and request budget of the run
+
     Args:
         switch (str): The IP address or FQDN of the Arista switch
-    
+
     Returns:
-        switch_node (class): The connected node of the function call that can be used for show or config commands.
+        switch_node (class): The connected pyeapi node
     '''
-    switch_conn = pyeapi.client.connect(transport='https', host=switch, username=switch_username, password=switch_password)
-    switch_node = pyeapi.client.Node(switch_conn)
-    return switch_node
+    return eapi_connect(switch, switch_username, switch_password, switch_addresses.get(switch), metrics=metrics,
+                        retry_policy=retry_policy_from_args(args), breaker=breaker_from_args(args, 'switch ' + switch),
+                        limiter=limits.switch(switch))
+
+def cvp_login():
+    ''' Log in to the CVP cluster.  Logging in is safe to repeat, so a busy or
+        unreachable cluster is retried with backoff.
 
-def eapi_mlag_config_check(switch):
-    ''' Connect and check mlag domain ID for use with NSX bindings
-    
-    Args:
-        switch (str): The IP address or FQDN of the Arista switch
-    
     Returns:
-        mlag_domain (str): The mlag domain ID of the switch
-    '''
-    switch_node = eapi_connect(switch)
-    # Check mlag configuration and parse out mlag domain ID.
-    show_mlag_output = switch_node.enable('show mlag')
-    mlag_domain = show_mlag_output[0]['result']['domainId']
-    return mlag_domain
-
-def nsx_binding_check(switch, port):
-    ''' Checks existing NSX hardware bindings for any conflict
-    
-    Args:
-        switch (str): The name of the Arista switch or mlag_domain
-        port (str): The name of the port to check for
+        cvp (class): The logged in CvpClient
     '''
-    bind_check_dict = nsx_get('virtualwires/' + ls_id + '/hardwaregateways')
-    if bool(bind_check_dict['list']) == True:
-        try:
-            for i in range(len(bind_check_dict['list']['hardwareGatewayBinding'])):
-                if bind_check_dict['list']['hardwareGatewayBinding'][i]['switchName'] == switch:
-                    if bind_check_dict['list']['hardwareGatewayBinding'][i]['portName'] == port:
-                        print(switch + ' ' + port + ' was already bound to ' + ls_name)
-                        print('This is expected if the port is the second Mlag port in a switch pair')
-                        print('If it is not, please verify input file and switch config')
-        except KeyError:
-            if bind_check_dict['list']['hardwareGatewayBinding']['switchName'] == switch:
-                if bind_check_dict['list']['hardwareGatewayBinding']['portName'] == port:
-                    print(switch + ' ' + port + ' was already bound to ' + ls_name)
-                    print('This is expected if the port is the second Mlag port in a switch pair')
-                    print('If it is not, please verify input file and switch config')
-
-def nsx_hardware_binding(switch, switch_ports, vlan):
-    ''' Generate body and POST to NSX Manager if ports are present
-    
+    cvp = CvpClient(syslog=True, filename='cvprac_log')
+    try:
+        retry_call(lambda: cvp.connect(cvps, cvp_username, cvp_password, port=cvp_port), retry_policy_from_args(args), None,
+                   retry_exceptions=(CvpLoginError,))
+    except CvpLoginError as error:
+        print('Unable to login to CVP. ' + str(error).strip())
+        sys.exit()
+    return cvp
+
+def execute_pending_tasks(configured_switches):
+    ''' Executes pending tasks in CVP.  Use carefully in active environment.
+        It will provide some checking to make sure the pending tasks are on the switches
+        from the input file and created by the same user running the script, etc.
+        It could still execute tasks that were previously created from the same user.
+        Tasks are all submitted at once and polled until each one finishes.
+
     Args:
-        switch (str): The name of the switch to perform bindings for
-        switch_ports (dict): A dictionary containing configuration attributes
-        vlan (str): The vlan ID to bind the logical switch to
+        configured_switches (list): The switches that had configlet changes
+
+    Returns:
+        task_results (list): TaskResult objects for every executed task
     '''
-    # Loop to Generate Request Body from Dictionary for all switch bindings and POST
-    # So far as I can tell, these can only be done one switch per request and must be looped through.
-    hw_bind_uri = 'virtualwires/' + ls_id + '/hardwaregateways'
-    for port, config in switch_ports.items():
-        # Check if port to bind is an MLAG interface.  If yes, rewrite switch and port variables to match what NSX expects.
-        if port.startswith('Port'):
-            if config['is_mlag'] == True:
-                mlag_port = 'Mlag' + (port.split('l'))[1]
-                mlag_switch = 'mlag-' + eapi_mlag_config_check(switch)
-        # Check existing hardware bindings to see if there is a duplicate. Notify user but continue.
-        if port.startswith('Port'):
-            if config['is_mlag'] == True:
-                nsx_binding_check(mlag_switch, mlag_port)
-            else:
-                nsx_binding_check(switch, port)
-        else:
-            nsx_binding_check(switch, port)
-        # Set vlan ID for binding and apply
-        if config['mode'] == 'access':
-            port_vlan_id = '0'
-        else:
-            port_vlan_id = vlan
-        # Perform harware bindings. Check if mlag is present to ensure names are correct when sent to NSX.
-        if port.startswith('Port'):
-            if config['is_mlag'] == True:
-                hw_bind_dict = {'hardwareGatewayId': hw_id, 'vlan': port_vlan_id, 'switchName': mlag_switch, 'portName': mlag_port}
-                hw_bind_response = nsx_post(hw_bind_uri, hw_bind_dict, 'hardwareGatewayBinding')
-            else:
-                hw_bind_dict = {'hardwareGatewayId': hw_id, 'vlan': port_vlan_id, 'switchName': switch, 'portName': port}
-                hw_bind_response = nsx_post(hw_bind_uri, hw_bind_dict, 'hardwareGatewayBinding')
-        else:
-            hw_bind_dict = {'hardwareGatewayId': hw_id, 'vlan': port_vlan_id, 'switchName': switch, 'portName': port}
-            hw_bind_response = nsx_post(hw_bind_uri, hw_bind_dict, 'hardwareGatewayBinding')
-        if hw_bind_response.status_code == 200:
-            print('NSX hardware binding complete for ' + switch + ' ' + port)
-        else:
-            print('Error binding NSX logical switch to ' + switch + ' ' + port)
+    # Poll for the configlet changes to register as tasks rather than waiting a fixed time.
+    pending_tasks = wait_for_pending_tasks(cvp, configured_switches, cvp_username, timeout=args.task_wait)
+    print('Waiting for ' + str(len(pending_tasks)) + ' task(s) to complete...')
+    task_results = execute_tasks(cvp, pending_tasks, timeout=args.task_timeout)
+    for result in task_results:
+        if result.status == 'Completed':
+            journal.record('task', result.switch, task_id=result.task_id)
+    return task_results
 
 # Pull in JSON file from command line argument
 parser = argparse.ArgumentParser(description='Configure Arista switchports via CVP and bind to existing NSX logical switch')
 required_arg = parser.add_argument_group('Required Arguments')
 required_arg.add_argument('-j', '--json', dest='json', required=True, help='Input JSON file with data for configuration', type=open)
+add_port_arguments(parser)
+add_nsx_arguments(parser)
+add_binding_arguments(parser)
+add_mlag_cache_arguments(parser)
+add_inventory_arguments(parser)
+add_plan_arguments(parser)
+add_journal_arguments(parser)
+add_site_arguments(parser)
+add_metrics_arguments(parser)
+add_retry_arguments(parser)
+cvp_arg = parser.add_argument_group('CVP Arguments')
+cvp_arg.add_argument('--cvp-workers', dest='cvp_workers', default=4, type=int, help='Maximum number of CVP configlet requests in flight (default 4)')
+cvp_arg.add_argument('--task-wait', dest='task_wait', default=15, type=float, help='Seconds to wait for configlet changes to show up as CVP tasks (default 15)')
+cvp_arg.add_argument('--task-timeout', dest='task_timeout', default=600, type=float, help='Seconds to wait for CVP tasks to finish (default 600)')
 args = parser.parse_args()
 data = json.load(args.json)
 
+# Run every data center in the input file as its own parallel run when there is more than one
+data_center = select_data_center(args, data)
+if data_center is None:
+    mlag_ports = has_mlag_ports(args, data)
+    run_sites(args, data, NSX_CREDENTIALS + CVP_CREDENTIALS + (SWITCH_CREDENTIALS if mlag_ports else []))
+site_report = SiteReport(args.site_report, data_center)
+metrics = metrics_from_args(args, 'cvp_add_hardware_binding')
+# Ports come from --ports when it is given.  Its digest goes into data so a resumed run must use the same file.
+switch_ports = port_configs_from_args(args, data, data_center)
+journal = journal_from_args(args, 'cvp_add_hardware_binding', data)
+
 # Set Variables for Login.
-nsx_username = input('NSX Manager Username: ')
-nsx_password = getpass.getpass(prompt='NSX Manager Password: ')
-cvp_username = input('CVP Username: ')
-cvp_password = getpass.getpass(prompt='CVP Password: ')
+nsx_username = prompt_credential('NSX Manager Username: ', 'NSX_USERNAME')
+nsx_password = prompt_credential('NSX Manager Password: ', 'NSX_PASSWORD', secret=True)
+cvp_username = prompt_credential('CVP Username: ', 'CVP_USERNAME')
+cvp_password = prompt_credential('CVP Password: ', 'CVP_PASSWORD', secret=True)
 
 # Set Variables from JSON object for switchport configurations and API Calls.  Ports must be spelled out fully
 # Leave JSON object empty if no ports on that switch need to be configured.  Would need to look like this {}
 tenant_name = data['tenant_name']
 zone_name = data['zone_name']
-data_center = list(data['data_center'].keys())[0]
 nsx_manager = data['data_center'][data_center]['nsx_manager']
 switches = data['data_center'][data_center]['switches']
+# Optional map of switch name to IP address (or address:port) for switches without DNS
+switch_addresses = data['data_center'][data_center].get('switch_addresses', {})
+# Optional request budgets for NSX Manager, CVP and each switch
+limits = EndpointLimits(data['data_center'][data_center].get('limits'))
 cvps = data['data_center'][data_center]['cvps']
-switch_ports = data['port_configs']
+cvp_port = data['data_center'][data_center].get('cvp_port')
+cvp_scope = 'cvp:' + ','.join(sorted(set(cvps)))
 ls_name = 'vls' + data_center + tenant_name + zone_name
 
+# Open one pooled session to NSX Manager for the whole run
+nsx = nsx_client_from_args(args, nsx_manager, nsx_username, nsx_password, metrics=metrics, limits=limits)
+inventory = inventory_from_args(args)
+nsx_scope = 'nsx:' + nsx_manager
+
+# Resolve each switch's Mlag Domain ID at most once, optionally from a cache file.
+mlag_cache = MlagDomainCache(connect_switch, cache_file=args.mlag_cache, ttl=args.mlag_cache_ttl, inventory=inventory)
+
 # Check if any ports designated for binding are Mlag interfaces.
 # If so, have user specify login info for switch to pull Mlag Domain ID.
 for index in range(len(switches)):
     switch_ports_mlag_check = switch_ports[(switches[index])]
     for port, config in switch_ports_mlag_check.items():
         if port.startswith('Port'):
-            if config['is_mlag'] == True:
+            if config['is_mlag'] == True and not mlag_cache.cached(switches[index]):
                 try:
                     switch_username
                 except NameError:
                     print('Mlag port identified for binding. Please enter switch login info for Mlag ID retrieval')
-                    switch_username = input('Switch Username: ')
-                    switch_password = getpass.getpass(prompt='Switch Password: ')
-
-# GET Hardware Binding ID for CVX
-hw_dict = nsx_get('hardwaregateways')
-# Parse out Hardware Binfing ID for later use
-hw_id = hw_dict['list']['hardwareGateway']['objectId']
-
-# GET the list of logical switches to parse out the ID and VNI of the tenant switch
-ls_dict = nsx_get('virtualwires')
-# Find objectId of tenant's logical switch by name
-for item in ls_dict['virtualWires']['dataPage']['virtualWire']:
-    if item['name'] == ls_name:
-        ls_id = item['objectId']
-        ls_vni_id = item['vdnId']
-        vlan_id = ls_vni_id[0] + ls_vni_id[-2:]
+                    switch_username = prompt_credential('Switch Username: ', 'SWITCH_USERNAME')
+                    switch_password = prompt_credential('Switch Password: ', 'SWITCH_PASSWORD', secret=True)
+
+metrics.phase('lookup')
+
+# Look up the hardware gateway ID and the tenant logical switch at the same time
+virtualwires = VirtualWireIndex(nsx, 'virtualwires', page_size=args.nsx_page_size, inventory=inventory)
+with ThreadPoolExecutor(max_workers=2) as pool:
+    hw_future = pool.submit(inventory.fetch, nsx_scope, 'hardware_gateway', '', lambda: first_object_id(nsx.get('hardwaregateways'), 'hardwareGateway'))
+    virtualwire_future = pool.submit(virtualwires.find, ls_name, True)
+
+# Parse out Hardware Binding ID for later use
+hw_id = hw_future.result()
+
+# Pull the ID and VNI of the tenant logical switch found by name
+virtualwire = virtualwire_future.result()
+if virtualwire is None:
+    print('Logical Switch ' + ls_name + ' not found in NSX.  Please verify naming and input file.')
+    sys.exit()
+ls_id = virtualwire.object_id
+ls_vni_id = virtualwire.vdn_id
+vlan_id = ls_vni_id[0] + ls_vni_id[-2:]
 
 # Connect to CVP for configlet push. Loging for the connection is setup to the same dir as the script
-cvp = CvpClient(syslog=True, filename='cvprac_log')
-cvp.connect(cvps, cvp_username, cvp_password)
+# The provisioning service keeps the logged in client for later jobs.
+cvp = keep_warm(('cvp', tuple(cvps), cvp_port, cvp_username, cvp_password), cvp_login)
+wrap_cvp_client(cvp, metrics=metrics, retry_policy=retry_policy_from_args(args), breaker=breaker_from_args(args, 'CVP'), limiter=limits.cvp(cvps))
+configlet_assign_lock = threading.Lock()
 
-# Loop through to generate config and apply via CVP Configlet for each switch.
+# Read every switch's configlet, the existing bindings of the logical switch and the
+# Mlag Domain IDs in one concurrent batch.  Nothing is written until the whole plan is built,
+# so a conflict on any one switch stops the run with every configlet untouched.
+# Switches whose configlet an earlier attempt of this run already updated are left out.
+config_switches = [switch for switch in switches if bool(switch_ports[switch]) == True]
+for switch in config_switches:
+    if journal.done('configlet', switch):
+        print(switch + ' configlet was updated by an earlier attempt of this run.')
+plan_switches = [switch for switch in config_switches if not journal.done('configlet', switch)]
+mlag_switches = [switch for switch in switches if any(port.startswith('Port') and config['is_mlag'] == True for port, config in switch_ports[switch].items())]
+with ThreadPoolExecutor(max_workers=args.cvp_workers + 2) as pool:
+    binding_index_future = pool.submit(BindingIndex, nsx, ls_id, None, inventory)
+    mlag_future = pool.submit(mlag_cache.prefetch, mlag_switches, args.cvp_workers)
+    configlet_futures = dict((switch, pool.submit(switch_configlet_plan, switch, switch_ports[switch])) for switch in plan_switches)
+binding_index = binding_index_future.result()
+mlag_future.result()
+
+# Plan every configlet change and NSX binding before anything is written
+plan = ChangePlan()
+for switch in plan_switches:
+    configlet_change = configlet_futures[switch].result()
+    if configlet_change == 1:
+        print('Exiting script to prevent misconfiguration. Verify ' + switch + ' config data.')
+        sys.exit()
+    if configlet_change is None:
+        print(switch + ' Switchports configlet already matches the input file.')
+        continue
+    plan.add_configlet(configlet_change)
+# Tasks are only waited for on switches whose configlet changes in this run or in the attempt being resumed.
+changed_switches = set(configlet_change.switch for configlet_change in plan.configlets)
+task_switches = [switch for switch in config_switches
+                 if not journal.done('task', switch) and (switch in changed_switches or journal.done('configlet', switch))]
+binding_executor = HardwareBindingExecutor(nsx, ls_id, ls_name, hw_id, binding_index, mlag_lookup=mlag_cache.lookup, max_workers=args.binding_workers,
+                                           journal=journal, reconcile=args.reconcile)
 for index in range(len(switches)):
-    if bool(switch_ports[(switches[index])]) == True:
-        switch_push = switch_configlet_update(switches[index], switch_ports[(switches[index])])
-        if switch_push == 1:
-            print('Exiting script to prevent misconfiguration. Verify ' + switches[index] + ' config data.')
-            sys.exit()
+    binding_executor.add_switch(switches[index], switch_ports[(switches[index])], vlan_id)
+binding_executor.plan()
+plan.add_bindings(binding_executor)
+if not review_plan(plan, args.apply):
+    site_report.finish('planned')
+    mlag_cache.save()
+    inventory.close()
+    nsx.close()
+    sys.exit()
+journal.announce()
+
+# Push every planned configlet change to CVP at once
+metrics.phase('switch config')
+with ThreadPoolExecutor(max_workers=args.cvp_workers) as pool:
+    list(pool.map(switch_configlet_apply, plan.configlets))
 
 # Execute pending tasks in CVP to push updated configlets to switches
-# Add wait time before to ensure configlet changes are registered as tasks
-print('All configlets updated.  Pushing Tasks via CVP...')
-time.sleep(5)
-execute_pending_tasks()
+metrics.phase('task execution')
+if task_switches:
+    print('All configlets updated.  Pushing Tasks via CVP...')
+    task_results = execute_pending_tasks(task_switches)
+    # Don't bind ports whose config never reached the switch.
+    for switch in incomplete_switches(task_switches, task_results):
+        print('CVP task for ' + switch + ' did not complete.  Its ports are left unbound.')
+        binding_executor.fail_switch(switch, 'CVP task for ' + switch + ' did not complete')
 
-# Check if switch01 has ports for binding, then call function to bind ports
-for index in range(len(switches)):
-    nsx_hardware_binding(switches[index], switch_ports[(switches[index])], vlan_id)
\ No newline at end of file
+# Send the planned bindings to NSX concurrently
+metrics.phase('binding')
+binding_results = binding_executor.run()
+binding_executor.print_summary()
+binding_index.save()
+mlag_cache.save()
+if not binding_executor.failures():
+    journal.finish()
+site_report.finish('partial' if binding_executor.failures() else 'applied', binding_results, [(ls_name, 'bound')])
+
+# Report NSX Manager connection reuse and any throttling for the run
+nsx.print_stats()
+limits.print_stats()
+inventory.print_stats()
+inventory.close()
+nsx.close()
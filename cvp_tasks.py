@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+
+# BSD 3-Clause License
+#
+# Copyright (c) 2018, Arista Networks EOS+
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name Arista nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+'''
+Helpers for running CloudVision Portal tasks without fixed waits.
+
+Instead of sleeping a set amount of time after every task, all matching
+tasks are submitted up front.  Their status is then polled with an adaptive
+backoff, and each task is reported as soon as it reaches a terminal state.
+
+Created by Dimitri Capetz - dcapetz@arista.com
+'''
+
+# Import time for polling intervals, task latency and call timings
+# Import json for sizing CVP requests and responses in the run metrics
+# Import requests and the cvprac errors to know which failures are worth retrying
+# Import the retry and circuit breaker helpers
+import time
+import json
+import requests
+from cvprac.cvp_client_errors import CvpRequestError
+from metrics import uri_pattern
+from resilience import CircuitOpenError, retry_call
+
+# CVP task states that will not change any further
+TERMINAL_STATES = ('Completed', 'Failed', 'Cancelled')
+
+# Reasons in a cvprac request error that mean CVP turned the request away unprocessed
+BUSY_REASONS = ('Too Many Requests', 'Bad Gateway', 'Service Unavailable', 'Gateway Timeout')
+
+class CvpBusy(CvpRequestError):
+    ''' CVP answered a request with a busy status, so it was never processed. '''
+
+def wrap_cvp_client(cvp, metrics=None, retry_policy=None, breaker=None, limiter=None):
+    ''' Wrap the get and post calls of a cvprac CvpClient.  Every CVP API call
+        is recorded in the run metrics, GETs that fail on a connection error,
+        timeout or HTTP error are retried with backoff, and all calls go
+        through the CVP circuit breaker.  POSTs are only retried when CVP
+        answered with a busy status, as the change was never applied.
+
+    Args:
+        cvp (class): The CvpClient for the run
+        metrics (class): Optional Metrics collector
+        retry_policy (class): Optional RetryPolicy for CVP calls
+        breaker (class): Optional CircuitBreaker for the CVP cluster
+        limiter (class): Optional RateLimiter every CVP call waits on
+    '''
+    # A client kept warm by the provisioning service is wrapped again for each job, around the original calls.
+    client_get = getattr(cvp, 'unwrapped_get', cvp.get)
+    client_post = getattr(cvp, 'unwrapped_post', cvp.post)
+    cvp.unwrapped_get = client_get
+    cvp.unwrapped_post = client_post
+
+    def call(method, url, attempt, retry_exceptions, request_bytes):
+        started = time.monotonic()
+        try:
+            response, retries = retry_call(attempt, retry_policy, breaker, retry_exceptions=retry_exceptions, limiter=limiter)
+        except CircuitOpenError as error:
+            if metrics is not None:
+                metrics.record('cvp', method + ' ' + uri_pattern(url), time.monotonic() - started, request_bytes=request_bytes, error=True)
+            # Surface an open breaker the same way as a CVP cluster that can't be reached.
+            raise CvpRequestError(str(error))
+        except Exception:
+            if metrics is not None:
+                metrics.record('cvp', method + ' ' + uri_pattern(url), time.monotonic() - started, request_bytes=request_bytes, error=True)
+            raise
+        if metrics is not None and metrics.enabled:
+            metrics.record('cvp', method + ' ' + uri_pattern(url), time.monotonic() - started, request_bytes=request_bytes,
+                           response_bytes=len(json.dumps(response)), retries=retries)
+        return response
+
+    def get(url, *args, **kwargs):
+        return call('GET', url, lambda: client_get(url, *args, **kwargs),
+                    (requests.ConnectionError, requests.Timeout, CvpRequestError), 0)
+
+    def post_once(url, data, *args, **kwargs):
+        try:
+            return client_post(url, data, *args, **kwargs)
+        except CvpRequestError as error:
+            if any(reason in str(error) for reason in BUSY_REASONS):
+                raise CvpBusy(str(error))
+            raise
+
+    def post(url, data=None, *args, **kwargs):
+        request_bytes = len(json.dumps(data)) if metrics is not None and metrics.enabled and data is not None else 0
+        return call('POST', url, lambda: post_once(url, data, *args, **kwargs), (CvpBusy,), request_bytes)
+
+    cvp.get = get
+    cvp.post = post
+
+class TaskBackoff(object):
+    ''' Adaptive poll interval.  Starts short so fast tasks return quickly
+        and grows each time nothing changes, up to a ceiling.
+
+    Args:
+        initial (float): First poll interval in seconds
+        maximum (float): Longest poll interval in seconds
+        factor (float): Growth applied when a poll sees no progress
+    '''
+
+    def __init__(self, initial=0.5, maximum=5, factor=1.5):
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.interval = initial
+
+    def progress(self):
+        ''' Something changed, so drop back to the shortest interval '''
+        self.interval = self.initial
+
+    def wait(self):
+        ''' Sleep for the current interval and grow it for next time '''
+        time.sleep(self.interval)
+        self.interval = min(self.interval * self.factor, self.maximum)
+
+class TaskResult(object):
+    ''' Outcome and latency of a single CVP task '''
+    __slots__ = ('task_id', 'switch', 'status', 'submitted', 'finished')
+
+    def __init__(self, task_id, switch):
+        self.task_id = task_id
+        self.switch = switch
+        self.status = 'Pending'
+        self.submitted = None
+        self.finished = None
+
+    @property
+    def latency(self):
+        if self.submitted is None or self.finished is None:
+            return None
+        return self.finished - self.submitted
+
+def matching_pending_tasks(cvp, switches, username):
+    ''' Pull pending configlet tasks for the given switches created by the given user
+
+    Args:
+        cvp (class): The connected CvpClient
+        switches (list): The switch hostnames from the input file
+        username (str): The CVP user running the script
+
+    Returns:
+        tasks (list): The matching pending task dictionaries
+    '''
+    tasks = []
+    for task in cvp.api.get_tasks_by_status('Pending'):
+        if task['description'].startswith('Configlet Assign'):
+            if task['workOrderDetails']['netElementHostName'] in switches:
+                if task['createdBy'] == username:
+                    tasks.append(task)
+    return tasks
+
+def wait_for_pending_tasks(cvp, switches, username, timeout=15):
+    ''' Poll until CVP has registered a pending task for every switch, or until timeout.
+        Replaces a fixed wait after the configlets are updated.
+
+    Args:
+        cvp (class): The connected CvpClient
+        switches (list): The switch hostnames that had configlet changes
+        username (str): The CVP user running the script
+        timeout (float): Longest time in seconds to wait for tasks to show up
+
+    Returns:
+        tasks (list): The matching pending task dictionaries
+    '''
+    backoff = TaskBackoff()
+    deadline = time.time() + timeout
+    tasks = matching_pending_tasks(cvp, switches, username)
+    while time.time() < deadline:
+        task_switches = set(task['workOrderDetails']['netElementHostName'] for task in tasks)
+        if task_switches.issuperset(switches):
+            break
+        backoff.wait()
+        tasks = matching_pending_tasks(cvp, switches, username)
+    return tasks
+
+def execute_tasks(cvp, tasks, timeout=600):
+    ''' Submit every task, then poll them all until each one reaches a terminal state
+
+    Args:
+        cvp (class): The connected CvpClient
+        tasks (list): Pending task dictionaries from matching_pending_tasks
+        timeout (float): Longest time in seconds to wait for all tasks to finish
+
+    Returns:
+        results (list): TaskResult objects in the order the tasks were given
+    '''
+    results = []
+    for task in tasks:
+        result = TaskResult(task['workOrderId'], task['workOrderDetails']['netElementHostName'])
+        cvp.api.execute_task(result.task_id)
+        result.submitted = time.time()
+        results.append(result)
+    backoff = TaskBackoff()
+    deadline = time.time() + timeout
+    running = list(results)
+    while running and time.time() < deadline:
+        backoff.wait()
+        still_running = []
+        for result in running:
+            task = cvp.api.get_task_by_id(result.task_id)
+            if task is not None:
+                result.status = task['workOrderUserDefinedStatus']
+            if result.status in TERMINAL_STATES:
+                result.finished = time.time()
+                print('Task ' + result.task_id + ' on ' + result.switch + ' ' + result.status +
+                      ' after ' + '{:.1f}'.format(result.latency) + 's')
+                print_task_logs(cvp, result.task_id)
+            else:
+                still_running.append(result)
+        if len(still_running) < len(running):
+            backoff.progress()
+        running = still_running
+    for result in running:
+        print('Task ' + result.task_id + ' on ' + result.switch + ' still ' + result.status +
+              ' after ' + str(timeout) + 's.  Verify in CVP.')
+    return results
+
+def incomplete_switches(switches, results):
+    ''' Find the switches whose configlet changes didn't reach them
+
+    Args:
+        switches (list): The switches tasks were executed for
+        results (list): TaskResult objects from execute_tasks
+
+    Returns:
+        switches (list): Each switch with no task, or with a task that failed, was cancelled or timed out
+    '''
+    completed = set(result.switch for result in results if result.status == 'Completed')
+    failed = set(result.switch for result in results if result.status != 'Completed')
+    return [switch for switch in switches if switch not in completed or switch in failed]
+
+def print_task_logs(cvp, task_id):
+    ''' Print the configlet push response lines from a finished task's logs
+
+    Args:
+        cvp (class): The connected CvpClient
+        task_id (str): The CVP task ID
+    '''
+    task_logs = cvp.api.get_logs_by_id(task_id)
+    for index in range(len(task_logs['data'])):
+        if task_logs['data'][index]['logDetails'].startswith('Configlet push response') == True:
+            print('Task ' + task_id + ' - ' + task_logs['data'][index]['logDetails'] + ' - ' + task_logs['data'][index]['objectName'])
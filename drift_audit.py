@@ -0,0 +1,351 @@
+#!/usr/bin/env python
+
+# BSD 3-Clause License
+#
+# Copyright (c) 2018, Arista Networks EOS+
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name Arista nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+'''
+In memory join of NSX hardware bindings against the switchport config of a
+fabric, for finding where the two have drifted apart.
+
+Every binding on every logical switch is indexed by the switch and port NSX
+knows it by (mlag-<domain> and Mlag<N> for an Mlag Port-channel).  Each
+switch's interface config is parsed into the mode and vlans of its ports and
+joined against the index one switch at a time, so the mismatches of a switch
+can be written out as soon as its config has been read.
+
+A binding matches when its port is configured and carries the bound vlan.
+An access binding (vlan 0) needs an access port on the logical switch's vlan
+and a trunk binding needs a trunk port that allows the bound vlan.  The other
+way round, a port that carries the vlan of a logical switch without a binding
+for it is reported as well.  Only vlans listed on their own count for that,
+so uplinks that allow a range of vlans aren't reported.  A binding NSX
+returns without a vlan is reported on its own.
+
+Created by Dimitri Capetz - dcapetz@arista.com
+'''
+
+# Import OrderedDict and namedtuple for the index and mismatch records
+# Import re for reading the show mlag text
+# Import threading to keep the index safe across workers
+from collections import OrderedDict, namedtuple
+import re
+import threading
+
+# One NSX hardware binding, with the vlan its logical switch is configured on the switches
+Binding = namedtuple('Binding', ['logical_switch', 'ls_id', 'binding_id', 'nsx_switch', 'nsx_port', 'vlan', 'ls_vlan'])
+
+ALL_VLANS = frozenset(range(1, 4095))
+
+def ls_vlan(vdn_id):
+    ''' Work out the switch vlan of a logical switch the same way the scripts do
+
+    Args:
+        vdn_id (str): The VNI of the logical switch, like 5001
+
+    Returns:
+        vlan_id (str): The vlan ID, like 501
+    '''
+    return vdn_id[0] + vdn_id[-2:]
+
+def vlan_list(text):
+    ''' Expand an EOS vlan list like 10,20-22
+
+    Args:
+        text (str): The vlan list
+
+    Returns:
+        vlans (set), singles (set): Every vlan in the list, and the ones listed on their own rather than in a range
+    '''
+    vlans = set()
+    singles = set()
+    for item in text.split(','):
+        if '-' in item:
+            first, last = item.split('-', 1)
+            vlans.update(range(int(first), int(last) + 1))
+        elif item:
+            vlans.add(int(item))
+            singles.add(int(item))
+    return vlans, singles
+
+def interface_sections(text):
+    ''' Split the text of a full running-config into the lines of each interface
+
+    Args:
+        text (str): The output of show running-config
+
+    Returns:
+        interfaces (OrderedDict): Interface name to its stripped config lines
+    '''
+    interfaces = OrderedDict()
+    lines = None
+    for line in text.splitlines():
+        if line.startswith('interface '):
+            lines = interfaces.setdefault(line[len('interface '):].strip(), [])
+        elif line.startswith(' ') and lines is not None:
+            lines.append(line.strip())
+        else:
+            lines = None
+    return interfaces
+
+def mlag_domain_from_text(text):
+    ''' Pull the domain ID out of the text of show mlag
+
+    Args:
+        text (str): The output of show mlag
+
+    Returns:
+        mlag_domain (str): The domain ID, None if mlag isn't configured
+    '''
+    match = re.search(r'^domain-id[ \t]*:[ \t]*(\S+)', text, re.MULTILINE)
+    if match is None:
+        return None
+    return match.group(1)
+
+class PortVlans(object):
+    ''' The mode and vlans of one interface, worked out from its config lines.
+        Running-configs leave defaults out, so a port without a switchport
+        mode line is an access port on vlan 1 and a trunk without an allowed
+        list allows every vlan.
+
+    Args:
+        lines (list): The config lines of the interface
+    '''
+    __slots__ = ('mode', 'access_vlan', 'native_vlan', 'allowed', 'listed', 'mlag', 'member', 'switchport_lines')
+
+    def __init__(self, lines):
+        self.mode = 'access'
+        self.access_vlan = 1
+        self.native_vlan = None
+        self.allowed = None
+        self.listed = set()
+        self.mlag = False
+        self.member = False
+        self.switchport_lines = []
+        for line in lines:
+            if line.startswith('switchport '):
+                self.switchport_lines.append(line)
+            if line.startswith('switchport mode '):
+                self.mode = line[len('switchport mode '):].strip()
+            elif line.startswith('switchport access vlan '):
+                self.access_vlan = int(line.split()[-1])
+            elif line.startswith('switchport trunk native vlan ') and line.split()[-1].isdigit():
+                self.native_vlan = int(line.split()[-1])
+            elif line.startswith('switchport trunk allowed vlan '):
+                self.allow(line[len('switchport trunk allowed vlan '):].split())
+            elif line.startswith('mlag '):
+                self.mlag = True
+            elif line.startswith('channel-group '):
+                self.member = True
+
+    def allow(self, words):
+        ''' Apply one switchport trunk allowed vlan line, which EOS splits into add lines for long lists '''
+        action = None
+        if words[0] in ('add', 'remove', 'except'):
+            action = words[0]
+            words = words[1:]
+        if words[0] == 'all':
+            vlans, singles = set(ALL_VLANS), set()
+        elif words[0] == 'none':
+            vlans, singles = set(), set()
+        else:
+            vlans, singles = vlan_list(words[0])
+        if action is None:
+            self.allowed = vlans
+            self.listed = singles
+        elif action == 'add':
+            if self.allowed is not None:
+                self.allowed |= vlans
+            self.listed |= singles
+        elif action == 'remove':
+            self.allowed = (set(ALL_VLANS) if self.allowed is None else self.allowed) - vlans
+            self.listed -= vlans
+        else:
+            self.allowed = set(ALL_VLANS) - vlans
+            self.listed = set()
+
+    def carries(self, vlan):
+        ''' Check if a trunk port allows a vlan '''
+        return self.allowed is None or vlan in self.allowed
+
+    @property
+    def found(self):
+        ''' The switchport config of the port, for a mismatch record '''
+        return '; '.join(self.switchport_lines) or 'switchport defaults'
+
+class BindingAudit(object):
+    ''' Index of every NSX binding, joined against the switches of the fabric one at a time
+
+    Args:
+        data_center (str): The data center written into every record
+        check_unbound (bool): Also report ports that carry the vlan of a logical switch without a binding for it
+    '''
+
+    def __init__(self, data_center, check_unbound=True):
+        self.data_center = data_center
+        self.check_unbound = check_unbound
+        self.lock = threading.Lock()
+        self.by_switch = {}
+        self.by_vlan = {}
+        self.audited = set()
+        self.counts = {}
+        self.bindings = 0
+
+    def add_logical_switch(self, virtualwire, binding_index):
+        ''' Index every binding of one logical switch
+
+        Args:
+            virtualwire (namedtuple): The VirtualWire of the logical switch
+            binding_index (class): Its BindingIndex.  One read from the inventory has no binding IDs.
+        '''
+        vlan_id = ls_vlan(virtualwire.vdn_id)
+        with self.lock:
+            self.by_vlan.setdefault(int(vlan_id), []).append(virtualwire.name)
+            for (switch_name, port_name), vlan in binding_index.bindings.items():
+                binding = Binding(virtualwire.name, virtualwire.object_id, binding_index.binding_id(switch_name, port_name),
+                                  switch_name, port_name, vlan, vlan_id)
+                self.by_switch.setdefault(switch_name, {}).setdefault(port_name, []).append(binding)
+                self.bindings += 1
+
+    @property
+    def has_mlag(self):
+        ''' True if any binding is on an Mlag Port-channel '''
+        return any(switch_name.startswith('mlag-') for switch_name in self.by_switch)
+
+    def record(self, kind, switch, port, binding=None, expected=None, found=None, logical_switch=None):
+        ''' Build one mismatch record and count it '''
+        with self.lock:
+            self.counts[kind] = self.counts.get(kind, 0) + 1
+        return OrderedDict([('data_center', self.data_center), ('kind', kind), ('switch', switch), ('port', port),
+                            ('logical_switch', binding.logical_switch if binding else logical_switch),
+                            ('ls_id', binding.ls_id if binding else None), ('binding_id', binding.binding_id if binding else None),
+                            ('nsx_switch', binding.nsx_switch if binding else None), ('nsx_port', binding.nsx_port if binding else None),
+                            ('vlan', binding.vlan if binding else None), ('expected', expected), ('found', found)])
+
+    def check_binding(self, switch, port, binding, port_vlans):
+        ''' Compare one binding with the config of the port it lands on
+
+        Returns:
+            record (OrderedDict): The mismatch record, None if the port matches
+        '''
+        if binding.vlan == '0':
+            expected = 'switchport mode access; switchport access vlan ' + binding.ls_vlan
+        else:
+            expected = 'switchport mode trunk; switchport trunk allowed vlan ' + binding.vlan
+        if not (binding.vlan or '').isdigit():
+            # NSX can hand back a binding without a vlan, which no port config can match.
+            return self.record('vlan_missing', switch, port, binding, 'a binding vlan', 'no vlan on the binding')
+        if port_vlans is None or port_vlans.member:
+            return self.record('interface_missing', switch, port, binding, expected, 'no interface config')
+        if binding.vlan == '0':
+            if port_vlans.mode != 'access':
+                return self.record('mode_mismatch', switch, port, binding, expected, port_vlans.found)
+            if port_vlans.access_vlan != int(binding.ls_vlan):
+                return self.record('vlan_mismatch', switch, port, binding, expected, port_vlans.found)
+        else:
+            if port_vlans.mode != 'trunk':
+                return self.record('mode_mismatch', switch, port, binding, expected, port_vlans.found)
+            if not port_vlans.carries(int(binding.vlan)):
+                return self.record('vlan_mismatch', switch, port, binding, expected, port_vlans.found)
+        return None
+
+    def unbound_vlans(self, port_vlans, bindings):
+        ''' Find the logical switch vlans a port carries without a binding for them
+
+        Returns:
+            vlans (list): The vlan IDs, in order
+        '''
+        if port_vlans.mode == 'access':
+            if any(binding.vlan == '0' and int(binding.ls_vlan) == port_vlans.access_vlan for binding in bindings):
+                return []
+            carried = set([port_vlans.access_vlan])
+        elif port_vlans.mode == 'trunk':
+            carried = set(port_vlans.listed)
+            if port_vlans.native_vlan is not None:
+                carried.add(port_vlans.native_vlan)
+            carried -= set(int(binding.vlan) for binding in bindings if (binding.vlan or '').isdigit())
+        else:
+            return []
+        return sorted(vlan for vlan in carried if vlan in self.by_vlan)
+
+    def audit_switch(self, switch, mlag_domain, interfaces, interfaces_only=False):
+        ''' Join the config of one switch against the binding index
+
+        Args:
+            switch (str): The name of the switch
+            mlag_domain (str): Its mlag domain ID, None if it isn't in an Mlag pair
+            interfaces (dict): Interface name to its config lines
+            interfaces_only (bool): Only check bindings on the interfaces given, when only part of the switch was read
+
+        Returns:
+            records (list): The mismatch records of the switch
+        '''
+        ports = dict((name, PortVlans(lines)) for name, lines in interfaces.items())
+        mlag_switch = 'mlag-' + mlag_domain if mlag_domain else None
+        with self.lock:
+            self.audited.update(name for name in (switch, mlag_switch) if name)
+        records = []
+        for nsx_switch in (switch, mlag_switch):
+            for nsx_port, bindings in self.by_switch.get(nsx_switch, {}).items():
+                port = nsx_port if nsx_switch == switch else 'Port-channel' + nsx_port[len('Mlag'):]
+                if interfaces_only and port not in ports:
+                    continue
+                for binding in bindings:
+                    record = self.check_binding(switch, port, binding, ports.get(port))
+                    if record is not None:
+                        records.append(record)
+        if not self.check_unbound:
+            return records
+        for port, port_vlans in ports.items():
+            if port_vlans.member or not (port.startswith('Ethernet') or port.startswith('Port-channel')):
+                continue
+            if port.startswith('Port') and port_vlans.mlag and mlag_switch:
+                bindings = self.by_switch.get(mlag_switch, {}).get('Mlag' + port[len('Port-channel'):], [])
+            else:
+                bindings = self.by_switch.get(switch, {}).get(port, [])
+            for vlan in self.unbound_vlans(port_vlans, bindings):
+                logical_switches = self.by_vlan[vlan]
+                records.append(self.record('binding_missing', switch, port, expected='NSX binding to ' + ' or '.join(logical_switches),
+                                           found=port_vlans.found, logical_switch=logical_switches[0] if len(logical_switches) == 1 else None))
+        return records
+
+    def unaudited(self):
+        ''' Records for every binding on a switch or mlag domain that no audited switch answered for
+
+        Returns:
+            records (list): One switch_not_audited record per binding
+        '''
+        records = []
+        for nsx_switch in sorted(self.by_switch):
+            if nsx_switch in self.audited:
+                continue
+            for nsx_port, bindings in sorted(self.by_switch[nsx_switch].items()):
+                for binding in bindings:
+                    records.append(self.record('switch_not_audited', None, None, binding, found='no switch in the fabric answers for ' + nsx_switch))
+        return records
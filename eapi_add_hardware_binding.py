@@ -44,368 +44,311 @@ the eAPI of each VTEP switch directly.  If you have CVP implemented in your
 environment, I recommend using the CVP API based script so as to avoid any
 reconciliation issues.
 
+Nothing is changed unless the script is run with --apply.  Without it, every
+switch and NSX Manager is read and the planned switch config and bindings
+are printed for review.  With --reconcile the input file is the desired state:
+ports that are already configured are compared with it line by line and only
+the missing config and bindings are planned.
+
 Please note that all SSL verification is disabled.  If you have signed certs
-in place for NSX Manager, you can remove the urllib3 section and verify option
-in the requests.
+in place for NSX Manager, you can set verify=True where the NsxClient is
+built in nsx_client.py.
 
 Created by Dimitri Capetz - dcapetz@arista.com
 '''
 
-# Import requests for API Calls to NSX Manager
-# Import xmltodict and dicttoxml for working with XML
-# Import getpass for password prompt
+# Import the shared NSX client for pooled API Calls to NSX Manager
+# Import the paged logical switch lookup
+# Import the NSX XML codec for reading the hardware gateway
+# Import the binding index and executor for concurrent hardware bindings
+# Import the eAPI helpers for switch connections and cached Mlag domain lookups
+# Import the reconcile helpers for comparing running-configs with the input file
+# Import the switchport config templates shared with the CVP script
+# Import the streaming port file reader for large inventories
+# Import the change plan for reviewing changes before they are made
+# Import the run metrics for per phase timings
+# Import the retry and circuit breaker settings
+# Import the per data center request budgets
+# Import the inventory cache for NSX and fabric state kept between runs
+# Import the run journal for resuming interrupted runs
+# Import the credential prompts and the multi data center runner
 # Import argparse for pulling in file input via command line
 # Import json for working with json objects
 # Import pyEAPI for configuration of Arista Switches
+# Import concurrent.futures for configuring switches in parallel
+# Import uuid for naming EOS config sessions
 # Import sys for various error handling
-import requests
-import xmltodict
-from dicttoxml import dicttoxml
-import getpass
+from nsx_client import add_nsx_arguments, nsx_client_from_args
+from nsx_virtualwires import VirtualWireIndex
+from nsx_xml import first_object_id
+from nsx_bindings import BindingIndex, HardwareBindingExecutor, add_binding_arguments
+from eapi_client import MlagDomainCache, add_mlag_cache_arguments, eapi_connect
+from reconcile import config_delta, config_lines
+from switchport_config import PORT_MODES, eapi_commands, switch_port_records
+from metrics import add_metrics_arguments, metrics_from_args
+from rate_limit import EndpointLimits
+from inventory import add_inventory_arguments, inventory_from_args
+from journal import add_journal_arguments, journal_from_args
+from credentials import NSX_CREDENTIALS, SWITCH_CREDENTIALS, prompt_credential
+from sites import SiteReport, add_site_arguments, run_sites, select_data_center
+from resilience import add_retry_arguments, breaker_from_args, retry_policy_from_args
+from port_inventory import add_port_arguments, port_configs_from_args
+from change_plan import ChangePlan, add_plan_arguments, review_plan
 import argparse
 import json
 import pyeapi
+from concurrent.futures import ThreadPoolExecutor
+import uuid
 import sys
 
-# Disable Cert Warnings for Test Environment
-import urllib3
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-
-def nsx_get(uri):
-    ''' Make generic HTTP GET to NSX Manager
-        
-        Args:
-            uri (str): The uri to call
-        
-        Returns:
-            response (dict): The response body of the HTTP GET
-    '''
-    nsx_url = 'https://' + nsx_manager + '/api/2.0/vdn/' # All calls will be to this base URL
-    try:
-        get_response = requests.get(nsx_url + uri, auth=(nsx_username, nsx_password), verify=False, timeout=5)
-        if get_response.status_code == 403:
-            print('Unable to login to NSX Manager. Verify username and password.')
-            sys.exit()
-        if get_response.status_code == 404:
-            print('URI not found. Verify NSX Manager IP and JSON input file. If NSX was recently upgraded, verify any API changes in release notes.')
-            sys.exit()
-        else:
-            get_dict = xmltodict.parse(get_response.content, dict_constructor=dict)
-            return get_dict
-    except requests.ConnectionError:
-        print('Failed to connect to NSX Manager. Verify reachability.')
-        sys.exit()
-
-def nsx_post(uri, body_dict, xml_root):
-    ''' Make generic HTTP POST to NSX Manager
-        
-        Args:
-            uri (str): The uri to call
-            body_dict (dict): A dictionary containing the body of the request to be sent
-            xml_root (str): The custom XML Root need to place the body in the correct structure
-        
-        Returns:
-            response (str): The response of the HTTP POST
-    '''
-    nsx_url = 'https://' + nsx_manager + '/api/2.0/vdn/' # All calls will be to this base URL
-    headers = {'Content-Type': 'application/xml'} # Headers required for HTTP POSTs
-    try:
-        post_xml = dicttoxml(body_dict, custom_root=xml_root, attr_type=False)
-        post_response = requests.post(nsx_url + uri, auth=(nsx_username, nsx_password), headers=headers, data=post_xml, verify=False, timeout=5)
-        return post_response
-    except requests.ConnectionError:
-        print('Failed to connect to NSX Manager. Verify reachability.')
-        sys.exit()
+def connect_switch(switch):
+    ''' Connect to a switch over eAPI with the credentials, metrics, retry settings and request budget of the run
 
-def eapi_connect(switch):
-    ''' Connect to eAPI interface of Arista Switch
-    
     Args:
         switch (str): The IP address or FQDN of the Arista switch
-    
+
     Returns:
-        switch_node (class): The connected node of the function call that can be used for show or config commands.
+        switch_node (class): The connected pyeapi node
     '''
-    switch_conn = pyeapi.client.connect(transport='https', host=switch, username=switch_username, password=switch_password)
-    switch_node = pyeapi.client.Node(switch_conn)
-    return switch_node
+    return eapi_connect(switch, switch_username, switch_password, switch_addresses.get(switch), metrics=metrics,
+                        retry_policy=retry_policy_from_args(args), breaker=breaker_from_args(args, 'switch ' + switch),
+                        limiter=limits.switch(switch))
 
-def eapi_switchport_config_check(switch_node, port):
-    ''' Check to see if a switchport already has configuration in
-        place.  If it does, return a value of 1 for error handling.
+def eapi_switchport_running_config(switch_node, ports):
+    ''' Read the running-config of a list of switchports.  Every port is read
+        in a single eAPI request.
     
     Args:
         switch_node (class): The connected node of the function call that can be used for show or config commands.
-        port (str): The interface ID to check
+        ports (list): The interface IDs to read
     
     Returns:
-        port_config_exception (int): A value to check if port is configured. 1 indicates config is present
+        running_configs (dict): Interface ID to its config lines, an empty list for a port with no configuration
     '''
-    # Validate port config.  Only way to do this today is by length of configuration.
-    # Once the command is fully JSONized, this can be refined.  But length should be 100% accurate measure.
-    port_config = switch_node.enable('show running-config interfaces ' + port)
-    if len(port_config[0]['result']['output']) > 26:
-        port_config_exception = 1
-        return port_config_exception
-    else:
-        port_config_exception = 0
-        return port_config_exception
+    port_configs = switch_node.enable(['show running-config interfaces ' + port for port in ports], encoding='text', strict=True)
+    return dict((port, config_lines(port_config['result']['output'])) for port, port_config in zip(ports, port_configs))
+
+def switchport_config_preflight(switch, switch_ports):
+    ''' Connect to a switch and verify none of the ports to be configured
+        already have configuration present.  In reconcile mode existing
+        configuration is expected and kept for planning the difference.
+        Nothing is changed on the switch.
 
-def switchport_config_update(switch, switch_ports):
-    ''' Generate switchport configurations and push to switches via
-        Arista eAPI
-    
     Args:
         switch (str): The IP address or FQDN of the Arista switch
         switch_ports (dict): A dictionary containing configuration attributes
+
+    Returns:
+        switch_node (class), running_configs (dict): The connected node and the running-config lines of
+            every port, or None if a conflict was found
     '''
-    switch_node = eapi_connect(switch)
-    # Loop through to configure switchports in input JSON file.
+    switch_node = connect_switch(switch)
+    print('Checking current status of ' + switch + ' ports before configuration begins...')
+    ports_to_check = []
     for port, config in switch_ports.items():
-        print('Checking current status of ' + switch + ' ' + port + ' before configuration begins...')
-        port_config = switch_node.enable('show running-config interfaces ' + port)
-        # Validate if port already has existing config.  If it does, it will not be configured.
-        if eapi_switchport_config_check(switch_node, port) > 0:
-            print(switch + ' ' + port + ' already has configuration present.')
-            return 1
-        if port.startswith('Port'):
-            print('Adding member interfaces to ' + switch + ' ' + port)
-            # Pull out port-channel ID
-            port_channel_id = (port.split('l'))[1]
-            # Assign member interfaces to port-channel
-            for index in range(len(config['local_members'])):
-                print('Configuring ' + switch + ' ' + port + ' member interfaces...')
-                member_config = switch_node.enable('show running-config interfaces ' + config['local_members'][index])
-                if eapi_switchport_config_check(switch_node, config['local_members'][index]) > 0:
-                    print(switch + ' ' + config['local_members'][index] + ' already has configuration present')
-                    return 1
-                switch_node.config(
-                    [
-                        'interface ' + config['local_members'][index],
-                        'description ' + config['description'],
-                        'channel-group ' + port_channel_id + ' mode active',
-                        'speed forced ' + config['speed'],
-                        'no shutdown'
-                    ]
-                )
-        # Apply correct configuration template based on mode.  These templates can be changed at will.
-        if config['mode'] == 'trunk':
-            print('Configuring ' + switch + ' ' + port + '...')
-            switch_node.config(
-                [
-                    'interface ' + port,
-                    'description ' + config['description'],
-                    'switchport trunk allowed vlan ' + vlan_id,
-                    'switchport mode trunk',
-                    'no shutdown'
-                ]
-            )
-            if port.startswith('Port'):
-                if config['is_mlag'] == True:
-                    switch_node.config(
-                        [
-                            'interface ' + port,
-                            'mlag ' + port_channel_id
-                        ]
-                    )
-            if not port.startswith('Port'):
-                switch_node.config(
-                    [
-                        'interface ' + port,
-                        'speed forced ' + config['speed']
-                    ]
-                )
-            print(switch + ' ' + port + ' configured')
-        elif config['mode'] == 'trunk native':
-            print('Configuring ' + switch + ' ' + port + '...')
-            switch_node.config(
-                [
-                    'interface ' + port,
-                    'description ' + config['description'],
-                    'switchport trunk native vlan ' + vlan_id,
-                    'switchport mode trunk',
-                    'no shutdown'
-                ]
-            )
-            if port.startswith('Port'):
-                if config['is_mlag'] == True:
-                    switch_node.config(
-                        [
-                            'interface ' + port,
-                            'mlag ' + port_channel_id
-                        ]
-                    )
-            if not port.startswith('Port'):
-                switch_node.config(
-                    [
-                        'interface ' + port,
-                        'speed forced ' + config['speed']
-                    ]
-                )
-            print(switch + ' ' + port + ' configured')
-        elif config['mode'] == 'access':
-            print('Configuring ' + switch + ' ' + port + '...')
-            switch_node.config(
-                [
-                    'interface ' + port,
-                    'description ' + config['description'],
-                    'switchport access vlan ' + vlan_id,
-                    'switchport mode access',
-                    'no shutdown'
-                ]
-            )
-            if port.startswith('Port'):
-                if config['is_mlag'] == True:
-                    switch_node.config(
-                        [
-                            'interface ' + port,
-                            'mlag ' + port_channel_id
-                        ]
-                    )
-            if not port.startswith('Port'):
-                switch_node.config(
-                    [
-                        'interface ' + port,
-                        'speed forced ' + config['speed']
-                    ]
-                )
-            print(switch + ' ' + port + ' configured')
-        else:
+        if config['mode'] not in PORT_MODES:
             print('Incorrect Port Mode Selection for ' + switch + ' ' + port + '. Please verify port configurations.  Valid options are trunk, trunk native and access.')
-            sys.exit()
-    print('Saving ' + switch + ' configuration...')
-    switch_node.enable('write')
-    return
+            return None
+        ports_to_check.append(port)
+        if port.startswith('Port'):
+            ports_to_check.extend(config['local_members'])
+    # Validate if ports already have existing config.  If they do, the switch will not be configured.
+    running_configs = eapi_switchport_running_config(switch_node, ports_to_check)
+    configured_ports = [port for port in ports_to_check if running_configs[port]]
+    if configured_ports and not args.reconcile:
+        for port in configured_ports:
+            print(switch + ' ' + port + ' already has configuration present.')
+        return None
+    return switch_node, running_configs
 
-def eapi_mlag_config_check(switch):
-    ''' Connect and check mlag domain ID for use with NSX bindings
+def switchport_config_update(switch_node, switch, switch_ports, commands):
+    ''' Push planned switchport configurations to switches via Arista eAPI.
+        Ports must already have passed switchport_config_preflight.
+        All ports go to the switch in one EOS config session so the change is
+        committed as a whole or not at all.
     
     Args:
+        switch_node (class): The connected node returned by switchport_config_preflight
         switch (str): The IP address or FQDN of the Arista switch
-    
+        switch_ports (dict): A dictionary containing configuration attributes
+        commands (list): The planned config commands from eapi_commands
+
     Returns:
-        mlag_domain (str): The mlag domain ID of the switch
+        switch_push (int): 1 if the switch rejected the configuration
     '''
-    switch_node = eapi_connect(switch)
-    # Check mlag configuration and parse out mlag domain ID.
-    show_mlag_output = switch_node.enable('show mlag')
-    mlag_domain = show_mlag_output[0]['result']['domainId']
-    return mlag_domain
-
-def nsx_binding_check(switch, port):
-    ''' Checks existing NSX hardware bindings for any conflict
-    
-    Args:
-        switch (str): The name of the Arista switch or mlag_domain
-        port (str): The name of the port to check for
-    '''
-    bind_check_dict = nsx_get('virtualwires/' + ls_id + '/hardwaregateways')
-    if bool(bind_check_dict['list']) == True:
+    print('Configuring ' + switch + ' ' + ', '.join(switch_ports.keys()) + '...')
+    if args.config_session == True:
+        session_name = 'nsx-binding-' + uuid.uuid4().hex[:8]
         try:
-            for i in range(len(bind_check_dict['list']['hardwareGatewayBinding'])):
-                if bind_check_dict['list']['hardwareGatewayBinding'][i]['switchName'] == switch:
-                    if bind_check_dict['list']['hardwareGatewayBinding'][i]['portName'] == port:
-                        print(switch + ' ' + port + ' was already bound to ' + ls_name)
-                        print('This is expected if the port is the second Mlag port in a switch pair')
-                        print('If it is not, please verify input file and switch config')
-        except KeyError:
-            if bind_check_dict['list']['hardwareGatewayBinding']['switchName'] == switch:
-                if bind_check_dict['list']['hardwareGatewayBinding']['portName'] == port:
-                    print(switch + ' ' + port + ' was already bound to ' + ls_name)
-                    print('This is expected if the port is the second Mlag port in a switch pair')
-                    print('If it is not, please verify input file and switch config')
-
-def nsx_hardware_binding(switch, switch_ports, vlan):
-    ''' Generate body and POST to NSX Manager if ports are present
-    
-    Args:
-        switch (str): The name of the switch to perform bindings for
-        switch_ports (dict): A dictionary containing configuration attributes
-        vlan (str): The vlan ID to bind the logical switch to
-    '''
-    # Loop to Generate Request Body from Dictionary for all switch bindings and POST
-    # So far as I can tell, these can only be done one switch per request and must be looped through.
-    hw_bind_uri = 'virtualwires/' + ls_id + '/hardwaregateways'
-    for port, config in switch_ports.items():
-        # Check if port to bind is an MLAG interface.  If yes, rewrite switch and port variables to match what NSX expects.
-        if port.startswith('Port'):
-            if config['is_mlag'] == True:
-                mlag_port = 'Mlag' + (port.split('l'))[1]
-                mlag_switch = 'mlag-' + eapi_mlag_config_check(switch)
-        # Check existing hardware bindings to see if there is a duplicate. Notify user but continue.
-        if port.startswith('Port'):
-            if config['is_mlag'] == True:
-                nsx_binding_check(mlag_switch, mlag_port)
-            else:
-                nsx_binding_check(switch, port)
-        else:
-            nsx_binding_check(switch, port)
-        # Set vlan ID for binding and apply
-        if config['mode'] == 'access':
-            port_vlan_id = '0'
-        else:
-            port_vlan_id = vlan
-        # Perform harware bindings. Check if mlag is present to ensure names are correct when sent to NSX.
-        if port.startswith('Port'):
-            if config['is_mlag'] == True:
-                hw_bind_dict = {'hardwareGatewayId': hw_id, 'vlan': port_vlan_id, 'switchName': mlag_switch, 'portName': mlag_port}
-                hw_bind_response = nsx_post(hw_bind_uri, hw_bind_dict, 'hardwareGatewayBinding')
-            else:
-                hw_bind_dict = {'hardwareGatewayId': hw_id, 'vlan': port_vlan_id, 'switchName': switch, 'portName': port}
-                hw_bind_response = nsx_post(hw_bind_uri, hw_bind_dict, 'hardwareGatewayBinding')
-        else:
-            hw_bind_dict = {'hardwareGatewayId': hw_id, 'vlan': port_vlan_id, 'switchName': switch, 'portName': port}
-            hw_bind_response = nsx_post(hw_bind_uri, hw_bind_dict, 'hardwareGatewayBinding')
-        if hw_bind_response.status_code == 200:
-            print('NSX hardware binding complete for ' + switch + ' ' + port)
-        else:
-            print('Error binding NSX logical switch to ' + switch + ' ' + port)
+            switch_node.run_commands(['configure session ' + session_name] + commands + ['commit'])
+        except pyeapi.eapilib.CommandError as error:
+            print(switch + ' rejected configuration: ' + str(error.message))
+            switch_node.run_commands(['configure session ' + session_name, 'abort'])
+            return 1
+    else:
+        try:
+            switch_node.config(commands)
+        except pyeapi.eapilib.CommandError as error:
+            print(switch + ' rejected configuration: ' + str(error.message))
+            return 1
+    print(switch + ' ' + ', '.join(switch_ports.keys()) + ' configured')
+    print('Saving ' + switch + ' configuration...')
+    switch_node.enable('write')
+    journal.record('switch_config', switch)
+    return
 
 # Pull in JSON file from command line argument
 parser = argparse.ArgumentParser(description='Configure Arista switchports via eAPI and bind to existing NSX logical switch')
 required_arg = parser.add_argument_group('Required Arguments')
 required_arg.add_argument('-j', '--json', dest='json', required=True, help='Input JSON file with data for configuration', type=open)
+add_port_arguments(parser)
+add_nsx_arguments(parser)
+add_binding_arguments(parser)
+add_mlag_cache_arguments(parser)
+add_inventory_arguments(parser)
+add_plan_arguments(parser)
+add_journal_arguments(parser)
+add_site_arguments(parser)
+add_metrics_arguments(parser)
+add_retry_arguments(parser)
+switch_arg = parser.add_argument_group('Switch Arguments')
+switch_arg.add_argument('--switch-workers', dest='switch_workers', default=0, type=int, help='Maximum number of switches configured at once (default all)')
+switch_arg.add_argument('--no-config-session', dest='config_session', action='store_false', help='Push config without an EOS config session (for EOS versions without session support)')
 args = parser.parse_args()
 data = json.load(args.json)
 
+# Run every data center in the input file as its own parallel run when there is more than one
+data_center = select_data_center(args, data)
+if data_center is None:
+    run_sites(args, data, NSX_CREDENTIALS + SWITCH_CREDENTIALS)
+site_report = SiteReport(args.site_report, data_center)
+metrics = metrics_from_args(args, 'eapi_add_hardware_binding')
+# Ports come from --ports when it is given.  Its digest goes into data so a resumed run must use the same file.
+switch_ports = port_configs_from_args(args, data, data_center)
+journal = journal_from_args(args, 'eapi_add_hardware_binding', data)
+
 # Set Variables for Login
-nsx_username = input('NSX Manager Username: ')
-nsx_password = getpass.getpass(prompt='NSX Manager Password: ')
-switch_username = input('Switch Username: ')
-switch_password = getpass.getpass(prompt='Switch Password: ')
+nsx_username = prompt_credential('NSX Manager Username: ', 'NSX_USERNAME')
+nsx_password = prompt_credential('NSX Manager Password: ', 'NSX_PASSWORD', secret=True)
+switch_username = prompt_credential('Switch Username: ', 'SWITCH_USERNAME')
+switch_password = prompt_credential('Switch Password: ', 'SWITCH_PASSWORD', secret=True)
 
 # Set Variables from JSON object for switchport configurations and API Calls.  Ports must be spelled out fully
 # Leave JSON object empty if no ports on that switch need to be configured.  Would need to look like this {}
 tenant_name = data['tenant_name']
 zone_name = data['zone_name']
-data_center = list(data['data_center'].keys())[0]
 nsx_manager = data['data_center'][data_center]['nsx_manager']
 switches = data['data_center'][data_center]['switches']
-switch_ports = data['port_configs']
+# Optional map of switch name to IP address (or address:port) for switches without DNS
+switch_addresses = data['data_center'][data_center].get('switch_addresses', {})
+# Optional request budgets for NSX Manager, CVP and each switch
+limits = EndpointLimits(data['data_center'][data_center].get('limits'))
 ls_name = 'vls' + data_center + tenant_name + zone_name
 
-# GET Hardware Binding ID for CVX
-hw_dict = nsx_get('hardwaregateways')
-# Parse out Hardware Binfing ID for later use
-hw_id = hw_dict['list']['hardwareGateway']['objectId']
-
-# GET the list of logical switches to parse out the ID and VNI of the tenant switch
-ls_dict = nsx_get('virtualwires')
-# Find objectId of tenant's logical switch by name
-for item in ls_dict['virtualWires']['dataPage']['virtualWire']:
-    if item['name'] == ls_name:
-        ls_id = item['objectId']
-        ls_vni_id = item['vdnId']
-        vlan_id = ls_vni_id[0] + ls_vni_id[-2:]
-
-# Loop through ports that require configuration and call function to configure
+# Open one pooled session to NSX Manager for the whole run
+nsx = nsx_client_from_args(args, nsx_manager, nsx_username, nsx_password, metrics=metrics, limits=limits)
+inventory = inventory_from_args(args)
+nsx_scope = 'nsx:' + nsx_manager
+virtualwires = VirtualWireIndex(nsx, 'virtualwires', page_size=args.nsx_page_size, inventory=inventory)
+
+metrics.phase('lookup')
+
+# Read everything the plan needs in one concurrent batch before any switch is changed:
+# the hardware gateway ID, the tenant logical switch and a pre-flight of every switch.
+# A conflict on any one switch stops the run with the whole fabric untouched.
+# Switches an earlier attempt of this run already configured are left out.
+config_switches = [switch for switch in switches if bool(switch_ports[switch]) == True]
+for switch in config_switches:
+    if journal.done('switch_config', switch):
+        print(switch + ' was configured by an earlier attempt of this run.')
+config_switches = [switch for switch in config_switches if not journal.done('switch_config', switch)]
+with ThreadPoolExecutor(max_workers=(args.switch_workers or len(config_switches)) + 2) as pool:
+    hw_future = pool.submit(inventory.fetch, nsx_scope, 'hardware_gateway', '', lambda: first_object_id(nsx.get('hardwaregateways'), 'hardwareGateway'))
+    virtualwire_future = pool.submit(virtualwires.find, ls_name, True)
+    preflight_futures = dict((switch, pool.submit(switchport_config_preflight, switch, switch_ports[switch])) for switch in config_switches)
+
+# Parse out Hardware Binding ID for later use
+hw_id = hw_future.result()
+
+# Pull the ID and VNI of the tenant logical switch found by name
+virtualwire = virtualwire_future.result()
+if virtualwire is None:
+    print('Logical Switch ' + ls_name + ' not found in NSX.  Please verify naming and input file.')
+    sys.exit()
+ls_id = virtualwire.object_id
+ls_vni_id = virtualwire.vdn_id
+vlan_id = ls_vni_id[0] + ls_vni_id[-2:]
+
+switch_nodes = {}
+running_configs = {}
+for switch in config_switches:
+    if preflight_futures[switch].result() is None:
+        print('Exiting script to prevent misconfiguration. Verify ' + switch + ' config data.')
+        sys.exit()
+    switch_nodes[switch], running_configs[switch] = preflight_futures[switch].result()
+
+# Resolve each switch's Mlag Domain ID at most once, reusing the nodes opened for pre-flight.
+mlag_cache = MlagDomainCache(lambda switch: switch_nodes.get(switch) or connect_switch(switch), cache_file=args.mlag_cache, ttl=args.mlag_cache_ttl, inventory=inventory)
+mlag_switches = [switch for switch in switches if any(port.startswith('Port') and config['is_mlag'] == True for port, config in switch_ports[switch].items())]
+
+# Pull the existing bindings of the logical switch and the Mlag Domain IDs at the same time
+with ThreadPoolExecutor(max_workers=2) as pool:
+    binding_index_future = pool.submit(BindingIndex, nsx, ls_id, None, inventory)
+    mlag_future = pool.submit(mlag_cache.prefetch, mlag_switches, args.switch_workers or len(mlag_switches) or 1)
+binding_index = binding_index_future.result()
+mlag_future.result()
+
+# Plan the switch config and every NSX binding before anything is written
+plan = ChangePlan()
+for switch in config_switches:
+    commands = eapi_commands(switch_port_records(switch_ports[switch]), vlan_id)
+    if args.reconcile:
+        # Only push the lines the running-config is missing.  A switch that already matches isn't touched.
+        commands = config_delta(commands, running_configs[switch])
+        if not commands:
+            print(switch + ' ' + ', '.join(switch_ports[switch].keys()) + ' already match the input file.')
+            continue
+    plan.add_switch_commands(switch, commands)
+switch_commands = dict(plan.switch_commands)
+config_switches = [switch for switch in config_switches if switch in switch_commands]
+binding_executor = HardwareBindingExecutor(nsx, ls_id, ls_name, hw_id, binding_index, mlag_lookup=mlag_cache.lookup, max_workers=args.binding_workers,
+                                           journal=journal, reconcile=args.reconcile)
 for index in range(len(switches)):
-    if bool(switch_ports[(switches[index])]) == True:
-        switch_push = switchport_config_update(switches[index], switch_ports[(switches[index])])
-        if switch_push == 1:
-            print('Exiting script to prevent misconfiguration. Verify ' + switches[index] + ' config data.')
+    binding_executor.add_switch(switches[index], switch_ports[(switches[index])], vlan_id)
+binding_executor.plan()
+plan.add_bindings(binding_executor)
+if not review_plan(plan, args.apply):
+    site_report.finish('planned')
+    mlag_cache.save()
+    inventory.close()
+    nsx.close()
+    sys.exit()
+journal.announce()
+
+metrics.phase('switch config')
+
+# Configure all switches at the same time.  Wall time tracks the slowest switch.
+if config_switches:
+    with ThreadPoolExecutor(max_workers=args.switch_workers or len(config_switches)) as pool:
+        switch_push = dict(zip(config_switches, pool.map(lambda switch: switchport_config_update(switch_nodes[switch], switch, switch_ports[switch], switch_commands[switch]), config_switches)))
+    for switch in config_switches:
+        if switch_push[switch] == 1:
+            print('Exiting script to prevent misconfiguration. Verify ' + switch + ' config data.')
             sys.exit()
 
-# Check if switch01 has ports for binding, then call function to bind ports
-for index in range(len(switches)):
-    nsx_hardware_binding(switches[index], switch_ports[(switches[index])], vlan_id)
\ No newline at end of file
+# Send the planned bindings to NSX concurrently
+metrics.phase('binding')
+binding_results = binding_executor.run()
+binding_executor.print_summary()
+binding_index.save()
+mlag_cache.save()
+if not binding_executor.failures():
+    journal.finish()
+site_report.finish('partial' if binding_executor.failures() else 'applied', binding_results, [(ls_name, 'bound')])
+
+# Report NSX Manager connection reuse and any throttling for the run
+nsx.print_stats()
+limits.print_stats()
+inventory.print_stats()
+inventory.close()
+nsx.close()
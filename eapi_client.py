@@ -0,0 +1,302 @@
+#!/usr/bin/env python
+
+# BSD 3-Clause License
+#
+# Copyright (c) 2018, Arista Networks EOS+
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name Arista nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+'''
+Shared Arista eAPI helpers used by all of the scripts in this repo.
+
+The mlag domain ID is fixed per switch and shared by both members of an
+Mlag pair, but it used to be looked up with a brand new eAPI session for
+every Mlag port-channel that was bound.  MlagDomainCache resolves each switch
+at most once per run.  It can also keep results on disk between runs for a
+configurable TTL, either in its own file or in the shared Inventory.
+
+Created by Dimitri Capetz - dcapetz@arista.com
+'''
+
+# Import pyEAPI for connecting to Arista Switches
+# Import json for reading and writing the on-disk cache and sizing requests
+# Import threading to resolve each switch only once across workers
+# Import time for cache expiry and request timings
+# Import concurrent.futures for resolving switches in parallel
+# Import the retry helpers for show commands to busy switches
+import pyeapi
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from resilience import CircuitOpenError, retry_call
+
+def eapi_commands(data):
+    ''' Pull the command strings out of an eAPI request, leaving out enable
+
+    Args:
+        data (str): The JSON-RPC request body
+
+    Returns:
+        commands (list): The commands in the request
+    '''
+    commands = []
+    for command in json.loads(data)['params']['cmds']:
+        if isinstance(command, dict):
+            command = command['cmd']
+        if command != 'enable':
+            commands.append(command)
+    return commands
+
+def eapi_call_name(commands):
+    ''' Name an eAPI request for the run metrics by the first real command in it
+
+    Args:
+        commands (list): The commands from eapi_commands
+
+    Returns:
+        call (str): Like 'show running-config', 'show mlag', 'configure' or 'write'
+    '''
+    if not commands:
+        return 'enable'
+    if commands[0].startswith('configure') or commands[0].startswith('interface'):
+        return 'configure'
+    if commands[0].startswith('show'):
+        return ' '.join(commands[0].split()[:2])
+    return commands[0].split()[0]
+
+def eapi_connect(switch, username, password, address=None, metrics=None, retry_policy=None, breaker=None, limiter=None):
+    ''' Connect to eAPI interface of Arista Switch
+    
+    Args:
+        switch (str): The IP address or FQDN of the Arista switch
+        username (str): Switch username
+        password (str): Switch password
+        address (str): Optional host or host:port to reach the switch at instead of its name
+        metrics (class): Optional Metrics collector every eAPI request is recorded in
+        retry_policy (class): Optional RetryPolicy for show commands.  Config is never retried
+        breaker (class): Optional CircuitBreaker for the switch
+        limiter (class): Optional RateLimiter every eAPI request to the switch waits on
+    
+    Returns:
+        switch_node (class): The connected node of the function call that can be used for show or config commands.
+    '''
+    host = switch
+    port = None
+    if address:
+        host, _, port = address.partition(':')
+        port = int(port) if port else None
+    switch_conn = pyeapi.client.connect(transport='https', host=host, port=port, username=username, password=password)
+    if (metrics is not None and metrics.enabled) or retry_policy is not None or breaker is not None or limiter is not None:
+        # Every enable, config and run_commands call goes through send, one round trip each.
+        connection_send = switch_conn.send
+        def send(data):
+            commands = eapi_commands(data)
+            # Only requests made up entirely of show commands are safe to send twice.
+            read_only = all(command.startswith('show') for command in commands)
+            started = time.monotonic()
+            try:
+                response, retries = retry_call(lambda: connection_send(data), retry_policy if read_only else None, breaker,
+                                               retry_exceptions=(pyeapi.eapilib.ConnectionError,), limiter=limiter)
+            except CircuitOpenError as error:
+                if metrics is not None:
+                    metrics.record('eapi', eapi_call_name(commands), time.monotonic() - started, request_bytes=len(data), error=True)
+                # Surface an open breaker the same way as a switch that can't be reached.
+                raise pyeapi.eapilib.ConnectionError('https', str(error))
+            except Exception:
+                if metrics is not None:
+                    metrics.record('eapi', eapi_call_name(commands), time.monotonic() - started, request_bytes=len(data), error=True)
+                raise
+            if metrics is not None and metrics.enabled:
+                metrics.record('eapi', eapi_call_name(commands), time.monotonic() - started, request_bytes=len(data),
+                               response_bytes=len(json.dumps(response)), retries=retries)
+            return response
+        switch_conn.send = send
+    switch_node = pyeapi.client.Node(switch_conn)
+    return switch_node
+
+class MlagDomain(object):
+    ''' A resolved mlag domain.  Both members of an Mlag pair point at the same entry. '''
+    __slots__ = ('domain_id', 'resolved', 'switches')
+
+    def __init__(self, domain_id, resolved):
+        self.domain_id = domain_id
+        self.resolved = resolved
+        self.switches = []
+
+class MlagDomainCache(object):
+    ''' Per run cache of switch to mlag domain ID, optionally backed by a file
+
+    Args:
+        connect (function): Returns a connected pyeapi node for a switch name
+        cache_file (str): Path of the on-disk cache, None to keep it in memory only
+        ttl (int): Seconds an on-disk entry stays valid
+        inventory (class): Optional Inventory to read domain IDs from and write them back to
+    '''
+
+    def __init__(self, connect, cache_file=None, ttl=86400, inventory=None):
+        self.connect = connect
+        self.inventory = inventory
+        self.cache_file = cache_file
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.switch_locks = {}
+        self.switches = {}
+        self.domains = {}
+        self.lookups = 0
+        if cache_file:
+            self.load()
+
+    def load(self):
+        ''' Pull unexpired entries in from the on-disk cache '''
+        try:
+            with open(self.cache_file) as cache:
+                cache_data = json.load(cache)
+        except (IOError, ValueError):
+            return
+        now = time.time()
+        for switch, entry in cache_data.items():
+            if now - entry['resolved'] < self.ttl:
+                self.record(switch, entry['domain_id'], entry['resolved'])
+
+    def save(self):
+        ''' Write every resolved switch back to the on-disk cache '''
+        if not self.cache_file:
+            return
+        with self.lock:
+            cache_data = {}
+            for switch, domain in self.switches.items():
+                cache_data[switch] = {'domain_id': domain.domain_id, 'resolved': domain.resolved}
+        with open(self.cache_file, 'w') as cache:
+            json.dump(cache_data, cache, indent=2, sort_keys=True)
+
+    def record(self, switch, domain_id, resolved):
+        ''' Attach a switch to the shared entry for its mlag domain '''
+        with self.lock:
+            domain = self.domains.get(domain_id)
+            if domain is None:
+                domain = MlagDomain(domain_id, resolved)
+                self.domains[domain_id] = domain
+            if switch not in domain.switches:
+                domain.switches.append(switch)
+            self.switches[switch] = domain
+
+    def cached(self, switch):
+        ''' Check if a switch is already resolved without connecting to it
+
+        Args:
+            switch (str): The IP address or FQDN of the Arista switch
+
+        Returns:
+            cached (bool): True if the mlag domain is already known
+        '''
+        with self.lock:
+            if switch in self.switches:
+                return True
+        return self.from_inventory(switch)
+
+    def from_inventory(self, switch):
+        ''' Pull a switch's domain ID in from the inventory if it has a valid entry
+
+        Args:
+            switch (str): The IP address or FQDN of the Arista switch
+
+        Returns:
+            found (bool): True if the inventory had the switch
+        '''
+        if self.inventory is None:
+            return False
+        entry = self.inventory.get('switch:' + switch, 'mlag_domain', '')
+        if entry is None:
+            return False
+        self.record(switch, entry['domain_id'], entry['resolved'])
+        return True
+
+    def lookup(self, switch):
+        ''' Return the mlag domain ID of a switch, connecting to it only on the first call
+
+        Args:
+            switch (str): The IP address or FQDN of the Arista switch
+
+        Returns:
+            mlag_domain (str): The mlag domain ID of the switch
+        '''
+        with self.lock:
+            if switch in self.switches:
+                return self.switches[switch].domain_id
+            switch_lock = self.switch_locks.setdefault(switch, threading.Lock())
+        # Hold the per switch lock so concurrent workers wait on one lookup instead of each running their own.
+        with switch_lock:
+            with self.lock:
+                if switch in self.switches:
+                    return self.switches[switch].domain_id
+            if self.from_inventory(switch):
+                with self.lock:
+                    return self.switches[switch].domain_id
+            with self.lock:
+                self.lookups += 1
+            switch_node = self.connect(switch)
+            # Check mlag configuration and parse out mlag domain ID.
+            show_mlag_output = switch_node.enable('show mlag')
+            mlag_domain = show_mlag_output[0]['result']['domainId']
+            self.learn(switch, mlag_domain)
+            return mlag_domain
+
+    def learn(self, switch, mlag_domain):
+        ''' Record a domain ID read from a switch outside of lookup, like a
+            show mlag batched with other commands, and write it to the inventory
+
+        Args:
+            switch (str): The IP address or FQDN of the Arista switch
+            mlag_domain (str): The mlag domain ID the switch reported
+        '''
+        resolved = time.time()
+        self.record(switch, mlag_domain, resolved)
+        if self.inventory is not None:
+            self.inventory.put('switch:' + switch, 'mlag_domain', '', {'domain_id': mlag_domain, 'resolved': resolved})
+
+    def prefetch(self, switches, max_workers=8):
+        ''' Resolve a set of switches in parallel ahead of time
+
+        Args:
+            switches (list): The switch names to resolve
+            max_workers (int): Maximum number of switches queried at once
+        '''
+        switches = [switch for switch in switches if not self.cached(switch)]
+        if switches:
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                list(pool.map(self.lookup, switches))
+
+def add_mlag_cache_arguments(parser):
+    ''' Add the optional mlag domain cache arguments to a script's parser
+
+    Args:
+        parser (class): The argparse parser of the calling script
+    '''
+    mlag_arg = parser.add_argument_group('Mlag Cache Arguments')
+    mlag_arg.add_argument('--mlag-cache', dest='mlag_cache', default=None, help='File to keep mlag domain IDs in between runs')
+    mlag_arg.add_argument('--mlag-cache-ttl', dest='mlag_cache_ttl', default=86400, type=int, help='Seconds an mlag domain ID in the cache file stays valid (default 86400)')
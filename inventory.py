@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+
+# BSD 3-Clause License
+#
+# Copyright (c) 2018, Arista Networks EOS+
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name Arista nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+'''
+Persistent inventory cache of NSX and fabric state, kept in SQLite.
+
+Every run used to start cold: the transport zone and hardware gateway were
+read from NSX Manager, the virtualwires were paged through to find a logical
+switch by name and every Mlag switch was asked for its domain ID, even
+though none of that changes between the many runs made in a day.
+
+The inventory keeps each of those facts as a row keyed by the endpoint it
+came from (an NSX Manager, a CVP cluster or a switch), what kind of fact it
+is and a key within that kind.  Every row carries the time it was read and
+is only trusted for a TTL.  Topology that almost never changes (transport
+zone, hardware gateway, Mlag domains, CVP devices) uses the long TTL.  The
+logical switch name index and the per logical switch binding sets move
+faster and use the short one.  --refresh ignores every cached row for one
+run and writes fresh ones back.
+
+Scripts write back after successful changes, so a logical switch created or
+a port bound in one run is known to the next one without a read from NSX.
+Without --inventory the cache lives in memory for the run only.
+
+Created by Dimitri Capetz - dcapetz@arista.com
+'''
+
+# Import sqlite3 for the on-disk store
+# Import json for storing values
+# Import threading to share one connection across workers
+# Import time for entry ages
+import sqlite3
+import json
+import threading
+import time
+
+# Kinds of inventory rows that use the short TTL.  Everything else uses the long one.
+INDEX_KINDS = ('virtualwire', 'bindings')
+
+class Inventory(object):
+    ''' SQLite backed inventory cache shared by every worker of a run
+
+    Args:
+        path (str): The SQLite file, None to keep the inventory in memory for this run only
+        ttl (float): Seconds topology entries stay valid
+        index_ttl (float): Seconds logical switch and binding entries stay valid
+        refresh (bool): Ignore every existing entry and write fresh ones back
+    '''
+
+    def __init__(self, path=None, ttl=86400, index_ttl=900, refresh=False):
+        self.path = path
+        self.ttl = ttl
+        self.index_ttl = index_ttl
+        self.refresh = refresh
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.connection = sqlite3.connect(path or ':memory:', timeout=30, check_same_thread=False)
+        with self.lock:
+            if path:
+                # WAL lets a second run read while this one writes.
+                self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS inventory (scope TEXT NOT NULL, kind TEXT NOT NULL, key TEXT NOT NULL, '
+                                    'value TEXT NOT NULL, updated REAL NOT NULL, PRIMARY KEY (scope, kind, key))')
+            self.connection.commit()
+
+    def expiry(self, kind):
+        ''' Oldest update time still valid for a kind of entry '''
+        return time.time() - (self.index_ttl if kind in INDEX_KINDS else self.ttl)
+
+    def get(self, scope, kind, key):
+        ''' Read one entry if it is still valid
+
+        Args:
+            scope (str): The endpoint the entry came from, like nsx:<manager>, cvp:<cluster> or switch:<name>
+            kind (str): What the entry is, like transport_zone or mlag_domain
+            key (str): The entry within the kind, '' for single entries
+
+        Returns:
+            value: The stored value, or None if there is no valid entry
+        '''
+        with self.lock:
+            row = None
+            if not self.refresh:
+                row = self.connection.execute('SELECT value FROM inventory WHERE scope = ? AND kind = ? AND key = ? AND updated >= ?',
+                                              (scope, kind, key, self.expiry(kind))).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, scope, kind, key, value):
+        ''' Write one entry, replacing any older one '''
+        self.put_many(scope, kind, [(key, value)])
+
+    def put_many(self, scope, kind, items):
+        ''' Write a batch of entries of one kind in a single transaction
+
+        Args:
+            scope (str): The endpoint the entries came from
+            kind (str): What the entries are
+            items (list): (key, value) pairs
+        '''
+        now = time.time()
+        rows = [(scope, kind, key, json.dumps(value), now) for key, value in items]
+        if not rows:
+            return
+        with self.lock:
+            self.connection.executemany('INSERT OR REPLACE INTO inventory (scope, kind, key, value, updated) VALUES (?, ?, ?, ?, ?)', rows)
+            self.connection.commit()
+
+    def invalidate(self, scope, kind, key=None):
+        ''' Drop an entry, or every entry of a kind, that turned out to be stale '''
+        with self.lock:
+            if key is None:
+                self.connection.execute('DELETE FROM inventory WHERE scope = ? AND kind = ?', (scope, kind))
+            else:
+                self.connection.execute('DELETE FROM inventory WHERE scope = ? AND kind = ? AND key = ?', (scope, kind, key))
+            self.connection.commit()
+
+    def fetch(self, scope, kind, key, loader):
+        ''' Read an entry, or load it from the endpoint and store it if there is no valid one
+
+        Args:
+            scope (str): The endpoint the entry comes from
+            kind (str): What the entry is
+            key (str): The entry within the kind
+            loader (function): Reads the value from the endpoint, takes no arguments
+
+        Returns:
+            value: The cached or freshly loaded value.  Empty values are returned but not stored.
+        '''
+        value = self.get(scope, kind, key)
+        if value is None:
+            value = loader()
+            if value:
+                self.put(scope, kind, key, value)
+        return value
+
+    def print_stats(self):
+        ''' Print how much of the run was served from the inventory file '''
+        if self.path:
+            print('Inventory ' + self.path + ': ' + str(self.hits) + ' hits, ' + str(self.misses) + ' misses' +
+                  (' (refreshed)' if self.refresh else ''))
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+def add_inventory_arguments(parser):
+    ''' Add the optional inventory cache arguments to a script's parser
+
+    Args:
+        parser (class): The argparse parser of the calling script
+    '''
+    inventory_arg = parser.add_argument_group('Inventory Arguments')
+    inventory_arg.add_argument('--inventory', dest='inventory', default=None, help='SQLite file to keep NSX and fabric inventory in between runs')
+    inventory_arg.add_argument('--inventory-ttl', dest='inventory_ttl', default=86400, type=float, help='Seconds transport zone, hardware gateway, Mlag domain and CVP device entries stay valid (default 86400)')
+    inventory_arg.add_argument('--inventory-index-ttl', dest='inventory_index_ttl', default=900, type=float, help='Seconds logical switch and binding entries stay valid (default 900)')
+    inventory_arg.add_argument('--refresh', dest='refresh', action='store_true', help='Ignore cached inventory for this run and write fresh entries back')
+
+def inventory_from_args(args):
+    ''' Open the Inventory for a run from the arguments added by add_inventory_arguments '''
+    return Inventory(args.inventory, ttl=args.inventory_ttl, index_ttl=args.inventory_index_ttl, refresh=args.refresh)
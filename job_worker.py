@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+
+# BSD 3-Clause License
+#
+# Copyright (c) 2018, Arista Networks EOS+
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name Arista nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+'''
+Worker process of the provisioning service.
+
+The service starts a few of these and hands each one job at a time as a
+line of JSON on stdin.  A job is a run of one of the scripts in this repo,
+made in this process instead of a new one: the script is compiled once
+and run with the job's input file and arguments, with its output captured
+and its exit handlers run when the job ends.  The warm pool is on, so the
+NSX session, CVP login and request budgets built by one job are reused by
+the next, and the imports are paid once per worker instead of per job.
+The result goes back to the service as a line of JSON on stdout.
+
+Not meant to be run by hand.
+
+Created by Dimitri Capetz - dcapetz@arista.com
+'''
+
+# Import the warm pool so clients are kept between jobs
+# Import the modules the scripts use up front, so the first job doesn't pay for them
+# Import atexit so each job's exit handlers run when the job ends
+# Import contextlib and io for capturing the output of a job
+# Import json, os and tempfile for job input and results
+# Import time for job wall time
+# Import traceback for reporting scripts that crash
+# Import sys for running the scripts with the job's arguments
+from warm_pool import enable_warm_pool
+import nsx_client
+import nsx_virtualwires
+import nsx_bindings
+import eapi_client
+import cvp_tasks
+import configlet
+import change_plan
+import inventory
+import journal
+import sites
+from cvprac.cvp_client import CvpClient
+import atexit
+import contextlib
+import io
+import json
+import os
+import tempfile
+import time
+import traceback
+import sys
+
+def run_job(job, compiled):
+    ''' Run one script in this process with the job's input and arguments
+
+    Args:
+        job (dict): The job from the service: id, script, input, args and env
+        compiled (dict): Compiled scripts by path, filled in on first use
+
+    Returns:
+        result (dict): How the job went, with its output
+    '''
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), job['script'])
+    if script not in compiled:
+        with open(script) as script_file:
+            compiled[script] = compile(script_file.read(), script, 'exec')
+    input_file, input_path = tempfile.mkstemp(prefix='arista-nsx-job-', suffix='.json')
+    with os.fdopen(input_file, 'w') as job_input:
+        json.dump(job['input'], job_input)
+    # The job's credentials are only set for the job, so the next one can't pick them up.
+    environ = dict(os.environ)
+    os.environ.update(job['env'])
+    run_globals = {'__name__': '__main__', '__file__': script, '__builtins__': __builtins__}
+    exit_handlers = []
+    output = io.StringIO()
+    exit_code = 0
+    started = time.monotonic()
+    register = atexit.register
+    argv = sys.argv
+    # The job's exit handlers, like the metrics report, belong to the job and not to the worker.
+    atexit.register = lambda handler, *args, **kwargs: exit_handlers.append((handler, args, kwargs)) or handler
+    sys.argv = [script, '-j', input_path] + job['args']
+    with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+        try:
+            exec(compiled[script], run_globals)
+        except SystemExit as error:
+            if isinstance(error.code, int):
+                exit_code = error.code
+            elif error.code is not None:
+                print(error.code)
+                exit_code = 1
+        except Exception:
+            traceback.print_exc()
+            exit_code = 1
+        finally:
+            atexit.register = register
+            sys.argv = argv
+            for handler, args, kwargs in reversed(exit_handlers):
+                try:
+                    handler(*args, **kwargs)
+                except Exception:
+                    traceback.print_exc()
+            os.environ.clear()
+            os.environ.update(environ)
+    if 'args' in run_globals:
+        run_globals['args'].json.close()
+    os.remove(input_path)
+    result = {'id': job['id'], 'exit_code': exit_code, 'status': 'failed', 'counts': {}, 'failures': [], 'logical_switches': [],
+              'run_id': None, 'output': output.getvalue(), 'wall_time': time.monotonic() - started}
+    site_report = run_globals.get('site_report')
+    if site_report is not None:
+        result.update({'status': site_report.status, 'counts': site_report.counts, 'failures': site_report.failures,
+                       'logical_switches': site_report.logical_switches})
+    run_journal = run_globals.get('journal')
+    if run_journal is not None and run_journal.write:
+        result['run_id'] = run_journal.run_id
+    # An audit that found drift exits with 1 on purpose.
+    if exit_code != 0 and result['status'] not in ('failed', 'drift'):
+        result['status'] = 'failed'
+        result['failures'].append('exited with code ' + str(exit_code))
+    return result
+
+enable_warm_pool()
+# Jobs come in on stdin and results go out on stdout.  Scripts never get to
+# read the job stream, and anything written straight to the stdout file
+# descriptor lands on stderr instead of in the middle of a result.
+jobs = os.fdopen(os.dup(0), 'r')
+results = os.fdopen(os.dup(1), 'w')
+devnull = os.open(os.devnull, os.O_RDWR)
+os.dup2(devnull, 0)
+os.dup2(2, 1)
+sys.stdin = open(os.devnull)
+compiled = {}
+for line in jobs:
+    results.write(json.dumps(run_job(json.loads(line), compiled)) + '\n')
+    results.flush()
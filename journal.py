@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+
+# BSD 3-Clause License
+#
+# Copyright (c) 2018, Arista Networks EOS+
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name Arista nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+'''
+Step journal for checkpointed, resumable provisioning runs.
+
+Every run that makes changes writes a journal as it goes, one JSON line per
+finished step: a logical switch created, a configlet updated, a CVP task
+executed, a binding posted.  Each line is flushed to disk before the next
+step starts, so the journal survives the script dying at any point.
+
+If a run is interrupted, start it again with --resume <run-id> and the same
+input file.  Steps the journal has as done are skipped and only the rest of
+the run is planned and applied, instead of tripping over the changes the
+first attempt already made.
+
+Created by Dimitri Capetz - dcapetz@arista.com
+'''
+
+# Import argparse to hide the child only arguments from help
+# Import json for the journal lines and hashing the input
+# Import hashlib to tie a journal to the input file it was started with
+# Import os for the journal directory
+# Import threading to keep journal writes whole across workers
+# Import time and uuid for run IDs and step times
+# Import sys for various error handling
+import argparse
+import json
+import hashlib
+import os
+import threading
+import time
+import uuid
+import sys
+
+def input_digest(data):
+    ''' Hash the parsed input file so a run can only be resumed with the same input
+
+    Args:
+        data (dict): The parsed input JSON
+
+    Returns:
+        digest (str): Hex SHA-256 of the input in canonical form
+    '''
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()
+
+def new_run_id():
+    ''' A sortable, unique ID for a new run '''
+    return time.strftime('%Y%m%d-%H%M%S') + '-' + uuid.uuid4().hex[:6]
+
+def run_finished(directory, run_id, script):
+    ''' Check if a journaled run of a script finished cleanly, without loading it
+
+    Args:
+        directory (str): Where the journal is kept
+        run_id (str): The run to check
+        script (str): The script the run must belong to
+
+    Returns:
+        finished (bool): True if the run is marked complete
+    '''
+    try:
+        with open(os.path.join(directory, run_id + '.jsonl')) as journal_file:
+            for line in journal_file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                if entry.get('step') == 'run' and entry.get('script') != script:
+                    break
+                if entry.get('step') == 'complete':
+                    return True
+    except IOError:
+        pass
+    return False
+
+class RunJournal(object):
+    ''' Append-only journal of the steps a run has finished
+
+    Args:
+        directory (str): Where journals are kept, one <run-id>.jsonl file per run
+        script (str): The script writing the journal
+        digest (str): input_digest of the input file
+        run_id (str): The run to resume, None to start a new one
+        write (bool): False for dry runs, which read a journal but never write one
+        new_id (str): The ID to give a new run, None to make one up
+    '''
+
+    def __init__(self, directory, script, digest, run_id=None, write=True, new_id=None):
+        self.directory = directory
+        self.script = script
+        self.write = write
+        self.lock = threading.Lock()
+        self.steps = {}
+        self.resumed = run_id is not None
+        self.run_id = run_id or new_id or new_run_id()
+        self.path = os.path.join(directory, self.run_id + '.jsonl')
+        if self.resumed:
+            self.load(digest)
+        elif write:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            self.append({'step': 'run', 'key': '', 'script': script, 'input': digest})
+
+    def load(self, digest):
+        ''' Read the steps an earlier attempt of this run finished '''
+        try:
+            with open(self.path) as journal_file:
+                lines = [json.loads(line) for line in journal_file if line.strip()]
+        except IOError:
+            print('No journal found for run ' + self.run_id + ' in ' + self.directory + '.  Verify the run ID.')
+            sys.exit()
+        except ValueError:
+            # A line cut short by the crash can only be the last one.  Everything before it is good.
+            with open(self.path) as journal_file:
+                lines = []
+                for line in journal_file:
+                    try:
+                        lines.append(json.loads(line))
+                    except ValueError:
+                        break
+        header = lines[0] if lines else {}
+        if header.get('script') != self.script:
+            print('Run ' + self.run_id + ' was started by ' + str(header.get('script')) + ', not ' + self.script + '.  Verify the run ID.')
+            sys.exit()
+        if header.get('input') != digest:
+            print('The input file has changed since run ' + self.run_id + ' was started.  Resume with the original input file.')
+            sys.exit()
+        for line in lines[1:]:
+            self.steps[(line['step'], line['key'])] = line
+        if ('complete', '') in self.steps:
+            print('Run ' + self.run_id + ' already finished.  Nothing to resume.')
+            sys.exit()
+
+    def append(self, line):
+        if not self.write:
+            return
+        with self.lock:
+            with open(self.path, 'a') as journal_file:
+                journal_file.write(json.dumps(line, sort_keys=True) + '\n')
+                journal_file.flush()
+                os.fsync(journal_file.fileno())
+
+    def done(self, step, key):
+        ''' Check if a step finished in this run or an earlier attempt of it
+
+        Args:
+            step (str): The kind of step, like configlet, task or binding
+            key (str): What the step was for, like a switch name
+
+        Returns:
+            done (bool): True if the step is in the journal
+        '''
+        with self.lock:
+            return (step, key) in self.steps
+
+    def get(self, step, key):
+        ''' Return the journal line of a finished step, or None '''
+        with self.lock:
+            return self.steps.get((step, key))
+
+    def record(self, step, key, **details):
+        ''' Write a finished step to the journal before moving on
+
+        Args:
+            step (str): The kind of step
+            key (str): What the step was for
+            details: Anything a resumed run needs to pick up from this step
+        '''
+        line = dict(details)
+        line.update({'step': step, 'key': key, 'time': time.time()})
+        with self.lock:
+            self.steps[(step, key)] = line
+        self.append(line)
+
+    def finish(self):
+        ''' Mark the run as finished so it can't be resumed again '''
+        self.record('complete', '')
+
+    def announce(self):
+        ''' Tell the user how to pick the run back up if it dies '''
+        if not self.write:
+            return
+        if self.resumed:
+            print('Resuming run ' + self.run_id + ', ' + str(len(self.steps)) + ' step(s) already done.')
+        else:
+            print('Run ' + self.run_id + ' journal at ' + self.path + '.  If the run is interrupted, re-run with --resume ' + self.run_id)
+
+def add_journal_arguments(parser):
+    ''' Add the optional journal and resume arguments to a script's parser
+
+    Args:
+        parser (class): The argparse parser of the calling script
+    '''
+    journal_arg = parser.add_argument_group('Journal Arguments')
+    journal_arg.add_argument('--journal-dir', dest='journal_dir', default='journal', help='Directory run journals are kept in (default journal)')
+    journal_arg.add_argument('--resume', dest='resume', default=None, metavar='RUN_ID', help='Resume an interrupted run, skipping the steps it already finished')
+    # Set by a multi data center run so every site shares one run ID.
+    journal_arg.add_argument('--run-id', dest='run_id', default=None, help=argparse.SUPPRESS)
+
+def journal_from_args(args, script, data):
+    ''' Open the RunJournal for a run from the arguments added by add_journal_arguments.
+        Journals are only written when the run applies changes.
+
+    Args:
+        args (class): The parsed argparse namespace, including --apply
+        script (str): The name of the calling script
+        data (dict): The parsed input JSON
+
+    Returns:
+        journal (class): The RunJournal for the run
+    '''
+    return RunJournal(args.journal_dir, script, input_digest(data), run_id=args.resume, write=args.apply, new_id=args.run_id)
@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+
+# BSD 3-Clause License
+#
+# Copyright (c) 2018, Arista Networks EOS+
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name Arista nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+'''
+Per phase timing and request counts for the scripts in this repo.
+
+Every NSX, eAPI and CVP call made during a run is recorded with its latency,
+payload sizes, retries and whether it failed.  Calls are grouped by the
+phase the script was in at the time (lookup, switch config, task execution,
+binding) so a slow run can be traced to the system and step responsible.
+Latencies are kept as fixed bucket histograms so the cost per call stays
+constant no matter how long the run is.
+
+Run any script with --metrics text or --metrics json to get the report at
+exit, and --metrics-file to write it somewhere other than stdout.
+
+Created by Dimitri Capetz - dcapetz@arista.com
+'''
+
+# Import atexit to emit the report however the script ends
+# Import json for the machine readable report
+# Import re for grouping calls by URI pattern
+# Import threading to keep the counters safe across workers
+# Import time for latency measurements
+import atexit
+import json
+import re
+import threading
+import time
+
+# Upper bounds of the latency histogram buckets in seconds.  Anything slower lands in '+Inf'.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+def uri_pattern(uri):
+    ''' Collapse object IDs in a URI so calls to the same endpoint group together
+
+    Args:
+        uri (str): The URI or URL path that was called
+
+    Returns:
+        pattern (str): The URI with IDs like virtualwire-12 replaced by {id}.  API versions like v2 are kept
+    '''
+    uri = uri.split('?', 1)[0]
+    return '/'.join('{id}' if re.search('[0-9]', segment) and not re.match('v[0-9]+$', segment) else segment for segment in uri.split('/'))
+
+class CallStats(object):
+    ''' Latency histogram and counters for one call type in one phase '''
+    __slots__ = ('count', 'errors', 'retries', 'total', 'minimum', 'maximum', 'request_bytes', 'response_bytes', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.retries = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = 0.0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def add(self, latency, request_bytes, response_bytes, retries, error):
+        self.count += 1
+        self.total += latency
+        if self.minimum is None or latency < self.minimum:
+            self.minimum = latency
+        if latency > self.maximum:
+            self.maximum = latency
+        self.request_bytes += request_bytes
+        self.response_bytes += response_bytes
+        self.retries += retries
+        if error:
+            self.errors += 1
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if latency <= bound:
+                self.buckets[index] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+
+    def as_dict(self):
+        histogram = dict(('le_' + str(bound), count) for bound, count in zip(LATENCY_BUCKETS, self.buckets))
+        histogram['le_inf'] = self.buckets[-1]
+        return {'count': self.count, 'errors': self.errors, 'retries': self.retries,
+                'latency': {'total': round(self.total, 6), 'mean': round(self.total / self.count, 6) if self.count else 0,
+                            'min': round(self.minimum or 0, 6), 'max': round(self.maximum, 6), 'histogram': histogram},
+                'request_bytes': self.request_bytes, 'response_bytes': self.response_bytes}
+
+class Metrics(object):
+    ''' Thread safe collector of call metrics grouped by phase
+
+    Args:
+        script (str): Name of the script for the report
+        enabled (bool): Record calls.  A disabled collector ignores every record
+    '''
+
+    def __init__(self, script, enabled=True):
+        self.script = script
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.started_clock = time.monotonic()
+        self.current_phase = 'setup'
+        self.phase_order = ['setup']
+        self.phase_times = {'setup': 0.0}
+        self.phase_started = time.monotonic()
+        self.calls = {}
+
+    def phase(self, name):
+        ''' Start a new phase.  Every call from any thread is attributed to it
+            until the next phase starts.
+
+        Args:
+            name (str): The phase name, like lookup or binding
+        '''
+        now = time.monotonic()
+        with self.lock:
+            self.phase_times[self.current_phase] += now - self.phase_started
+            if name not in self.phase_times:
+                self.phase_times[name] = 0.0
+                self.phase_order.append(name)
+            self.current_phase = name
+            self.phase_started = now
+
+    def record(self, service, call, latency, request_bytes=0, response_bytes=0, retries=0, error=False):
+        ''' Record one finished call
+
+        Args:
+            service (str): nsx, eapi or cvp
+            call (str): The call type, like 'GET virtualwires/{id}'
+            latency (float): Seconds the call took
+            request_bytes (int): Size of the request body
+            response_bytes (int): Size of the response body
+            retries (int): Extra attempts made before the call finished
+            error (bool): True if the call failed
+        '''
+        if not self.enabled:
+            return
+        with self.lock:
+            key = (self.current_phase, service, call)
+            stats = self.calls.get(key)
+            if stats is None:
+                stats = CallStats()
+                self.calls[key] = stats
+            stats.add(latency, request_bytes, response_bytes, retries, error)
+
+    def report(self):
+        ''' Build the report for the whole run
+
+        Returns:
+            report (dict): Wall time and call stats of every phase
+        '''
+        self.phase(self.current_phase)
+        with self.lock:
+            phases = []
+            for name in self.phase_order:
+                calls = []
+                for (phase, service, call), stats in sorted(self.calls.items()):
+                    if phase == name:
+                        entry = {'service': service, 'call': call}
+                        entry.update(stats.as_dict())
+                        calls.append(entry)
+                if calls or name != 'setup':
+                    phases.append({'phase': name, 'wall_time': round(self.phase_times[name], 6), 'calls': calls})
+        return {'script': self.script, 'started': self.started,
+                'wall_time': round(time.monotonic() - self.started_clock, 6), 'phases': phases}
+
+    def format_text(self, report):
+        ''' Render a report as a plain text table
+
+        Args:
+            report (dict): The report from report()
+
+        Returns:
+            text (str): One row per call type, grouped by phase
+        '''
+        header = ('Phase', 'Service', 'Call', 'Count', 'Errors', 'Retries', 'Mean ms', 'Max ms', 'Sent', 'Received')
+        rows = []
+        for phase in report['phases']:
+            rows.append((phase['phase'], '', '(wall time)', '', '', '', '{:.1f}'.format(phase['wall_time'] * 1000), '', '', ''))
+            for call in phase['calls']:
+                rows.append((phase['phase'], call['service'], call['call'], str(call['count']), str(call['errors']), str(call['retries']),
+                             '{:.1f}'.format(call['latency']['mean'] * 1000), '{:.1f}'.format(call['latency']['max'] * 1000),
+                             str(call['request_bytes']), str(call['response_bytes'])))
+        widths = [max(len(row[column]) for row in [header] + rows) for column in range(len(header))]
+        lines = ['Run metrics for ' + report['script'] + ' (' + '{:.2f}'.format(report['wall_time']) + 's):']
+        for row in [header] + rows:
+            lines.append('  '.join(row[column].ljust(widths[column]) for column in range(len(header))).rstrip())
+        return '\n'.join(lines)
+
+    def emit(self, output_format, output_file=None):
+        ''' Write the report as text or json, to a file or stdout
+
+        Args:
+            output_format (str): text or json
+            output_file (str): Path to write to, None for stdout
+        '''
+        report = self.report()
+        if output_format == 'json':
+            output = json.dumps(report, indent=2)
+        else:
+            output = self.format_text(report)
+        if output_file:
+            with open(output_file, 'w') as metrics_file:
+                metrics_file.write(output + '\n')
+        else:
+            print(output)
+
+def add_metrics_arguments(parser):
+    ''' Add the optional metrics arguments to a script's parser
+
+    Args:
+        parser (class): The argparse parser of the calling script
+    '''
+    metrics_arg = parser.add_argument_group('Metrics Arguments')
+    metrics_arg.add_argument('--metrics', dest='metrics', choices=['text', 'json'], default=None, help='Report per phase call timings and counts at exit')
+    metrics_arg.add_argument('--metrics-file', dest='metrics_file', default=None, help='Write the metrics report to this file instead of stdout')
+
+def metrics_from_args(args, script):
+    ''' Build the Metrics collector for a run.  The report is emitted at exit,
+        however the script ends, if --metrics was given.
+
+    Args:
+        args (class): The parsed argparse namespace
+        script (str): Name of the script for the report
+
+    Returns:
+        metrics (class): The Metrics collector for the run
+    '''
+    metrics = Metrics(script, enabled=args.metrics is not None)
+    if args.metrics is not None:
+        atexit.register(metrics.emit, args.metrics, args.metrics_file)
+    return metrics
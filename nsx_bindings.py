@@ -0,0 +1,727 @@
+#!/usr/bin/env python
+
+# BSD 3-Clause License
+#
+# Copyright (c) 2018, Arista Networks EOS+
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name Arista nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+'''
+Helpers for working with the NSX hardware gateway bindings of a logical switch.
+
+The binding list for a logical switch is pulled from NSX Manager once and
+kept as a (switchName, portName) hash index so duplicate checks don't need
+to re-download and scan the whole list for every port.  The index is updated
+in place after every successful binding POST to stay in step with NSX.  With
+an Inventory the list is read from there while it is fresh and written back
+once the bindings are done.  A port the cached list says is bound is checked
+against NSX before it is skipped, in case the cache is behind.
+
+Binding POSTs for every switch and port are sent in parallel by the
+HardwareBindingExecutor, up to a configurable number of workers.  Results are
+kept per port and printed as an ordered summary once all of them finish.
+
+Binding POSTs that time out or find NSX Manager busy are retried with
+backoff.  When a POST may have landed without an answer, the binding list
+is read back before trying again so no binding is sent twice.
+
+The executor can also plan the bindings first, resolving names and checking
+for duplicates without sending anything, so a run can be reviewed before
+anything is changed.  With a RunJournal every finished port is journaled, and
+ports an earlier attempt of the run finished are left out when it is resumed.
+
+In reconcile mode a port already bound on a different vlan (after a switchport
+mode change for example) is planned as a replacement: its binding is deleted
+by ID and sent again on the vlan from the input file.
+
+The HardwareUnbindExecutor is the inverse, for tearing a tenant down.  It
+plans a DELETE by ID for every port of the input file that is bound and sends
+them in parallel, handing back a future per binding so the caller can start
+on a switch as soon as its own ports are unbound.
+
+Created by Dimitri Capetz - dcapetz@arista.com
+'''
+
+# Import the NSX client errors and busy check for safe binding retries
+# Import the NSX XML codec for binding lists and request bodies
+# Import concurrent.futures for the binding worker pool
+# Import threading to keep the index safe across workers
+from nsx_client import NsxUnavailable, busy_retry_after
+from nsx_xml import hardware_gateway_binding, parse_bindings
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+def retry_count(retries):
+    return str(retries) + (' retry' if retries == 1 else ' retries')
+
+class BindingIndex(object):
+    ''' Hash index of the hardware bindings on one NSX logical switch
+
+    Args:
+        nsx (class): The NsxClient for the run
+        ls_id (str): The objectId of the logical switch
+        bindings (dict): Known (switchName, portName) to vlan bindings, skips the GET.
+            A logical switch created in this run starts with an empty dict.
+        inventory (class): Optional Inventory to read the binding list from and save it back to
+    '''
+
+    def __init__(self, nsx, ls_id, bindings=None, inventory=None):
+        self.nsx = nsx
+        self.ls_id = ls_id
+        self.uri = 'virtualwires/' + ls_id + '/hardwaregateways'
+        self.inventory = inventory
+        self.scope = 'nsx:' + nsx.nsx_manager
+        self.lock = threading.Lock()
+        self.bindings = {}
+        self.binding_ids = {}
+        self.from_inventory = False
+        if bindings is None and inventory is not None:
+            cached = inventory.get(self.scope, 'bindings', ls_id)
+            if cached is not None:
+                bindings = dict(((switch, port), vlan) for switch, port, vlan in cached)
+                self.from_inventory = True
+        if bindings is None:
+            self.refresh()
+        else:
+            self.bindings = dict(bindings)
+
+    def refresh(self):
+        ''' GET the full binding list for the logical switch and rebuild the index '''
+        response = self.nsx.get_stream(self.uri)
+        try:
+            records = parse_bindings(response.raw)
+        finally:
+            response.close()
+        with self.lock:
+            self.bindings = dict(((binding.switch_name, binding.port_name), binding.vlan) for binding in records)
+            self.binding_ids = dict(((binding.switch_name, binding.port_name), binding.binding_id) for binding in records)
+            self.from_inventory = False
+
+    def save(self):
+        ''' Write the binding list back to the inventory, leaving out reservations still in flight '''
+        if self.inventory is None:
+            return
+        with self.lock:
+            bindings = [[switch, port, vlan] for (switch, port), vlan in sorted(self.bindings.items()) if vlan is not None]
+        self.inventory.put(self.scope, 'bindings', self.ls_id, bindings)
+
+    def confirm(self, switch, port):
+        ''' Read the binding list back from NSX to check if one binding exists.
+            Used before retrying a POST whose outcome is unknown.
+
+        Args:
+            switch (str): The name of the Arista switch or mlag_domain
+            port (str): The name of the port to check for
+
+        Returns:
+            bound (bool): True if NSX has the binding
+
+        Raises:
+            NsxUnavailable: If NSX Manager could not be reached
+        '''
+        response = self.nsx.send('GET', self.uri, retry=True)
+        return any(binding.switch_name == switch and binding.port_name == port for binding in parse_bindings(response.content))
+
+    def contains(self, switch, port):
+        ''' Check if a switch and port are already bound to the logical switch
+
+        Args:
+            switch (str): The name of the Arista switch or mlag_domain
+            port (str): The name of the port to check for
+
+        Returns:
+            bound (bool): True if the binding already exists
+        '''
+        with self.lock:
+            return (switch, port) in self.bindings
+
+    def claim(self, switch, port):
+        ''' Atomically check for a binding and reserve it if it doesn't exist yet.
+            Stops two workers (like both members of an Mlag pair) from binding the
+            same port at the same time.
+
+        Args:
+            switch (str): The name of the Arista switch or mlag_domain
+            port (str): The name of the port to reserve
+
+        Returns:
+            claimed (bool): True if the caller now owns the binding
+        '''
+        with self.lock:
+            if (switch, port) in self.bindings:
+                return False
+            self.bindings[(switch, port)] = None
+            return True
+
+    def release(self, switch, port):
+        ''' Drop a reservation from claim() after a failed binding POST
+
+        Args:
+            switch (str): The name of the Arista switch or mlag_domain
+            port (str): The name of the port to release
+        '''
+        with self.lock:
+            if self.bindings.get((switch, port), '') is None:
+                del self.bindings[(switch, port)]
+
+    def reclaim(self, switch, port, vlan):
+        ''' Reserve a port whose cached binding turned out to be gone from NSX
+
+        Args:
+            switch (str): The name of the Arista switch or mlag_domain
+            port (str): The name of the port to reserve
+            vlan (str): The vlan of the cached binding
+
+        Returns:
+            claimed (bool): True if the caller now owns the binding
+        '''
+        with self.lock:
+            if self.bindings.get((switch, port)) != vlan:
+                return False
+            self.bindings[(switch, port)] = None
+            return True
+
+    def add(self, switch, port, vlan):
+        ''' Record a binding that was just created in NSX
+
+        Args:
+            switch (str): The name of the Arista switch or mlag_domain
+            port (str): The name of the port that was bound
+            vlan (str): The vlan ID used in the binding
+        '''
+        with self.lock:
+            self.bindings[(switch, port)] = vlan
+            # NSX doesn't answer with the new binding ID.  The next refresh() picks it up.
+            self.binding_ids.pop((switch, port), None)
+
+    def reserve(self, switch, port):
+        ''' Turn a binding that was just deleted from NSX into a reservation
+            for the binding that replaces it
+
+        Args:
+            switch (str): The name of the Arista switch or mlag_domain
+            port (str): The name of the port that was unbound
+        '''
+        with self.lock:
+            self.bindings[(switch, port)] = None
+            self.binding_ids.pop((switch, port), None)
+
+    def remove(self, switch, port):
+        ''' Drop a binding that was just deleted from NSX
+
+        Args:
+            switch (str): The name of the Arista switch or mlag_domain
+            port (str): The name of the port that was unbound
+        '''
+        with self.lock:
+            self.bindings.pop((switch, port), None)
+            self.binding_ids.pop((switch, port), None)
+
+    def vlan(self, switch, port):
+        ''' Return the vlan a switch and port are bound on, or None if they aren't bound '''
+        with self.lock:
+            return self.bindings.get((switch, port))
+
+    def binding_id(self, switch, port):
+        ''' Return the NSX ID of a binding, or None if it isn't known.
+            Binding lists read from the inventory carry no IDs.
+        '''
+        with self.lock:
+            return self.binding_ids.get((switch, port))
+
+    def __len__(self):
+        with self.lock:
+            return len(self.bindings)
+
+class BindingResult(object):
+    ''' Outcome of a single hardware binding request '''
+    __slots__ = ('switch', 'port', 'switch_name', 'port_name', 'vlan', 'status', 'message', 'replaces')
+
+    def __init__(self, switch, port):
+        self.switch = switch
+        self.port = port
+        self.switch_name = switch
+        self.port_name = port
+        self.vlan = None
+        self.status = 'pending'
+        self.message = ''
+        self.replaces = None
+
+class HardwareBindingExecutor(object):
+    ''' Bounded concurrency engine for NSX hardware bindings
+
+    Args:
+        nsx (class): The NsxClient for the run
+        ls_id (str): The objectId of the logical switch
+        ls_name (str): The name of the logical switch
+        hw_id (str): The objectId of the hardware gateway (CVX)
+        binding_index (class): The BindingIndex of the logical switch
+        mlag_lookup (function): Returns the mlag domain ID of a switch name
+        max_workers (int): Maximum number of binding POSTs in flight
+        journal (class): Optional RunJournal finished ports are recorded in
+        reconcile (bool): Replace bindings that exist on a different vlan instead of skipping them
+    '''
+
+    # What the summary table calls the requests
+    action = 'binding'
+
+    def __init__(self, nsx, ls_id, ls_name, hw_id, binding_index, mlag_lookup=None, max_workers=8, journal=None, reconcile=False):
+        self.nsx = nsx
+        self.ls_id = ls_id
+        self.ls_name = ls_name
+        self.hw_id = hw_id
+        self.binding_index = binding_index
+        self.mlag_lookup = mlag_lookup
+        self.max_workers = max_workers
+        self.journal = journal
+        self.reconcile = reconcile
+        self.hw_bind_uri = 'virtualwires/' + ls_id + '/hardwaregateways'
+        self.jobs = []
+
+    def add_switch(self, switch, switch_ports, vlan):
+        ''' Queue bindings for every port of a switch
+
+        Args:
+            switch (str): The name of the switch to perform bindings for
+            switch_ports (dict): A dictionary containing configuration attributes
+            vlan (str): The vlan ID to bind the logical switch to
+        '''
+        for port, config in switch_ports.items():
+            result = BindingResult(switch, port)
+            if self.journal is not None and self.journal.done('binding', self.journal_key(result)):
+                result.status = 'done'
+                result.message = 'finished by an earlier attempt of this run'
+            self.jobs.append((result, config, vlan))
+
+    def journal_key(self, result):
+        return self.ls_id + ' ' + result.switch + ' ' + result.port
+
+    def resolve(self, result, config, vlan):
+        ''' Work out the switch, port and vlan NSX expects for one port
+
+        Args:
+            result (class): The BindingResult to fill in
+            config (dict): The configuration attributes of the port
+            vlan (str): The vlan ID to bind the logical switch to
+        '''
+        # Check if port to bind is an MLAG interface.  If yes, rewrite switch and port variables to match what NSX expects.
+        if result.port.startswith('Port'):
+            if config['is_mlag'] == True:
+                result.port_name = 'Mlag' + (result.port.split('l'))[1]
+                result.switch_name = 'mlag-' + self.mlag_lookup(result.switch)
+        # Set vlan ID for binding
+        if config['mode'] == 'access':
+            result.vlan = '0'
+        else:
+            result.vlan = vlan
+
+    def skip(self, result):
+        ''' Mark a port as skipped because its binding already exists '''
+        result.status = 'skipped'
+        if result.port_name != result.port:
+            result.message = 'already bound to ' + self.ls_name + ', expected for the second port of an Mlag pair'
+        elif self.reconcile:
+            result.message = 'already bound to ' + self.ls_name + ', nothing to change'
+        else:
+            result.message = 'already bound to ' + self.ls_name + ', verify input file and switch config'
+
+    def plan(self):
+        ''' Resolve every queued binding and check it against the index without
+            sending anything to NSX.  Ports that would be skipped are marked now,
+            the rest are left as planned for run().
+
+        Returns:
+            results (list): BindingResult objects in the order they were queued
+        '''
+        jobs = [job for job in self.jobs if job[0].status != 'done']
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            list(pool.map(lambda job: self.resolve(*job), jobs))
+        if self.binding_index.from_inventory and any(self.binding_index.contains(job[0].switch_name, job[0].port_name) for job in jobs):
+            # The cached list may be behind NSX, and replacing a binding needs its ID, which the inventory
+            # doesn't keep.  Read the list from NSX before skipping or replacing anything.
+            self.binding_index.refresh()
+        planned = set()
+        for result, config, vlan in jobs:
+            # The second member of an Mlag pair resolves to the same binding as the first.
+            if (result.switch_name, result.port_name) in planned:
+                self.skip(result)
+            elif self.binding_index.contains(result.switch_name, result.port_name):
+                if not self.drifted(result):
+                    self.skip(result)
+                    continue
+                bound_vlan = self.binding_index.vlan(result.switch_name, result.port_name)
+                result.replaces = self.binding_index.binding_id(result.switch_name, result.port_name)
+                if result.replaces is None:
+                    result.status = 'skipped'
+                    result.message = 'bound on vlan ' + bound_vlan + ' but NSX gave no binding ID to replace it, remove it by hand'
+                    continue
+                planned.add((result.switch_name, result.port_name))
+                result.status = 'planned'
+                result.message = 'replaces the binding on vlan ' + bound_vlan
+            else:
+                planned.add((result.switch_name, result.port_name))
+                result.status = 'planned'
+        return [job[0] for job in self.jobs]
+
+    def fail_switch(self, switch, message):
+        ''' Fail every binding of a switch that hasn't been sent, when its config didn't reach it
+
+        Args:
+            switch (str): The name of the switch
+            message (str): Why its ports are left unbound
+        '''
+        for result, config, vlan in self.jobs:
+            if result.switch == switch and result.status in ('pending', 'planned'):
+                result.status = 'failed'
+                result.message = message
+
+    def drifted(self, result):
+        ''' Check if a port is bound on a different vlan than it should be, in reconcile mode '''
+        if not self.reconcile:
+            return False
+        bound_vlan = self.binding_index.vlan(result.switch_name, result.port_name)
+        return bound_vlan is not None and bound_vlan != result.vlan
+
+    def bind_port(self, result, config, vlan):
+        ''' Generate body and POST to NSX Manager for one port
+
+        Args:
+            result (class): The BindingResult to fill in
+            config (dict): The configuration attributes of the port
+            vlan (str): The vlan ID to bind the logical switch to
+        '''
+        if result.status in ('skipped', 'done', 'failed'):
+            return result
+        if result.status == 'pending':
+            self.resolve(result, config, vlan)
+        if result.replaces is not None:
+            # The port is bound on the wrong vlan.  NSX can't change a binding in place, so delete it first.
+            old_vlan = self.binding_index.vlan(result.switch_name, result.port_name)
+            error = self.unbind(result)
+            if error:
+                result.status = 'failed'
+                result.message = 'removing the binding on vlan ' + old_vlan + ' failed: ' + error
+                return result
+            self.binding_index.reserve(result.switch_name, result.port_name)
+        # Check existing hardware bindings to see if there is a duplicate. Notify user but continue.
+        elif not self.claim(result):
+            self.skip(result)
+            return result
+        hw_bind_body = hardware_gateway_binding(self.hw_id, result.switch_name, result.port_name, result.vlan)
+        bound, message = self.post_binding(result, hw_bind_body)
+        if result.replaces is not None and not bound:
+            return self.restore(result, old_vlan, message)
+        if result.replaces is not None:
+            message = 'replaced the binding on vlan ' + old_vlan + (', ' + message if message else '')
+        if bound:
+            # Keep the binding index in step with NSX so later checks don't need another GET.
+            self.binding_index.add(result.switch_name, result.port_name, result.vlan)
+            result.status = 'bound'
+        else:
+            self.binding_index.release(result.switch_name, result.port_name)
+            result.status = 'failed'
+        result.message = message
+        self.record(result)
+        return result
+
+    def claim(self, result):
+        ''' Reserve the binding of a port.  When the index came from the inventory and
+            says the port is already bound, NSX is asked first, as the cached list may be behind.
+
+        Args:
+            result (class): The resolved BindingResult
+
+        Returns:
+            claimed (bool): True if the caller now owns the binding
+        '''
+        if self.binding_index.claim(result.switch_name, result.port_name):
+            return True
+        cached_vlan = self.binding_index.vlan(result.switch_name, result.port_name)
+        # A vlan of None is a reservation made by another worker of this run, not a cached entry.
+        if not self.binding_index.from_inventory or cached_vlan is None:
+            return False
+        try:
+            if self.binding_index.confirm(result.switch_name, result.port_name):
+                return False
+        except NsxUnavailable:
+            return False
+        return self.binding_index.reclaim(result.switch_name, result.port_name, cached_vlan)
+
+    def restore(self, result, old_vlan, error):
+        ''' Put back the binding a failed replacement deleted, so the port isn't left unbound
+
+        Args:
+            result (class): The BindingResult whose new binding failed
+            old_vlan (str): The vlan the deleted binding was on
+            error (str): Why the new binding failed
+
+        Returns:
+            result (class): The BindingResult, failed either way
+        '''
+        result.status = 'failed'
+        hw_bind_body = hardware_gateway_binding(self.hw_id, result.switch_name, result.port_name, old_vlan)
+        restored, message = self.post_binding(result, hw_bind_body)
+        if restored:
+            self.binding_index.add(result.switch_name, result.port_name, old_vlan)
+            result.message = 'binding on vlan ' + result.vlan + ' failed: ' + error + ', the binding on vlan ' + old_vlan + ' was put back'
+        else:
+            # Nothing is journaled for the port, so a resumed run plans it as a new binding.
+            self.binding_index.release(result.switch_name, result.port_name)
+            result.message = ('binding on vlan ' + result.vlan + ' failed: ' + error + ', and putting back the binding on vlan ' + old_vlan +
+                              ' failed: ' + message + '.  The port is now unbound, re-run with --resume to bind it')
+        return result
+
+    def unbind(self, result):
+        ''' DELETE the existing binding of a port.  A binding that is already
+            gone counts as removed, so the DELETE is safe to retry.
+
+        Args:
+            result (class): The BindingResult with the binding ID in replaces
+
+        Returns:
+            error (str): Why the binding couldn't be removed, empty if it was
+        '''
+        try:
+            response = self.nsx.send('DELETE', self.hw_bind_uri + '/' + result.replaces, retry=True)
+        except NsxUnavailable as error:
+            return str(error)
+        if response.status_code not in (200, 204, 404):
+            return 'HTTP ' + str(response.status_code)
+        return ''
+
+    def record(self, result):
+        ''' Journal a bound port so a resumed run leaves it out.  Skipped ports
+            aren't journaled, as the binding they deferred to may still fail.
+        '''
+        if self.journal is not None and result.status == 'bound':
+            self.journal.record('binding', self.journal_key(result), status=result.status,
+                                switch_name=result.switch_name, port_name=result.port_name, vlan=result.vlan)
+
+    def post_binding(self, result, hw_bind_body):
+        ''' POST one binding, retrying with backoff when NSX Manager is busy or
+            unreachable.  If an earlier attempt may have landed without us
+            seeing the answer, the binding list is read back first so the
+            binding is never sent twice.
+
+        Args:
+            result (class): The BindingResult being bound
+            hw_bind_body (bytes): The body of the binding POST
+
+        Returns:
+            bound (bool), message (str): True if the binding exists in NSX, and any detail worth reporting
+        '''
+        policy = self.nsx.retry_policy
+        retry_after = None
+        maybe_landed = False
+        message = ''
+        for attempt in range(policy.retries + 1):
+            if attempt:
+                policy.sleep(attempt, retry_after)
+                if maybe_landed:
+                    try:
+                        if self.binding_index.confirm(result.switch_name, result.port_name):
+                            return True, 'confirmed in NSX after ' + retry_count(attempt)
+                    except NsxUnavailable as error:
+                        message = str(error)
+                        continue
+            try:
+                hw_bind_response = self.nsx.post_once(self.hw_bind_uri, hw_bind_body)
+            except NsxUnavailable as error:
+                # A timeout or dropped connection doesn't tell us if NSX made the binding.
+                maybe_landed = True
+                retry_after = None
+                message = str(error)
+                continue
+            if hw_bind_response.status_code == 200:
+                return True, ('bound after ' + retry_count(attempt)) if attempt else ''
+            retry_after = busy_retry_after(hw_bind_response)
+            message = 'HTTP ' + str(hw_bind_response.status_code)
+            if retry_after is None:
+                if self.binding_index.from_inventory:
+                    # The cached binding list may be behind NSX.  Check if someone else already made this binding.
+                    try:
+                        if self.binding_index.confirm(result.switch_name, result.port_name):
+                            return True, 'already in NSX, the inventory was behind'
+                    except NsxUnavailable:
+                        pass
+                return False, message
+        return False, message + ' after ' + retry_count(policy.retries)
+
+    def run(self):
+        ''' Send all queued binding POSTs with at most max_workers in flight
+
+        Returns:
+            results (list): BindingResult objects in the order they were queued
+        '''
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = [pool.submit(self.bind_port, result, config, vlan) for result, config, vlan in self.jobs]
+            for future, job in zip(futures, self.jobs):
+                result = job[0]
+                try:
+                    future.result()
+                except Exception as error:
+                    result.status = 'failed'
+                    result.message = str(error)
+                if result.status == 'bound':
+                    print('NSX hardware binding complete for ' + result.switch + ' ' + result.port)
+                elif result.status == 'skipped':
+                    print(result.switch + ' ' + result.port + ' was already bound to ' + self.ls_name)
+                elif result.status == 'done':
+                    print(result.switch + ' ' + result.port + ' was bound by an earlier attempt of this run')
+                else:
+                    print('Error binding NSX logical switch to ' + result.switch + ' ' + result.port)
+        return [job[0] for job in self.jobs]
+
+    def results(self):
+        ''' Return the BindingResult objects in the order they were queued '''
+        return [job[0] for job in self.jobs]
+
+    def failures(self):
+        ''' Return the BindingResult objects that did not bind '''
+        return [job[0] for job in self.jobs if job[0].status == 'failed']
+
+    def print_summary(self, label='summary'):
+        ''' Print an ordered table of every port and how its binding (or unbinding) went
+
+        Args:
+            label (str): What the table is, 'summary' after the requests or 'plan' after plan()
+        '''
+        print('NSX hardware ' + self.action + ' ' + label + ' for ' + self.ls_name + ':')
+        for result, config, vlan in self.jobs:
+            line = '  ' + result.status.upper().ljust(8) + result.switch + ' ' + result.port
+            if result.switch_name != result.switch or result.port_name != result.port:
+                line += ' (' + result.switch_name + ' ' + result.port_name + ')'
+            if result.status == 'planned':
+                line += ' vlan ' + result.vlan
+            if result.message:
+                line += ' - ' + result.message
+            print(line)
+
+class HardwareUnbindExecutor(HardwareBindingExecutor):
+    ''' Bounded concurrency engine for deleting NSX hardware bindings.  Takes
+        the same arguments as HardwareBindingExecutor, the BindingIndex must
+        come from NSX so it has the binding IDs.
+    '''
+
+    action = 'unbinding'
+
+    def journal_key(self, result):
+        return self.ls_id + ' ' + result.switch + ' ' + result.port + ' unbind'
+
+    def add_switch(self, switch, switch_ports, vlan=None):
+        ''' Queue every port of a switch to be unbound
+
+        Args:
+            switch (str): The name of the switch to remove bindings for
+            switch_ports (dict): A dictionary containing configuration attributes
+            vlan (str): Not used, the binding is removed whatever vlan it is on
+        '''
+        for port, config in switch_ports.items():
+            result = BindingResult(switch, port)
+            if self.journal is not None and self.journal.done('unbinding', self.journal_key(result)):
+                result.status = 'done'
+                result.message = 'unbound by an earlier attempt of this run'
+            self.jobs.append((result, config, vlan))
+
+    def plan(self):
+        ''' Resolve every queued port and look its binding up in the index.
+            Ports that aren't bound are skipped, the rest are planned with the
+            binding ID to delete.
+
+        Returns:
+            results (list): BindingResult objects in the order they were queued
+        '''
+        jobs = [job for job in self.jobs if job[0].status != 'done']
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            list(pool.map(lambda job: self.resolve(*job), jobs))
+        planned = set()
+        for result, config, vlan in jobs:
+            result.vlan = self.binding_index.vlan(result.switch_name, result.port_name)
+            result.replaces = self.binding_index.binding_id(result.switch_name, result.port_name)
+            if (result.switch_name, result.port_name) in planned:
+                result.status = 'skipped'
+                result.message = 'unbound with the other port of the Mlag pair'
+            elif result.replaces is None:
+                result.status = 'skipped'
+                result.message = 'not bound to ' + self.ls_name
+            else:
+                planned.add((result.switch_name, result.port_name))
+                result.status = 'planned'
+        return [job[0] for job in self.jobs]
+
+    def unbind_port(self, result):
+        ''' DELETE the binding of one planned port
+
+        Args:
+            result (class): The planned BindingResult
+        '''
+        if result.status != 'planned':
+            return result
+        error = self.unbind(result)
+        if error:
+            result.status = 'failed'
+            result.message = error
+            print('Error removing NSX hardware binding of ' + result.switch + ' ' + result.port)
+            return result
+        self.binding_index.remove(result.switch_name, result.port_name)
+        result.status = 'unbound'
+        print('NSX hardware binding removed for ' + result.switch + ' ' + result.port)
+        if self.journal is not None:
+            self.journal.record('unbinding', self.journal_key(result), status=result.status,
+                                switch_name=result.switch_name, port_name=result.port_name, vlan=result.vlan)
+        return result
+
+    def submit(self, pool):
+        ''' Send every planned DELETE to a worker pool without waiting for them
+
+        Args:
+            pool (class): The ThreadPoolExecutor to run the DELETEs on
+
+        Returns:
+            futures (dict): Switch name to the futures of every binding its ports depend on.
+                Both members of an Mlag pair wait on their one shared binding.
+        '''
+        by_binding = {}
+        for result, config, vlan in self.jobs:
+            if result.status == 'planned':
+                by_binding[(result.switch_name, result.port_name)] = pool.submit(self.unbind_port, result)
+        futures = {}
+        for result, config, vlan in self.jobs:
+            future = by_binding.get((result.switch_name, result.port_name))
+            futures.setdefault(result.switch, [])
+            if future is not None:
+                futures[result.switch].append(future)
+        return futures
+
+def add_binding_arguments(parser):
+    ''' Add the optional binding concurrency arguments to a script's parser
+
+    Args:
+        parser (class): The argparse parser of the calling script
+    '''
+    binding_arg = parser.add_argument_group('NSX Binding Arguments')
+    binding_arg.add_argument('--binding-workers', dest='binding_workers', default=8, type=int, help='Maximum number of NSX binding requests in flight (default 8)')
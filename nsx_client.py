@@ -0,0 +1,414 @@
+#!/usr/bin/env python
+
+# BSD 3-Clause License
+#
+# Copyright (c) 2018, Arista Networks EOS+
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name Arista nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+'''
+Shared NSX Manager client used by all of the scripts in this repo.
+
+Every call used to build a brand new connection to NSX Manager with basic
+auth, so each GET or POST paid for a TCP and TLS handshake plus a full
+credential check.  This client keeps a pooled keep-alive session open for
+the life of the run and logs in once.  If NSX Manager hands out an auth
+token, that token is used for the rest of the calls.  If not, the session
+cookie from the first call is reused.
+
+Please note that all SSL verification is disabled by default.  If you have
+signed certs in place for NSX Manager, pass verify=True when building the client.
+
+Created by Dimitri Capetz - dcapetz@arista.com
+'''
+
+# Import requests and urllib3 for pooled API Calls to NSX Manager
+# Import the NSX XML codec for reading responses
+# Import threading to keep connection counters safe across workers
+# Import time and the metrics helpers for per call timings
+# Import the retry and circuit breaker helpers for calls that fail under load
+# Import the warm pool so the provisioning service reuses clients between jobs
+# (the request budget rides along with every retry attempt)
+# Import sys for various error handling
+import requests
+from requests.adapters import HTTPAdapter
+import urllib3
+from nsx_xml import parse_auth_token
+import threading
+import time
+from metrics import uri_pattern
+from resilience import CircuitBreaker, CircuitOpenError, RetryPolicy, RETRY_STATUS_CODES, retry_call, breaker_from_args, retry_policy_from_args
+from warm_pool import keep_warm, warm_pool_enabled
+import sys
+
+# Disable Cert Warnings for Test Environment
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+class NsxUnavailable(Exception):
+    ''' NSX Manager could not be reached, even after retries '''
+
+def busy_retry_after(response):
+    ''' Check if a response means NSX Manager is busy and the call should be retried
+
+    Args:
+        response (class): The requests response object
+
+    Returns:
+        retry_after (float): Seconds NSX Manager asked us to wait (0 if it didn't say), None if the response is final
+    '''
+    if response.status_code not in RETRY_STATUS_CODES:
+        return None
+    try:
+        return float(response.headers.get('Retry-After') or 0)
+    except ValueError:
+        return 0
+
+class ConnectionStats(object):
+    ''' Thread safe counters for requests sent and connections opened '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests_sent = 0
+        self.connections_opened = 0
+
+    def count_request(self):
+        with self.lock:
+            self.requests_sent += 1
+
+    def count_connection(self):
+        with self.lock:
+            self.connections_opened += 1
+
+    @property
+    def connections_reused(self):
+        return max(self.requests_sent - self.connections_opened, 0)
+
+class CountingHTTPAdapter(HTTPAdapter):
+    ''' HTTPAdapter that counts every new TCP connection the pool opens
+        so we can report how well keep-alive is working.
+    '''
+
+    def __init__(self, stats, **kwargs):
+        self.stats = stats
+        super(CountingHTTPAdapter, self).__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super(CountingHTTPAdapter, self).init_poolmanager(*args, **kwargs)
+        stats = self.stats
+        pool_classes = {}
+        for scheme, pool_class in self.poolmanager.pool_classes_by_scheme.items():
+            # Subclass each pool type so _new_conn bumps the counter before opening the socket.
+            def _new_conn(pool, _parent=pool_class):
+                stats.count_connection()
+                return _parent._new_conn(pool)
+            pool_classes[scheme] = type('Counting' + pool_class.__name__, (pool_class,), {'_new_conn': _new_conn})
+        self.poolmanager.pool_classes_by_scheme = pool_classes
+
+class NsxClient(object):
+    ''' Pooled, keep-alive client for the NSX Manager vdn API
+
+    Args:
+        nsx_manager (str): The IP address or FQDN of NSX Manager
+        username (str): NSX Manager username
+        password (str): NSX Manager password
+        pool_size (int): Number of keep-alive connections to hold open
+        connect_timeout (float): Seconds to wait for a connection to NSX Manager
+        read_timeout (float): Seconds to wait for NSX Manager to respond
+        verify (bool): Verify the NSX Manager SSL certificate
+        metrics (class): Optional Metrics collector every call is recorded in
+        retry_policy (class): RetryPolicy for idempotent calls, None for the defaults
+        breaker (class): CircuitBreaker for this NSX Manager, None for the defaults
+        limiter (class): Optional RateLimiter every call to this NSX Manager waits on
+    '''
+
+    def __init__(self, nsx_manager, username, password, pool_size=10, connect_timeout=5, read_timeout=5, verify=False, metrics=None,
+                 retry_policy=None, breaker=None, limiter=None):
+        self.nsx_manager = nsx_manager
+        self.base_url = 'https://' + nsx_manager + '/api/2.0/' # All calls will be under this base URL
+        self.vdn_url = self.base_url + 'vdn/'
+        self.username = username
+        self.password = password
+        self.timeout = (connect_timeout, read_timeout)
+        self.verify = verify
+        self.metrics = metrics
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker('NSX Manager ' + nsx_manager)
+        self.limiter = limiter
+        self.stats = ConnectionStats()
+        self.keep_open = False
+        self.auth_token = None
+        self.logged_in = False
+        self.login_lock = threading.Lock()
+        self.session = requests.Session()
+        adapter = CountingHTTPAdapter(self.stats, pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def login(self, stale_token=None):
+        ''' Request an auth token from NSX Manager.  Older versions that don't
+            support tokens fall back to basic auth and the JSESSIONID cookie
+            that the session keeps after the first call.
+
+        Args:
+            stale_token (str): The token that was rejected, if this is a re-login
+        '''
+        with self.login_lock:
+            # Another worker may have already logged in while we waited on the lock.
+            if self.logged_in and self.auth_token != stale_token:
+                return
+            self.auth_token = None
+            self.session.headers.pop('Authorization', None)
+            self.session.auth = (self.username, self.password)
+            started = time.monotonic()
+
+            def attempt():
+                self.stats.count_request()
+                return self.session.post(self.base_url + 'services/auth/token', timeout=self.timeout, verify=self.verify)
+
+            # Asking for a token twice is harmless, so busy responses and timeouts are retried.
+            try:
+                token_response, retries = retry_call(attempt, self.retry_policy, self.breaker,
+                                                     retry_exceptions=(requests.ConnectionError, requests.Timeout),
+                                                     retry_result=busy_retry_after, limiter=self.limiter)
+            except (requests.ConnectionError, requests.Timeout, CircuitOpenError):
+                print('Failed to connect to NSX Manager. Verify reachability.')
+                sys.exit()
+            if self.metrics is not None:
+                self.metrics.record('nsx', 'POST services/auth/token', time.monotonic() - started, response_bytes=len(token_response.content),
+                                    retries=retries, error=token_response.status_code >= 400)
+            if token_response.status_code in RETRY_STATUS_CODES:
+                print('NSX Manager is busy (HTTP ' + str(token_response.status_code) + ').  Try again later.')
+                sys.exit()
+            if token_response.status_code == 403:
+                print('Unable to login to NSX Manager. Verify username and password.')
+                sys.exit()
+            if token_response.status_code in (200, 201):
+                self.auth_token = parse_auth_token(token_response.content)
+                # Token replaces basic auth on every call from here on out.
+                self.session.auth = None
+                self.session.headers['Authorization'] = 'AUTHTOKEN ' + self.auth_token
+            self.logged_in = True
+
+    def send(self, method, uri, retry=False, **kwargs):
+        ''' Send a request to the NSX Manager vdn API over the shared session.
+            Logs in on first use and once more if the token or cookie has expired.
+            Idempotent calls are retried with backoff on connection errors,
+            timeouts and busy responses, all behind the NSX Manager circuit breaker.
+
+        Args:
+            method (str): The HTTP method to use
+            uri (str): The uri to call, relative to /api/2.0/vdn/
+            retry (bool): True if the call is safe to repeat
+
+        Returns:
+            response (class): The requests response object
+
+        Raises:
+            NsxUnavailable: If NSX Manager could not be reached or its circuit breaker is open
+        '''
+        if not self.logged_in:
+            self.login()
+        kwargs.setdefault('timeout', self.timeout)
+        # Pass verify on every call.  A REQUESTS_CA_BUNDLE in the environment would override the session setting.
+        kwargs.setdefault('verify', self.verify)
+        started = time.monotonic()
+        relogins = [0]
+
+        def attempt():
+            self.stats.count_request()
+            response = self.session.request(method, self.vdn_url + uri, **kwargs)
+            if response.status_code in (401, 403) and self.auth_token is not None:
+                # Token expired mid run.  Log in again and retry once.
+                self.login(stale_token=self.auth_token)
+                relogins[0] += 1
+                self.stats.count_request()
+                response = self.session.request(method, self.vdn_url + uri, **kwargs)
+            return response
+
+        try:
+            response, retries = retry_call(attempt, self.retry_policy if retry else None, self.breaker,
+                                           retry_exceptions=(requests.ConnectionError, requests.Timeout),
+                                           retry_result=busy_retry_after, limiter=self.limiter)
+        except (requests.ConnectionError, requests.Timeout, CircuitOpenError) as error:
+            self.record(method, uri, started, kwargs, None, relogins[0])
+            raise NsxUnavailable(str(error))
+        self.record(method, uri, started, kwargs, response, retries + relogins[0])
+        return response
+
+    def request(self, method, uri, **kwargs):
+        ''' Send a request to NSX Manager, retrying GETs.  Ends the run if
+            NSX Manager can't be reached.
+
+        Args:
+            method (str): The HTTP method to use
+            uri (str): The uri to call, relative to /api/2.0/vdn/
+
+        Returns:
+            response (class): The requests response object
+        '''
+        try:
+            return self.send(method, uri, retry=method == 'GET', **kwargs)
+        except NsxUnavailable:
+            print('Failed to connect to NSX Manager. Verify reachability.')
+            sys.exit()
+
+    def record(self, method, uri, started, kwargs, response, retries):
+        ''' Send the timing and size of one call to the run metrics, if there are any '''
+        if self.metrics is None or not self.metrics.enabled:
+            return
+        if response is None:
+            response_bytes = 0
+        elif kwargs.get('stream'):
+            # Streaming bodies haven't been read yet, so go by the header.
+            response_bytes = int(response.headers.get('Content-Length') or 0)
+        else:
+            response_bytes = len(response.content)
+        self.metrics.record('nsx', method + ' ' + uri_pattern(uri), time.monotonic() - started,
+                            request_bytes=len(kwargs.get('data') or b''), response_bytes=response_bytes,
+                            retries=retries, error=response is None or response.status_code >= 400)
+
+    def get(self, uri):
+        ''' Make generic HTTP GET to NSX Manager
+
+            Args:
+                uri (str): The uri to call
+
+            Returns:
+                response (bytes): The XML body of the HTTP GET, for the readers in nsx_xml
+        '''
+        get_response = self.request('GET', uri)
+        if get_response.status_code == 403:
+            print('Unable to login to NSX Manager. Verify username and password.')
+            sys.exit()
+        if get_response.status_code == 404:
+            print('URI not found. Verify NSX Manager IP and JSON input file. If NSX was recently upgraded, verify any API changes in release notes.')
+            sys.exit()
+        return get_response.content
+
+    def get_stream(self, uri, params=None):
+        ''' Make HTTP GET to NSX Manager without loading the body into memory.
+            The caller reads the XML from response.raw and must close the response.
+
+            Args:
+                uri (str): The uri to call
+                params (dict): Query string parameters
+
+            Returns:
+                response (class): The streaming requests response object
+        '''
+        get_response = self.request('GET', uri, params=params, stream=True)
+        if get_response.status_code == 403:
+            print('Unable to login to NSX Manager. Verify username and password.')
+            sys.exit()
+        if get_response.status_code == 404:
+            print('URI not found. Verify NSX Manager IP and JSON input file. If NSX was recently upgraded, verify any API changes in release notes.')
+            sys.exit()
+        # Let urllib3 undo any gzip encoding while the parser reads.
+        get_response.raw.decode_content = True
+        return get_response
+
+    def post(self, uri, body):
+        ''' Make generic HTTP POST to NSX Manager
+
+            Args:
+                uri (str): The uri to call
+                body (bytes): The XML body of the request, from one of the templates in nsx_xml
+
+            Returns:
+                response (str): The response of the HTTP POST
+        '''
+        headers = {'Content-Type': 'application/xml'} # Headers required for HTTP POSTs
+        post_response = self.request('POST', uri, headers=headers, data=body)
+        return post_response
+
+    def post_once(self, uri, body):
+        ''' Make one HTTP POST attempt to NSX Manager.  Unlike post(), an
+            unreachable manager raises NsxUnavailable so the caller can decide
+            if it is safe to try again.
+
+            Args:
+                uri (str): The uri to call
+                body (bytes): The XML body of the request, from one of the templates in nsx_xml
+
+            Returns:
+                response (str): The response of the HTTP POST
+        '''
+        headers = {'Content-Type': 'application/xml'} # Headers required for HTTP POSTs
+        return self.send('POST', uri, headers=headers, data=body)
+
+    def print_stats(self):
+        ''' Print how many connections were opened versus reused during the run '''
+        print('NSX Manager ' + self.nsx_manager + ': ' + str(self.stats.requests_sent) + ' requests, ' +
+              str(self.stats.connections_opened) + ' connections opened, ' +
+              str(self.stats.connections_reused) + ' reused')
+
+    def close(self):
+        ''' Close all pooled connections to NSX Manager, unless the client is kept warm for later runs '''
+        if self.keep_open:
+            return
+        self.session.close()
+
+def add_nsx_arguments(parser):
+    ''' Add the optional NSX connection tuning arguments to a script's parser
+
+    Args:
+        parser (class): The argparse parser of the calling script
+    '''
+    nsx_arg = parser.add_argument_group('NSX Connection Arguments')
+    nsx_arg.add_argument('--nsx-pool-size', dest='nsx_pool_size', default=10, type=int, help='Number of keep-alive connections to NSX Manager (default 10)')
+    nsx_arg.add_argument('--nsx-connect-timeout', dest='nsx_connect_timeout', default=5, type=float, help='Seconds to wait when connecting to NSX Manager (default 5)')
+    nsx_arg.add_argument('--nsx-read-timeout', dest='nsx_read_timeout', default=5, type=float, help='Seconds to wait for NSX Manager to respond (default 5)')
+    nsx_arg.add_argument('--nsx-page-size', dest='nsx_page_size', default=100, type=int, help='Logical switches requested per page from NSX Manager (default 100)')
+
+def nsx_client_from_args(args, nsx_manager, username, password, metrics=None, limits=None):
+    ''' Build an NsxClient using the tuning arguments added by add_nsx_arguments
+        and the retry arguments added by add_retry_arguments
+
+    Args:
+        args (class): The parsed argparse namespace
+        nsx_manager (str): The IP address or FQDN of NSX Manager
+        username (str): NSX Manager username
+        password (str): NSX Manager password
+        metrics (class): Optional Metrics collector for the run
+        limits (class): Optional EndpointLimits of the data center
+
+    Returns:
+        nsx (class): The NsxClient for the run
+    '''
+    limiter = limits.nsx(nsx_manager) if limits is not None else None
+    nsx = keep_warm(('nsx', nsx_manager, username, password, args.nsx_pool_size),
+                    lambda: NsxClient(nsx_manager, username, password, pool_size=args.nsx_pool_size,
+                                      connect_timeout=args.nsx_connect_timeout, read_timeout=args.nsx_read_timeout, metrics=metrics,
+                                      retry_policy=retry_policy_from_args(args), breaker=breaker_from_args(args, 'NSX Manager ' + nsx_manager),
+                                      limiter=limiter))
+    # A client kept warm from an earlier run takes the settings of this one.  Its breaker carries over.
+    nsx.timeout = (args.nsx_connect_timeout, args.nsx_read_timeout)
+    nsx.metrics = metrics
+    nsx.retry_policy = retry_policy_from_args(args)
+    nsx.limiter = limiter
+    nsx.keep_open = warm_pool_enabled()
+    return nsx
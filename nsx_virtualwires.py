@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+
+# BSD 3-Clause License
+#
+# Copyright (c) 2018, Arista Networks EOS+
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name Arista nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+'''
+Paged, streaming lookup of NSX logical switches (virtualwires) by name.
+
+NSX Manager pages the virtualwires collection, so a single GET only ever
+sees the first page.  VirtualWireIndex walks the pages with startindex and
+pagesize, reads each page with a streaming XML parser rather than
+building the whole document in memory, and keeps a name index as it goes.
+Lookups stop requesting pages as soon as the name is found.
+
+With an Inventory, names are looked up there first and every page read is
+written back, so the next run can find the logical switch without paging.
+
+load_all can read the remaining pages in parallel once the first page has
+given the total count, for callers that need every logical switch.
+
+Created by Dimitri Capetz - dcapetz@arista.com
+'''
+
+# Import the NSX XML codec for streaming pages into VirtualWire records
+# Import threading to keep the index safe across workers
+# Import concurrent.futures for reading pages in parallel
+from nsx_xml import VirtualWire, parse_virtualwire_page
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+class VirtualWireIndex(object):
+    ''' Name index of NSX logical switches, filled in one page at a time
+
+    Args:
+        nsx (class): The NsxClient for the run
+        uri (str): The virtualwires collection to walk, e.g. virtualwires or scopes/<id>/virtualwires
+        page_size (int): Logical switches to request per page
+        inventory (class): Optional Inventory to look names up in and write pages back to
+    '''
+
+    def __init__(self, nsx, uri='virtualwires', page_size=100, inventory=None):
+        self.nsx = nsx
+        self.uri = uri
+        self.page_size = page_size
+        self.inventory = inventory
+        self.scope = 'nsx:' + nsx.nsx_manager
+        self.lock = threading.Lock()
+        self.page_read = threading.Condition(self.lock)
+        self.by_name = {}
+        self.next_index = 0
+        self.unread = []
+        self.in_flight = 0
+        self.total_count = None
+
+    @property
+    def all_claimed(self):
+        ''' True once every page has been handed to a reader.  Call with the lock held. '''
+        return self.total_count is not None and self.next_index >= self.total_count and not self.unread
+
+    @property
+    def complete(self):
+        ''' True once every page has been read '''
+        return self.all_claimed and not self.in_flight
+
+    def read_page(self, start):
+        ''' Stream one page of logical switches into the index and the inventory
+
+        Args:
+            start (int): The startindex of the page
+
+        Returns:
+            found (list), page_info (dict): The VirtualWire records on the page and its pagingInfo
+        '''
+        params = {'startindex': start, 'pagesize': self.page_size}
+        response = self.nsx.get_stream(self.uri, params=params)
+        try:
+            found, page_info = parse_virtualwire_page(response.raw)
+        finally:
+            response.close()
+        with self.lock:
+            for virtualwire in found:
+                # NSX allows duplicate names; keep the first one seen.
+                self.by_name.setdefault(virtualwire.name, virtualwire)
+        if self.inventory is not None:
+            self.inventory.put_many(self.scope, 'virtualwire', [(virtualwire.name, [virtualwire.object_id, virtualwire.vdn_id]) for virtualwire in found])
+        return found, page_info
+
+    def fetch_page(self):
+        ''' Stream the next page of logical switches into the index
+
+        Returns:
+            found (list): The VirtualWire records read from the page
+        '''
+        # Claim the offset before the GET so workers paging at the same time never skip a page.
+        with self.lock:
+            if self.unread:
+                start = self.unread.pop()
+            else:
+                start = self.next_index
+                self.next_index += self.page_size
+            self.in_flight += 1
+        try:
+            found, page_info = self.read_page(start)
+        except Exception:
+            with self.lock:
+                self.unread.append(start)
+                self.in_flight -= 1
+                self.page_read.notify_all()
+            raise
+        with self.lock:
+            self.in_flight -= 1
+            if found:
+                self.total_count = page_info.get('totalCount', start + len(found))
+                if len(found) < self.page_size and start + len(found) < self.total_count:
+                    # NSX served a short page; read the rest of it from where it stopped.
+                    self.unread.append(start + len(found))
+            elif self.total_count is None or start < self.total_count:
+                # An empty page means there is nothing left to read, whatever totalCount said.
+                self.total_count = start
+            self.page_read.notify_all()
+        return found
+
+    def next_page(self):
+        ''' Read one more page, or wait for the pages other workers are still reading
+
+        Returns:
+            more (bool): False once every page has been read
+        '''
+        with self.lock:
+            if self.complete:
+                return False
+            if self.all_claimed:
+                self.page_read.wait()
+                return True
+        self.fetch_page()
+        return True
+
+    def remember(self, virtualwire):
+        ''' Add a logical switch created during the run to the index and the inventory
+
+        Args:
+            virtualwire (namedtuple): The VirtualWire that was created
+        '''
+        with self.lock:
+            self.by_name.setdefault(virtualwire.name, virtualwire)
+        if self.inventory is not None:
+            self.inventory.put(self.scope, 'virtualwire', virtualwire.name, [virtualwire.object_id, virtualwire.vdn_id])
+
+    def forget(self, name):
+        ''' Drop a logical switch deleted during the run from the index and the inventory
+
+        Args:
+            name (str): The name of the logical switch
+        '''
+        with self.lock:
+            self.by_name.pop(name, None)
+        if self.inventory is not None:
+            self.inventory.invalidate(self.scope, 'virtualwire', name)
+
+    def cached(self, name, verify=False):
+        ''' Look a name up in the inventory
+
+        Args:
+            name (str): The name of the logical switch
+            verify (bool): Confirm the logical switch still exists in NSX before trusting the entry
+
+        Returns:
+            virtualwire (namedtuple): The cached VirtualWire, or None if there is no valid entry
+        '''
+        if self.inventory is None:
+            return None
+        entry = self.inventory.get(self.scope, 'virtualwire', name)
+        if entry is None:
+            return None
+        virtualwire = VirtualWire(name, entry[0], entry[1])
+        if verify and self.nsx.request('GET', 'virtualwires/' + virtualwire.object_id).status_code != 200:
+            # Removed from NSX since it was cached.
+            self.inventory.invalidate(self.scope, 'virtualwire', name)
+            return None
+        return virtualwire
+
+    def find(self, name, verify=False):
+        ''' Find a logical switch by name, checking the inventory first and then
+            reading pages only until it turns up
+
+        Args:
+            name (str): The name of the logical switch
+            verify (bool): Confirm an inventory entry still exists in NSX before trusting it
+
+        Returns:
+            virtualwire (namedtuple): VirtualWire(name, object_id, vdn_id), or None if it doesn't exist
+        '''
+        with self.lock:
+            if name in self.by_name:
+                return self.by_name[name]
+        virtualwire = self.cached(name, verify)
+        if virtualwire is not None:
+            with self.lock:
+                return self.by_name.setdefault(name, virtualwire)
+        while True:
+            with self.lock:
+                if name in self.by_name:
+                    return self.by_name[name]
+            if not self.next_page():
+                with self.lock:
+                    return self.by_name.get(name)
+
+    def load_all(self, max_workers=1):
+        ''' Read every remaining page into the index
+
+        Args:
+            max_workers (int): Pages read at once after the first one has given the total count
+
+        Returns:
+            by_name (dict): The full name to VirtualWire index
+        '''
+        if self.total_count is None:
+            self.fetch_page()
+        if max_workers > 1 and not self.complete:
+            with self.lock:
+                starts = list(range(self.next_index, self.total_count, self.page_size))
+                self.next_index = max(self.next_index, self.total_count)
+                self.in_flight += 1
+            read = False
+            try:
+                with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                    list(pool.map(self.read_page, starts))
+                read = True
+            finally:
+                with self.lock:
+                    if not read:
+                        self.unread.extend(starts)
+                    self.in_flight -= 1
+                    self.page_read.notify_all()
+        while self.next_page():
+            pass
+        return self.by_name
+
+    def __contains__(self, name):
+        return self.find(name) is not None
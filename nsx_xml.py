@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+
+# BSD 3-Clause License
+#
+# Copyright (c) 2018, Arista Networks EOS+
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name Arista nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+'''
+XML codec for the handful of NSX Manager documents these scripts use.
+
+Responses are read with ElementTree's C accelerated parser straight into
+compact records, without building a dict of every element first.  Streamed
+responses (logical switch pages, binding lists) go through iterparse, and
+each record's elements are dropped as soon as it has been read, so memory
+stays flat no matter how long the list is.  Request bodies are filled into precompiled
+templates, with the values escaped, instead of being built element by
+element.
+
+    VirtualWire(name, object_id, vdn_id)
+    HardwareGatewayBinding(switch_name, port_name, vlan, binding_id)
+
+Created by Dimitri Capetz - dcapetz@arista.com
+'''
+
+# Import ElementTree for XML parsing, streamed or in memory
+# Import escape for filling values into the request templates
+# Import namedtuple for compact records
+from xml.etree.ElementTree import fromstring, iterparse
+from xml.sax.saxutils import escape
+from collections import namedtuple
+
+VirtualWire = namedtuple('VirtualWire', ['name', 'object_id', 'vdn_id'])
+HardwareGatewayBinding = namedtuple('HardwareGatewayBinding', ['switch_name', 'port_name', 'vlan', 'binding_id'])
+
+# Request bodies, in the same element order and form NSX Manager has always been sent
+XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8" ?>'
+VIRTUALWIRE_CREATE_SPEC = (XML_DECLARATION + '<virtualWireCreateSpec><name>{0}</name><tenantId>{1}</tenantId></virtualWireCreateSpec>').format
+HARDWARE_GATEWAY_BINDING = (XML_DECLARATION + '<hardwareGatewayBinding><hardwareGatewayId>{0}</hardwareGatewayId><vlan>{1}</vlan>'
+                            '<switchName>{2}</switchName><portName>{3}</portName></hardwareGatewayBinding>').format
+QUOTE_ENTITIES = {'"': '&quot;', "'": '&apos;'}
+
+def xml_value(value):
+    ''' Escape one value for a request template '''
+    return escape(str(value), QUOTE_ENTITIES)
+
+def virtualwire_create_spec(name, tenant_id):
+    ''' Body of the POST that creates a logical switch
+
+    Args:
+        name (str): The name of the new logical switch
+        tenant_id (str): The tenant it belongs to
+
+    Returns:
+        body (bytes): The virtualWireCreateSpec document
+    '''
+    return VIRTUALWIRE_CREATE_SPEC(xml_value(name), xml_value(tenant_id)).encode('utf-8')
+
+def hardware_gateway_binding(hw_id, switch_name, port_name, vlan):
+    ''' Body of the POST that binds a switch port to a logical switch
+
+    Args:
+        hw_id (str): The objectId of the hardware gateway
+        switch_name (str): The name of the Arista switch or mlag_domain
+        port_name (str): The name of the port
+        vlan (str): The vlan ID of the binding
+
+    Returns:
+        body (bytes): The hardwareGatewayBinding document
+    '''
+    return HARDWARE_GATEWAY_BINDING(xml_value(hw_id), xml_value(vlan), xml_value(switch_name), xml_value(port_name)).encode('utf-8')
+
+def iter_elements(source, tags):
+    ''' Read the elements with the given tags out of a document, in document
+        order.  A body already in memory is parsed in one pass.  A stream is
+        parsed as it arrives, and each element is dropped, along with
+        everything before it, once it has been handed over.
+
+    Args:
+        source (bytes): The document, or a file object to stream it from
+        tags (tuple): Tags of the elements wanted
+
+    Yields:
+        element (class): Each complete element with one of the tags
+    '''
+    if isinstance(source, bytes):
+        root = fromstring(source)
+        for element in root.iter():
+            if element.tag in tags:
+                yield element
+        return
+    parents = []
+    for event, element in iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            parents.append(element)
+            continue
+        parents.pop()
+        if element.tag in tags:
+            yield element
+            if parents:
+                # Nothing before this element is needed again.
+                parents[-1].clear()
+
+def read_virtualwire(element):
+    # findtext only looks at direct children, so the nested switch name and objectId are ignored.
+    return VirtualWire(element.findtext('name'), element.findtext('objectId'), element.findtext('vdnId'))
+
+def parse_virtualwire_page(source):
+    ''' Read one page of the virtualwires collection
+
+    Args:
+        source (bytes): The page, or a file object to stream it from
+
+    Returns:
+        virtualwires (list): VirtualWire records in page order
+        page_info (dict): totalCount, startIndex and pageSize, where NSX sent them
+    '''
+    virtualwires = []
+    page_info = {}
+    for element in iter_elements(source, ('virtualWire', 'totalCount', 'startIndex', 'pageSize')):
+        if element.tag == 'virtualWire':
+            virtualwires.append(read_virtualwire(element))
+        else:
+            page_info[element.tag] = int(element.text)
+    return virtualwires, page_info
+
+def parse_virtualwire(source):
+    ''' Read the GET of a single logical switch
+
+    Args:
+        source (bytes): The virtualWire document
+
+    Returns:
+        virtualwire (namedtuple): The VirtualWire, None if the document has none
+    '''
+    for element in iter_elements(source, ('virtualWire',)):
+        return read_virtualwire(element)
+    return None
+
+def parse_bindings(source):
+    ''' Read the hardware binding list of a logical switch
+
+    Args:
+        source (bytes): The binding list, or a file object to stream it from
+
+    Returns:
+        bindings (list): HardwareGatewayBinding records, with '' for a missing vlan
+    '''
+    return [HardwareGatewayBinding(element.findtext('switchName'), element.findtext('portName'), element.findtext('vlan') or '',
+                                   element.findtext('id'))
+            for element in iter_elements(source, ('hardwareGatewayBinding',))]
+
+def first_object_id(source, tag):
+    ''' Read the objectId of the first element with a tag, like the transport
+        zone in a vdnScopes list or the gateway in a hardwareGateway list
+
+    Args:
+        source (bytes): The document
+        tag (str): The tag of the object
+
+    Returns:
+        object_id (str): The objectId, None if there is no such object
+    '''
+    for element in iter_elements(source, (tag,)):
+        return element.findtext('objectId')
+    return None
+
+def parse_auth_token(source):
+    ''' Read the token out of an authToken response
+
+    Args:
+        source (bytes): The authToken document
+
+    Returns:
+        token (str): The token value
+    '''
+    for element in iter_elements(source, ('authToken',)):
+        return element.findtext('value')
+    return None
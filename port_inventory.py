@@ -0,0 +1,294 @@
+#!/usr/bin/env python
+
+# BSD 3-Clause License
+#
+# Copyright (c) 2018, Arista Networks EOS+
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name Arista nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+'''
+Streaming port input for large inventories.
+
+Instead of the nested "port_configs" section of the input file, the ports
+can come from a separate file with one port per line, as NDJSON or CSV:
+
+    {"switch": "leaf01", "port": "Ethernet1", "description": "Server", "mode": "trunk", "speed": "10gfull"}
+    {"switch": "leaf01", "port": "Port-channel10", "description": "Server", "mode": "access", "speed": "10gfull",
+     "local_members": ["Ethernet10"], "is_mlag": true}
+
+    switch,port,description,mode,speed,local_members,is_mlag
+    leaf01,Ethernet1,Server,trunk,10gfull,,
+    leaf01,Port-channel10,Server,access,10gfull,Ethernet10 Ethernet11,true
+
+The file is read a chunk of lines at a time.  Each line is validated and
+grouped under its switch as a slotted PortConfig, which the scripts use
+exactly like a port_configs entry.  Only ports of the switches in the data
+center being run are kept, and repeated strings like descriptions and
+speeds are stored once, so a 10k port migration never holds the whole file
+or a dictionary per port in memory.
+
+Created by Dimitri Capetz - dcapetz@arista.com
+'''
+
+# Import the port modes the switchport templates support
+# Import csv and json for reading port lines
+# Import hashlib for the digest resumed runs are checked against
+# Import itertools for reading the file in chunks
+# Import os for working out the file format
+# Import re for checking interface names
+# Import sys for various error handling
+from switchport_config import PORT_MODES
+import csv
+import json
+import hashlib
+import itertools
+import os
+import re
+import sys
+
+# Lines validated and grouped at a time
+CHUNK_SIZE = 1000
+# Errors listed before the run stops
+MAX_ERRORS = 20
+CSV_FIELDS = ['switch', 'port', 'description', 'mode', 'speed', 'local_members', 'is_mlag']
+ETHERNET_NAME = re.compile(r'^Ethernet[0-9]+(/[0-9]+)*$')
+PORT_CHANNEL_NAME = re.compile(r'^Port-channel[0-9]+$')
+
+class PortConfig(object):
+    ''' The configuration attributes of one port, read the same way as a
+        port_configs entry: config['mode'], config['is_mlag'] and so on
+    '''
+    __slots__ = ('description', 'mode', 'speed', 'local_members', 'is_mlag')
+
+    def __init__(self, description, mode, speed, local_members=(), is_mlag=False):
+        self.description = description
+        self.mode = mode
+        self.speed = speed
+        self.local_members = local_members
+        self.is_mlag = is_mlag
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+class PortFileError(Exception):
+    ''' A line of the port file that can't be used '''
+
+def port_format(path, port_format=None):
+    ''' Work out whether a port file is NDJSON or CSV, from --ports-format or the file extension '''
+    if port_format:
+        return port_format
+    if os.path.splitext(path)[1].lower() == '.csv':
+        return 'csv'
+    return 'ndjson'
+
+def read_rows(port_file, file_format, digest):
+    ''' Stream the lines of a port file as dictionaries
+
+    Args:
+        port_file (file): The open port file
+        file_format (str): ndjson or csv
+        digest (class): hashlib object every line is added to
+
+    Returns:
+        rows (generator): (line number, row) for each non-blank line.  A row that isn't valid JSON is the error text.
+    '''
+    def hashed(lines):
+        for line in lines:
+            digest.update(line.encode('utf-8'))
+            yield line
+    if file_format == 'csv':
+        reader = csv.DictReader(hashed(port_file), skipinitialspace=True)
+        for row in reader:
+            if any(value for value in row.values() if value):
+                yield reader.line_num, row
+        return
+    for line_number, line in enumerate(hashed(port_file), 1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError as error:
+            yield line_number, 'not valid JSON: ' + str(error)
+
+def interned(value, field):
+    ''' Check a text field and keep a single copy of it for every port that shares it '''
+    if not isinstance(value, str):
+        raise PortFileError(field + ' must be text')
+    return sys.intern(value.strip())
+
+def flag(value):
+    ''' Read is_mlag from JSON (true/false) or CSV (true/false/yes/no, empty for false) '''
+    if isinstance(value, bool):
+        return value
+    if value is None or (isinstance(value, str) and value.strip().lower() in ('', 'false', 'no')):
+        return False
+    if isinstance(value, str) and value.strip().lower() in ('true', 'yes'):
+        return True
+    raise PortFileError('is_mlag must be true or false')
+
+def parse_row(row):
+    ''' Validate one line of the port file
+
+    Args:
+        row (dict): The fields of the line
+
+    Returns:
+        switch (str), port (str), config (class): The switch and port names and the PortConfig
+    '''
+    if not isinstance(row, dict):
+        raise PortFileError(row if isinstance(row, str) else 'each line must be a JSON object')
+    for field in ('switch', 'port', 'description', 'mode', 'speed'):
+        if row.get(field) is None:
+            raise PortFileError('missing ' + field)
+    switch = interned(row['switch'], 'switch')
+    port = interned(row['port'], 'port')
+    mode = interned(row['mode'], 'mode')
+    if not switch:
+        raise PortFileError('missing switch')
+    if mode not in PORT_MODES:
+        raise PortFileError('mode must be one of ' + ', '.join(PORT_MODES))
+    config = PortConfig(interned(row['description'], 'description'), mode, interned(row['speed'], 'speed'))
+    if PORT_CHANNEL_NAME.match(port):
+        local_members = row.get('local_members')
+        if isinstance(local_members, str):
+            local_members = local_members.replace(';', ' ').split()
+        if not isinstance(local_members, list) or not local_members:
+            raise PortFileError(port + ' needs local_members')
+        config.local_members = tuple(interned(member, 'local_members') for member in local_members)
+        if not all(ETHERNET_NAME.match(member) for member in config.local_members):
+            raise PortFileError('local_members must be Ethernet interfaces, properly capitalized and fully spelled out')
+        config.is_mlag = flag(row.get('is_mlag'))
+    elif not ETHERNET_NAME.match(port):
+        raise PortFileError('port ' + port + ' must be an Ethernet or Port-channel interface, properly capitalized and fully spelled out')
+    return switch, port, config
+
+def load_ports(path, file_format, switches, known_switches):
+    ''' Read a port file into port_configs form for a set of switches
+
+    Args:
+        path (str): The port file
+        file_format (str): ndjson or csv
+        switches (list): The switches of the data center being run.  Ports of other switches are checked and dropped.
+        known_switches (set): Every switch in the input file, for catching misspelled names
+
+    Returns:
+        port_configs (dict), digest (str): Switch to port to PortConfig, in file order, and the SHA-256 of the file
+    '''
+    port_configs = dict((switch, {}) for switch in switches)
+    seen = set()
+    errors = []
+    digest = hashlib.sha256()
+    with open(path, newline='') as port_file:
+        rows = read_rows(port_file, file_format, digest)
+        while len(errors) < MAX_ERRORS:
+            chunk = list(itertools.islice(rows, CHUNK_SIZE))
+            if not chunk:
+                break
+            for line_number, row in chunk:
+                try:
+                    switch, port, config = parse_row(row)
+                    if switch not in known_switches:
+                        raise PortFileError('switch ' + switch + ' is not in any data center of the input file')
+                    if (switch, port) in seen:
+                        raise PortFileError(switch + ' ' + port + ' is listed more than once')
+                except PortFileError as error:
+                    errors.append('Line ' + str(line_number) + ': ' + str(error))
+                    continue
+                seen.add((switch, port))
+                if switch in port_configs:
+                    port_configs[switch][port] = config
+    if errors:
+        for error in errors[:MAX_ERRORS]:
+            print(error)
+        print('Exiting script to prevent misconfiguration.  Fix ' + path + ' and run it again.')
+        sys.exit()
+    return port_configs, digest.hexdigest()
+
+def all_switches(data):
+    ''' Every switch of every data center in the input file '''
+    return set(switch for site in data['data_center'].values() for switch in site['switches'])
+
+def port_configs_from_args(args, data, data_center):
+    ''' The port_configs of a run, from --ports when it is given or from the input file.
+        A port file's digest is added to data so a resumed run must use the same ports.
+
+    Args:
+        args (class): The parsed argparse namespace
+        data (dict): The parsed input JSON
+        data_center (str): The data center being run
+
+    Returns:
+        port_configs (dict): Switch to port to configuration attributes
+    '''
+    if args.ports is None:
+        return data['port_configs']
+    port_configs, digest = load_ports(args.ports, port_format(args.ports, args.ports_format),
+                                      data['data_center'][data_center]['switches'], all_switches(data))
+    data['ports_sha256'] = digest
+    return port_configs
+
+def has_mlag_ports(args, data, data_center=None):
+    ''' Check for any Mlag Port-channel in the run's ports, stopping at the first one.  Nothing is kept in memory.
+
+    Args:
+        args (class): The parsed argparse namespace
+        data (dict): The parsed input JSON
+        data_center (str): Only look at the switches of this data center, None for every data center
+
+    Returns:
+        mlag_ports (bool): True if any port is an Mlag Port-channel
+    '''
+    if data_center is None:
+        switches = all_switches(data)
+    else:
+        switches = set(data['data_center'][data_center]['switches'])
+    if args.ports is None:
+        return any(port.startswith('Port') and config['is_mlag'] == True for switch, ports in data['port_configs'].items() if switch in switches
+                   for port, config in ports.items())
+    with open(args.ports, newline='') as port_file:
+        for line_number, row in read_rows(port_file, port_format(args.ports, args.ports_format), hashlib.sha256()):
+            try:
+                switch, port, config = parse_row(row)
+            except PortFileError:
+                continue
+            if config.is_mlag and switch in switches:
+                return True
+    return False
+
+def add_port_arguments(parser):
+    ''' Add the optional streaming port file arguments to a script's parser
+
+    Args:
+        parser (class): The argparse parser of the calling script
+    '''
+    port_arg = parser.add_argument_group('Port File Arguments')
+    port_arg.add_argument('--ports', dest='ports', default=None, help='NDJSON or CSV file with one port per line, used in place of port_configs in the input file')
+    port_arg.add_argument('--ports-format', dest='ports_format', default=None, choices=['ndjson', 'csv'],
+                          help='Format of the --ports file (default csv for a .csv file, otherwise ndjson)')
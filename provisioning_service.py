@@ -0,0 +1,427 @@
+#!/usr/bin/env python
+
+# BSD 3-Clause License
+#
+# Copyright (c) 2018, Arista Networks EOS+
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name Arista nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+'''
+Long-running provisioning service with an HTTP/JSON API and a job queue.
+
+Instead of running a script per tenant request, start the service once and
+post jobs to it in the same input JSON format the scripts take.  Jobs wait
+in a queue and are run by --workers worker processes (see job_worker.py).
+Each worker keeps its NSX sessions, CVP login, request budgets and imports
+warm from one job to the next, and every job shares the --inventory cache.
+
+    POST /jobs       {"type": "create_ls" | "eapi_bind" | "cvp_bind" | "teardown" | "audit",
+                      "input": {...input file...}, "apply": false,
+                      "data_center": "dc01", "options": ["--binding-workers", "16"]}
+    GET  /jobs       Every job the service remembers, newest last
+    GET  /jobs/<id>  One job, with its output once it has finished
+    GET  /health     Workers, queue depth and job counts
+
+A job for an input file with more than one data center (and no
+"data_center") is queued as one job per data center.  Jobs are dry runs
+unless "apply" is true, just like the scripts.  Credentials are never
+prompted for: they come from the environment or --credentials-file, with
+the same variable names the scripts read.  Set PROVISIONING_TOKEN to
+require an "Authorization: Bearer <token>" header on every request.
+
+Created by Dimitri Capetz - dcapetz@arista.com
+'''
+
+# Import the credential lists and helpers for jobs that can't prompt
+# Import the port file reader for finding Mlag ports in a job's --ports file
+# Import argparse for the service options
+# Import http.server and socketserver for the HTTP/JSON API
+# Import json for requests, responses and the worker protocol
+# Import collections, queue and threading for the job queue and its workers
+# Import itertools and time for job IDs and timings
+# Import os, subprocess and sys for the worker processes
+from credentials import CVP_CREDENTIALS, NSX_CREDENTIALS, SWITCH_CREDENTIALS, load_credentials_file, site_credentials
+from port_inventory import has_mlag_ports
+import argparse
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+import json
+from collections import OrderedDict
+import queue
+import threading
+import itertools
+import time
+import os
+import subprocess
+import sys
+
+# The script and credentials of each job type.  Switch credentials are only
+# needed by create_ls and cvp_bind when an Mlag port has to be looked up.
+JOB_TYPES = {
+    'create_ls': ('create_logical_switch.py', NSX_CREDENTIALS, SWITCH_CREDENTIALS),
+    'eapi_bind': ('eapi_add_hardware_binding.py', NSX_CREDENTIALS + SWITCH_CREDENTIALS, []),
+    'cvp_bind': ('cvp_add_hardware_binding.py', NSX_CREDENTIALS + CVP_CREDENTIALS, SWITCH_CREDENTIALS),
+    'teardown': ('teardown_tenant.py', NSX_CREDENTIALS + SWITCH_CREDENTIALS, []),
+    'audit': ('audit_fabric.py', NSX_CREDENTIALS + SWITCH_CREDENTIALS, []),
+}
+
+# Options the service sets itself on every job
+SERVICE_OPTIONS = ('-j', '--json', '--data-center', '--site-workers', '--site-report', '--run-id', '--inventory')
+
+class JobError(Exception):
+    ''' A job request the service can't accept '''
+    pass
+
+def option_value(options, name):
+    ''' The value of one option in a job's options, None if it isn't given
+
+    Args:
+        options (list): The job's script options
+        name (str): The option, like --ports
+
+    Returns:
+        value (str): Its value, from "--ports file" or "--ports=file"
+    '''
+    for index, option in enumerate(options):
+        if option == name and index + 1 < len(options):
+            return options[index + 1]
+        if option.startswith(name + '='):
+            return option[len(name) + 1:]
+    return None
+
+class Job(object):
+    ''' One queued run of a script for one data center '''
+    __slots__ = ('id', 'job_type', 'data_center', 'apply', 'state', 'submitted', 'started', 'finished', 'request', 'env', 'result')
+
+    def __init__(self, job_id, job_type, data_center, apply, request, env):
+        self.id = job_id
+        self.job_type = job_type
+        self.data_center = data_center
+        self.apply = apply
+        self.state = 'queued'
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.request = request
+        self.env = env
+        self.result = None
+
+    def as_dict(self, output=False):
+        ''' The job as returned by the API, with the script output if asked for '''
+        job = {'id': self.id, 'type': self.job_type, 'data_center': self.data_center, 'apply': self.apply, 'state': self.state,
+               'submitted': self.submitted, 'started': self.started, 'finished': self.finished}
+        if self.result is not None:
+            job.update(dict((key, value) for key, value in self.result.items() if key != 'id' and (key != 'output' or output)))
+        return job
+
+class JobWorker(threading.Thread):
+    ''' Runs queued jobs one at a time in a long-lived worker process, and
+        starts a new process if the old one dies in the middle of a job.
+
+    Args:
+        job_queue (class): The JobQueue to take jobs from
+        number (int): The worker number, for the service log
+    '''
+
+    def __init__(self, job_queue, number):
+        super(JobWorker, self).__init__(name='job-worker-' + str(number), daemon=True)
+        self.job_queue = job_queue
+        self.number = number
+        self.process = None
+        self.jobs_run = 0
+
+    def start_process(self):
+        worker_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'job_worker.py')
+        self.process = subprocess.Popen([sys.executable, worker_script], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        universal_newlines=True)
+
+    def run(self):
+        while True:
+            job = self.job_queue.next_job()
+            if job is None:
+                break
+            if self.process is None or self.process.poll() is not None:
+                self.start_process()
+            try:
+                self.process.stdin.write(json.dumps(job.request) + '\n')
+                self.process.stdin.flush()
+                line = self.process.stdout.readline()
+            except (IOError, OSError):
+                line = ''
+            if line:
+                result = json.loads(line)
+            else:
+                self.process.kill()
+                self.process.wait()
+                self.process = None
+                result = {'status': 'failed', 'exit_code': None, 'counts': {}, 'failures': ['worker process exited during the job'],
+                          'logical_switches': [], 'run_id': None, 'output': '', 'wall_time': time.time() - job.started}
+            self.jobs_run += 1
+            self.job_queue.finish(job, result)
+        if self.process is not None:
+            self.process.stdin.close()
+            self.process.wait()
+
+class JobQueue(object):
+    ''' The jobs the service knows about and the workers that run them
+
+    Args:
+        workers (int): Number of worker processes
+        inventory (str): Inventory file shared by every job, None for none
+        history (int): Number of finished jobs to remember
+    '''
+
+    def __init__(self, workers, inventory=None, history=1000):
+        self.inventory = inventory
+        self.history = history
+        self.lock = threading.Lock()
+        self.jobs = OrderedDict()
+        self.queue = queue.Queue()
+        self.ids = itertools.count(1)
+        self.workers = [JobWorker(self, number) for number in range(1, workers + 1)]
+        for worker in self.workers:
+            worker.start()
+
+    def submit(self, request):
+        ''' Check a job request and queue one job per data center it covers
+
+        Args:
+            request (dict): The parsed body of POST /jobs
+
+        Returns:
+            jobs (list): The queued Job objects
+        '''
+        if not isinstance(request, dict):
+            raise JobError('Job request must be a JSON object.')
+        job_type = request.get('type')
+        if job_type not in JOB_TYPES:
+            raise JobError('Unknown job type ' + str(job_type) + '.  Use ' + ', '.join(sorted(JOB_TYPES)) + '.')
+        data = request.get('input')
+        if not isinstance(data, dict) or not isinstance(data.get('data_center'), dict):
+            raise JobError('Job input must be an input file with data_center.')
+        apply = request.get('apply', False)
+        options = request.get('options', [])
+        if not isinstance(apply, bool) or not isinstance(options, list) or not all(isinstance(option, str) for option in options):
+            raise JobError('apply must be true or false and options a list of strings.')
+        # A fabric-wide audit doesn't read any ports.  Every other job reads port_configs or the --ports file.
+        ports_file = option_value(options, '--ports')
+        reads_ports = job_type != 'audit' or option_value(options, '--scope') == 'input'
+        if reads_ports and ports_file is None and not isinstance(data.get('port_configs'), dict):
+            raise JobError('Job input must have port_configs, or give a port file on the service host with the --ports option.')
+        if ports_file is not None and not os.path.isfile(ports_file):
+            raise JobError('Port file ' + ports_file + ' not found on the service host.')
+        if apply and job_type == 'audit':
+            raise JobError('Audit jobs never change anything.  Leave apply out.')
+        for option in options:
+            if option.split('=', 1)[0] in SERVICE_OPTIONS:
+                raise JobError(option.split('=', 1)[0] + ' is set by the service and can\'t be given as a job option.')
+        data_centers = list(data['data_center'])
+        if request.get('data_center') is not None:
+            if request['data_center'] not in data['data_center']:
+                raise JobError('Data center ' + str(request['data_center']) + ' not found in job input.')
+            data_centers = [request['data_center']]
+        script, job_credentials, mlag_credentials = JOB_TYPES[job_type]
+        port_args = argparse.Namespace(ports=ports_file, ports_format=option_value(options, '--ports-format'))
+        jobs = []
+        for data_center in data_centers:
+            credentials = job_credentials
+            try:
+                if reads_ports and has_mlag_ports(port_args, data, data_center):
+                    credentials = credentials + mlag_credentials
+            except (AttributeError, KeyError, TypeError):
+                raise JobError('Job input has a data center without switches or a port config without is_mlag.')
+            env = site_credentials(credentials, data_center, os.environ)
+            missing = [env_var for prompt, env_var, secret in credentials if env_var not in env]
+            if missing:
+                raise JobError('Missing credentials for ' + data_center + ': ' + ', '.join(missing) + '.  Set them in the environment or the credentials file.')
+            args = ['--data-center', data_center] + (['--apply'] if apply else []) + (['--inventory', self.inventory] if self.inventory else []) + options
+            jobs.append((data_center, env, args))
+        with self.lock:
+            queued = []
+            for data_center, env, args in jobs:
+                job_id = str(next(self.ids))
+                job = Job(job_id, job_type, data_center, apply, {'id': job_id, 'script': script, 'input': data, 'args': args, 'env': env}, env)
+                self.jobs[job_id] = job
+                queued.append(job)
+            self.forget_finished()
+        for job in queued:
+            self.queue.put(job)
+            print('Job ' + job.id + ' queued: ' + job_type + ' ' + job.data_center + (' (apply)' if apply else ' (dry run)'))
+            sys.stdout.flush()
+        return queued
+
+    def next_job(self):
+        ''' Wait for the next queued job.  Returns None once the service is stopping '''
+        job = self.queue.get()
+        if job is not None:
+            with self.lock:
+                job.state = 'running'
+                job.started = time.time()
+        return job
+
+    def finish(self, job, result):
+        with self.lock:
+            job.state = 'finished'
+            job.finished = time.time()
+            job.result = result
+            # The credentials are only needed until the job has run.
+            job.request = None
+            job.env = None
+        print('Job ' + job.id + ' ' + result['status'] + ' in ' + '{:.1f}'.format(result['wall_time']) + 's' +
+              (': ' + '; '.join(result['failures']) if result['failures'] else ''))
+        sys.stdout.flush()
+
+    def forget_finished(self):
+        ''' Drop the oldest finished jobs past the history limit '''
+        finished = [job_id for job_id, job in self.jobs.items() if job.state == 'finished']
+        for job_id in finished[:max(0, len(finished) - self.history)]:
+            del self.jobs[job_id]
+
+    def get(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return job.as_dict(output=True) if job is not None else None
+
+    def list(self):
+        with self.lock:
+            return [job.as_dict() for job in self.jobs.values()]
+
+    def health(self):
+        with self.lock:
+            states = [job.state for job in self.jobs.values()]
+        return {'workers': len(self.workers), 'queued': states.count('queued'), 'running': states.count('running'),
+                'finished': states.count('finished'), 'jobs_run_per_worker': [worker.jobs_run for worker in self.workers]}
+
+    def stop(self):
+        ''' Let the running jobs finish, then stop the workers.  Jobs still queued are not run '''
+        with self.lock:
+            for job in self.jobs.values():
+                if job.state == 'queued':
+                    job.state = 'finished'
+                    job.result = {'status': 'failed', 'failures': ['service stopped before the job ran']}
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                break
+        for worker in self.workers:
+            self.queue.put(None)
+        for worker in self.workers:
+            worker.join()
+
+class ServiceHTTPServer(ThreadingMixIn, HTTPServer):
+    ''' HTTP server that answers each request on its own thread '''
+    daemon_threads = True
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    ''' The HTTP/JSON API of the service '''
+
+    def log_message(self, format, *args):
+        pass
+
+    def respond(self, status, body):
+        payload = json.dumps(body, indent=2).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def authorized(self):
+        token = os.environ.get('PROVISIONING_TOKEN')
+        if token and self.headers.get('Authorization') != 'Bearer ' + token:
+            self.respond(401, {'error': 'Missing or wrong bearer token.'})
+            return False
+        return True
+
+    def do_GET(self):
+        if not self.authorized():
+            return
+        path = self.path.split('?', 1)[0].rstrip('/')
+        if path == '/health':
+            self.respond(200, self.server.job_queue.health())
+        elif path == '/jobs':
+            self.respond(200, {'jobs': self.server.job_queue.list()})
+        elif path.startswith('/jobs/'):
+            job = self.server.job_queue.get(path[len('/jobs/'):])
+            if job is None:
+                self.respond(404, {'error': 'Job not found.'})
+            else:
+                self.respond(200, job)
+        else:
+            self.respond(404, {'error': 'Not found.'})
+
+    def do_POST(self):
+        if not self.authorized():
+            return
+        if self.path.split('?', 1)[0].rstrip('/') != '/jobs':
+            self.respond(404, {'error': 'Not found.'})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length).decode('utf-8'))
+        except ValueError:
+            self.respond(400, {'error': 'Body must be JSON.'})
+            return
+        try:
+            jobs = self.server.job_queue.submit(request)
+        except JobError as error:
+            self.respond(400, {'error': str(error)})
+            return
+        self.respond(202, {'jobs': [job.as_dict() for job in jobs]})
+
+# Service options
+parser = argparse.ArgumentParser(description='Run the NSX and Arista provisioning scripts as a service with an HTTP/JSON job API')
+service_arg = parser.add_argument_group('Service Arguments')
+service_arg.add_argument('--listen', dest='listen', default='127.0.0.1', help='Address to serve the API on (default 127.0.0.1)')
+service_arg.add_argument('--port', dest='port', default=8080, type=int, help='Port to serve the API on (default 8080)')
+service_arg.add_argument('--workers', dest='workers', default=2, type=int, help='Number of jobs run at once, each in its own warm worker process (default 2)')
+service_arg.add_argument('--credentials-file', dest='credentials_file', default=None, help='JSON file of credential variables, like {"NSX_USERNAME": "admin"}.  The environment wins over the file')
+service_arg.add_argument('--inventory', dest='inventory', default='inventory.sqlite', help='Inventory file shared by every job (default inventory.sqlite, empty for none)')
+service_arg.add_argument('--job-history', dest='job_history', default=1000, type=int, help='Number of finished jobs to remember (default 1000)')
+args = parser.parse_args()
+if args.workers < 1:
+    print('--workers must be at least 1.')
+    sys.exit()
+if args.credentials_file:
+    load_credentials_file(args.credentials_file)
+
+try:
+    server = ServiceHTTPServer((args.listen, args.port), ServiceHandler)
+except (OSError, IOError) as error:
+    print('Unable to serve on ' + args.listen + ':' + str(args.port) + '. ' + str(error))
+    sys.exit()
+job_queue = JobQueue(args.workers, inventory=args.inventory or None, history=args.job_history)
+server.job_queue = job_queue
+print('Provisioning service listening on http://' + args.listen + ':' + str(server.server_address[1]) + ' with ' + str(args.workers) + ' worker(s).')
+sys.stdout.flush()
+try:
+    server.serve_forever()
+except KeyboardInterrupt:
+    print('Stopping.  Waiting for running jobs to finish.')
+server.server_close()
+job_queue.stop()
@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+
+# BSD 3-Clause License
+#
+# Copyright (c) 2018, Arista Networks EOS+
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name Arista nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+'''
+Client-side request budgets for NSX Manager, CVP and the switches.
+
+Each endpoint gets a RateLimiter that combines a token bucket (requests per
+second, with a burst allowance) with a cap on requests in flight.  Every
+NSX, CVP and eAPI attempt, retries included, waits for both before it is
+sent.  The limiter adapts the same way TCP does: a busy response (429, 502,
+503, 504), a timeout or latency climbing well above what the endpoint showed
+when it was healthy halves the budget, and every clean response wins a
+little of it back, up to the configured ceiling.  That keeps a run close to
+the highest rate the backend can actually sustain without bursting it over.
+
+Budgets are set per data center in the input JSON under "limits", with eapi
+applying to each switch on its own.  Any value left out uses the defaults.
+
+    "limits": {
+      "nsx": {"rate": 100, "burst": 20, "max_in_flight": 10},
+      "cvp": {"rate": 20, "burst": 10, "max_in_flight": 4},
+      "eapi": {"rate": 10, "burst": 5, "max_in_flight": 2}
+    }
+
+Created by Dimitri Capetz - dcapetz@arista.com
+'''
+
+# Import threading to share each budget across workers
+# Import time for refilling the token bucket and cooling off between cuts
+# Import the warm pool so the provisioning service keeps budgets between jobs
+# Import sys for various error handling
+import threading
+import time
+from warm_pool import keep_warm
+import sys
+
+# Budgets used for any endpoint or value the input JSON leaves out
+DEFAULT_LIMITS = {
+    'nsx': {'rate': 100, 'burst': 20, 'max_in_flight': 10},
+    'cvp': {'rate': 20, 'burst': 10, 'max_in_flight': 4},
+    'eapi': {'rate': 10, 'burst': 5, 'max_in_flight': 2}
+}
+
+class RateLimiter(object):
+    ''' Adaptive token bucket and in-flight cap for one endpoint
+
+    Args:
+        name (str): The endpoint, used in messages
+        rate (float): Most requests per second the endpoint is sent
+        burst (int): Requests that can go out back to back after a quiet spell
+        max_in_flight (int): Most requests waiting on the endpoint at once
+        min_rate (float): Floor the rate is never cut below
+        latency_factor (float): How far latency can climb over the healthy baseline before the budget is cut
+        cooldown (float): Seconds after a cut before the budget can be cut again
+    '''
+
+    def __init__(self, name, rate, burst, max_in_flight, min_rate=1, latency_factor=3, cooldown=1):
+        self.name = name
+        self.max_rate = float(rate)
+        self.max_in_flight = max_in_flight
+        self.min_rate = min(float(min_rate), self.max_rate)
+        self.latency_factor = latency_factor
+        self.cooldown = cooldown
+        self.burst = burst
+        self.condition = threading.Condition()
+        self.holders = threading.local()
+        self.rate = self.max_rate
+        self.in_flight_limit = max_in_flight
+        self.in_flight = 0
+        self.tokens = float(burst)
+        self.refilled = time.monotonic()
+        self.last_cut = 0
+        self.latency = None
+        self.baseline = None
+        self.samples = 0
+        self.clean_streak = 0
+        self.waited = 0.0
+        self.cuts = 0
+
+    def acquire(self):
+        ''' Block until a token and an in-flight slot are both free.  A thread
+            that already holds a slot (an NSX re-login in the middle of a call)
+            only waits for a token, so it can't deadlock on itself.
+        '''
+        nested = getattr(self.holders, 'count', 0) > 0
+        started = time.monotonic()
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.refilled) * self.rate)
+                self.refilled = now
+                if self.tokens >= 1 and (nested or self.in_flight < self.in_flight_limit):
+                    self.tokens -= 1
+                    self.in_flight += 1
+                    break
+                if self.tokens < 1:
+                    self.condition.wait((1 - self.tokens) / self.rate)
+                else:
+                    self.condition.wait()
+            self.waited += time.monotonic() - started
+        self.holders.count = getattr(self.holders, 'count', 0) + 1
+
+    def release(self, latency, busy=False):
+        ''' Hand back the in-flight slot and adapt the budget to how the call went
+
+        Args:
+            latency (float): Seconds the call took
+            busy (bool): True if the endpoint answered busy or didn't answer in time
+        '''
+        self.holders.count -= 1
+        with self.condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if not busy:
+                self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+                self.samples += 1
+                # The baseline drops straight to any new low but only drifts up slowly.
+                if self.baseline is None or self.latency < self.baseline:
+                    self.baseline = self.latency
+                else:
+                    self.baseline += 0.01 * (self.latency - self.baseline)
+                if self.samples >= 10 and self.latency > self.baseline * self.latency_factor:
+                    busy = True
+            if busy:
+                self.clean_streak = 0
+                if now - self.last_cut >= self.cooldown:
+                    # Multiplicative decrease, once per cooldown so a burst of errors from one overload counts once.
+                    self.last_cut = now
+                    self.cuts += 1
+                    self.rate = max(self.min_rate, self.rate / 2)
+                    self.in_flight_limit = max(1, self.in_flight_limit // 2)
+                    self.tokens = min(self.tokens, 1.0)
+            else:
+                # Additive increase back towards the configured ceiling.
+                self.clean_streak += 1
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 100)
+                if self.clean_streak >= self.in_flight_limit and self.in_flight_limit < self.max_in_flight:
+                    self.in_flight_limit += 1
+                    self.clean_streak = 0
+            self.condition.notify_all()
+
+    def summary(self):
+        ''' One line on how hard the budget was leaned on during the run '''
+        with self.condition:
+            return (self.name + ': ' + str(self.cuts) + ' cuts, now ' + str(round(self.rate, 1)) + '/' + str(round(self.max_rate, 1)) +
+                    ' req/s and ' + str(self.in_flight_limit) + '/' + str(self.max_in_flight) + ' in flight, ' +
+                    str(round(self.waited, 2)) + 's spent waiting')
+
+class EndpointLimits(object):
+    ''' The request budgets of one data center.  Switches each get their own
+        limiter, created the first time they are called.
+
+    Args:
+        limits (dict): The "limits" section of the data center in the input JSON, None for the defaults
+    '''
+
+    def __init__(self, limits=None):
+        limits = limits or {}
+        self.settings = {}
+        for endpoint, defaults in DEFAULT_LIMITS.items():
+            settings = dict(defaults)
+            settings.update(limits.get(endpoint) or {})
+            for key, value in settings.items():
+                # A burst below one never lets a call through, and max_in_flight counts whole calls.
+                if key not in defaults or not isinstance(value, (int, float)) or value <= 0 or (key != 'rate' and value < 1):
+                    print('Invalid ' + endpoint + ' limit ' + key + ' in input file.  Limits take a rate greater than zero, and burst and max_in_flight of at least one.')
+                    sys.exit()
+            self.settings[endpoint] = settings
+        for endpoint in limits:
+            if endpoint not in DEFAULT_LIMITS:
+                print('Unknown endpoint ' + endpoint + ' in input file limits.  Use nsx, cvp or eapi.')
+                sys.exit()
+        self.lock = threading.Lock()
+        self.limiters = {}
+
+    def limiter(self, endpoint, name):
+        ''' Return the limiter of one endpoint, building it on first use
+
+        Args:
+            endpoint (str): nsx, cvp or eapi
+            name (str): The NSX Manager, CVP cluster or switch it is for
+
+        Returns:
+            limiter (class): The RateLimiter for the endpoint
+        '''
+        with self.lock:
+            limiter = self.limiters.get(name)
+            if limiter is None:
+                settings = self.settings[endpoint]
+                # The provisioning service keeps what a limiter has learned about its endpoint between jobs.
+                limiter = keep_warm(('limit', name, settings['rate'], settings['burst'], settings['max_in_flight']),
+                                    lambda: RateLimiter(name, settings['rate'], int(settings['burst']), int(settings['max_in_flight'])))
+                self.limiters[name] = limiter
+            return limiter
+
+    def nsx(self, nsx_manager):
+        return self.limiter('nsx', 'NSX Manager ' + nsx_manager)
+
+    def cvp(self, cvps):
+        return self.limiter('cvp', 'CVP ' + ','.join(cvps))
+
+    def switch(self, switch):
+        return self.limiter('eapi', 'switch ' + switch)
+
+    def print_stats(self):
+        ''' Print the limiters that had to cut their budget or made calls wait '''
+        with self.lock:
+            limiters = list(self.limiters.values())
+        for limiter in limiters:
+            if limiter.cuts or limiter.waited >= 0.01:
+                print('Rate limit ' + limiter.summary())
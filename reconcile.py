@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+
+# BSD 3-Clause License
+#
+# Copyright (c) 2018, Arista Networks EOS+
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name Arista nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+'''
+Helpers for reconcile mode, where the input file is treated as the desired
+state of the fabric instead of a list of changes to make.
+
+The switchport config a script would push is split into interface blocks and
+compared line by line with what the switch already has, from its running-config
+or its switchports configlet.  Only the lines that are missing are planned, so
+running the same input file again finds nothing to change and writes nothing.
+
+Running-configs leave out EOS defaults, so "no shutdown" counts as present when
+the interface has no "shutdown" line and "switchport mode access" counts as
+present when it has no "switchport mode" line at all.
+
+Created by Dimitri Capetz - dcapetz@arista.com
+'''
+
+# Import OrderedDict to keep interfaces in the order they are configured
+from collections import OrderedDict
+
+def interface_blocks(commands):
+    ''' Split a flat list of config commands into the lines of each interface
+
+    Args:
+        commands (list): Config commands, each interface starting with "interface <name>"
+
+    Returns:
+        blocks (OrderedDict): Interface name to its list of config lines, in command order
+    '''
+    blocks = OrderedDict()
+    lines = None
+    for command in commands:
+        if command.startswith('interface '):
+            lines = blocks.setdefault(command[len('interface '):].strip(), [])
+        elif lines is not None:
+            lines.append(command.strip())
+    return blocks
+
+def config_lines(text):
+    ''' Pull the config lines out of the text of one interface section, like
+        the output of "show running-config interfaces Ethernet1"
+
+    Args:
+        text (str): The interface section, with or without its "interface" line
+
+    Returns:
+        lines (list): The stripped config lines, without the interface line and "!" separators
+    '''
+    lines = []
+    for line in text.splitlines():
+        line = line.strip()
+        if line and not line.startswith('!') and not line.startswith('interface '):
+            lines.append(line)
+    return lines
+
+def line_present(line, actual, eos_defaults=True):
+    ''' Check if one desired config line is already in effect
+
+    Args:
+        line (str): The desired config line
+        actual (list): The config lines the interface has now
+        eos_defaults (bool): True if actual comes from a running-config, which leaves defaults out
+
+    Returns:
+        present (bool): True if the line doesn't need to be configured
+    '''
+    if line in actual:
+        return True
+    if eos_defaults:
+        if line == 'no shutdown':
+            return 'shutdown' not in actual
+        if line == 'switchport mode access':
+            return not any(other.startswith('switchport mode ') for other in actual)
+    return False
+
+def missing_lines(desired, actual, eos_defaults=True):
+    ''' Find the desired config lines that aren't in effect yet
+
+    Args:
+        desired (list): The config lines the interface should have
+        actual (list): The config lines the interface has now
+        eos_defaults (bool): True if actual comes from a running-config, which leaves defaults out
+
+    Returns:
+        missing (list): The desired lines still to configure, in order
+    '''
+    return [line for line in desired if not line_present(line, actual, eos_defaults)]
+
+def config_delta(commands, running_configs):
+    ''' Cut a switch's config commands down to the lines its running-config is missing
+
+    Args:
+        commands (list): The full config commands for the switch
+        running_configs (dict): Interface name to its current config lines
+
+    Returns:
+        commands (list): "interface" lines each followed by only its missing lines.
+            Interfaces that already match are left out, so an empty list means nothing to change.
+    '''
+    delta = []
+    for name, lines in interface_blocks(commands).items():
+        missing = missing_lines(lines, running_configs.get(name, []))
+        if missing:
+            delta.append('interface ' + name)
+            delta.extend(missing)
+    return delta
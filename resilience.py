@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+
+# BSD 3-Clause License
+#
+# Copyright (c) 2018, Arista Networks EOS+
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name Arista nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+'''
+Retries and circuit breakers shared by the NSX, eAPI and CVP call layers.
+
+Idempotent calls (GETs, show commands) that fail with a connection error, a
+timeout or a busy response (429, 502, 503, 504) are retried with jittered
+exponential backoff instead of ending the run.  Each endpoint (an NSX
+Manager, a switch, a CVP cluster) gets its own CircuitBreaker.  Once an
+endpoint fails too many times in a row the breaker opens and calls to it
+fail fast for a cool-off period, so a sick manager isn't hammered by every
+worker at once.  After the cool-off one trial call is let through.
+
+Created by Dimitri Capetz - dcapetz@arista.com
+'''
+
+# Import random for backoff jitter
+# Import threading to share breaker state across workers
+# Import time for backoff sleeps, breaker cool-off and attempt latency
+import random
+import threading
+import time
+
+# HTTP status codes that mean the endpoint is busy rather than the request being wrong
+RETRY_STATUS_CODES = (429, 502, 503, 504)
+
+class CircuitOpenError(Exception):
+    ''' Raised instead of calling an endpoint whose circuit breaker is open '''
+
+class RetryPolicy(object):
+    ''' Jittered exponential backoff settings
+
+    Args:
+        retries (int): Extra attempts after the first one fails
+        backoff (float): Base delay in seconds, doubled on every attempt
+        maximum (float): Longest single delay in seconds
+    '''
+
+    def __init__(self, retries=3, backoff=0.5, maximum=10):
+        self.retries = retries
+        self.backoff = backoff
+        self.maximum = maximum
+
+    def delay(self, attempt, retry_after=None):
+        ''' Seconds to wait before a retry.  Full jitter keeps workers that
+            failed together from retrying together.
+
+        Args:
+            attempt (int): The retry number, starting at 1
+            retry_after (float): A Retry-After value from the endpoint, used as the floor
+
+        Returns:
+            delay (float): Seconds to sleep
+        '''
+        delay = random.uniform(0, min(self.maximum, self.backoff * (2 ** (attempt - 1))))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.maximum))
+        return delay
+
+    def sleep(self, attempt, retry_after=None):
+        time.sleep(self.delay(attempt, retry_after))
+
+class CircuitBreaker(object):
+    ''' Per endpoint circuit breaker
+
+    Args:
+        name (str): The endpoint, used in messages
+        threshold (int): Consecutive failures that open the breaker
+        reset_timeout (float): Seconds the breaker stays open before a trial call
+    '''
+
+    def __init__(self, name, threshold=5, reset_timeout=30):
+        self.name = name
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.opened = None
+        self.trial_running = False
+
+    @property
+    def state(self):
+        with self.lock:
+            if self.opened is None:
+                return 'closed'
+            if time.monotonic() - self.opened >= self.reset_timeout:
+                return 'half-open'
+            return 'open'
+
+    def allow(self):
+        ''' Check the breaker before calling the endpoint
+
+        Raises:
+            CircuitOpenError: If the breaker is open, or a trial call is already running
+        '''
+        with self.lock:
+            if self.opened is None:
+                return
+            if time.monotonic() - self.opened >= self.reset_timeout and not self.trial_running:
+                # Half-open.  Let exactly one call through to test the endpoint.
+                self.trial_running = True
+                return
+        raise CircuitOpenError(self.name + ' is unavailable, circuit breaker open after ' + str(self.threshold) + ' failures in a row')
+
+    def success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened = None
+            self.trial_running = False
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial_running or self.failures >= self.threshold:
+                if self.opened is None or self.trial_running:
+                    print('Circuit breaker for ' + self.name + ' opened after ' + str(self.failures) + ' failures.  Pausing calls for ' + str(self.reset_timeout) + 's.')
+                self.opened = time.monotonic()
+                self.trial_running = False
+
+def retry_call(call, policy, breaker, retry_exceptions=(), retry_result=None, limiter=None):
+    ''' Run an idempotent call with backoff retries behind a circuit breaker
+
+    Args:
+        call (function): Makes the call, takes no arguments
+        policy (class): The RetryPolicy, None to try once
+        breaker (class): The CircuitBreaker of the endpoint, None for no breaker
+        retry_exceptions (tuple): Exception types worth retrying
+        retry_result (function): Returns a Retry-After value (0 if none) for a
+            result that should be retried, None if the result is final
+        limiter (class): The RateLimiter of the endpoint every attempt waits on, None for no limit
+
+    Returns:
+        result, retries: The result of the last attempt and how many retries it took
+
+    Raises:
+        CircuitOpenError: If the breaker is open
+        The last retryable exception, once retries run out
+    '''
+    retries = policy.retries if policy is not None else 0
+    attempt = 0
+    while True:
+        if breaker is not None:
+            breaker.allow()
+        retry_after = None
+        if limiter is not None:
+            limiter.acquire()
+        started = time.monotonic()
+        try:
+            result = call()
+        except retry_exceptions:
+            if limiter is not None:
+                limiter.release(time.monotonic() - started, busy=True)
+            if breaker is not None:
+                breaker.failure()
+            if attempt >= retries:
+                raise
+        except Exception:
+            if limiter is not None:
+                limiter.release(time.monotonic() - started)
+            # Any other error means the endpoint answered, so it counts as healthy.
+            if breaker is not None:
+                breaker.success()
+            raise
+        else:
+            if retry_result is not None:
+                retry_after = retry_result(result)
+            if limiter is not None:
+                limiter.release(time.monotonic() - started, busy=retry_after is not None)
+            if retry_after is None:
+                if breaker is not None:
+                    breaker.success()
+                return result, attempt
+            if breaker is not None:
+                breaker.failure()
+            if attempt >= retries:
+                return result, attempt
+        attempt += 1
+        policy.sleep(attempt, retry_after or None)
+
+def add_retry_arguments(parser):
+    ''' Add the optional retry and circuit breaker arguments to a script's parser
+
+    Args:
+        parser (class): The argparse parser of the calling script
+    '''
+    retry_arg = parser.add_argument_group('Retry Arguments')
+    retry_arg.add_argument('--retries', dest='retries', default=3, type=int, help='Retries for idempotent NSX, eAPI and CVP calls that time out or find the endpoint busy (default 3)')
+    retry_arg.add_argument('--retry-backoff', dest='retry_backoff', default=0.5, type=float, help='Base seconds of the jittered exponential backoff between retries (default 0.5)')
+    retry_arg.add_argument('--breaker-threshold', dest='breaker_threshold', default=5, type=int, help='Failures in a row that stop calls to an endpoint for a while (default 5)')
+    retry_arg.add_argument('--breaker-reset', dest='breaker_reset', default=30, type=float, help='Seconds calls to a failing endpoint are paused for (default 30)')
+
+def retry_policy_from_args(args):
+    ''' Build the RetryPolicy for a run from the arguments added by add_retry_arguments '''
+    return RetryPolicy(retries=args.retries, backoff=args.retry_backoff)
+
+def breaker_from_args(args, name):
+    ''' Build a CircuitBreaker for one endpoint from the arguments added by add_retry_arguments '''
+    return CircuitBreaker(name, threshold=args.breaker_threshold, reset_timeout=args.breaker_reset)
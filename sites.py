@@ -0,0 +1,279 @@
+#!/usr/bin/env python
+
+# BSD 3-Clause License
+#
+# Copyright (c) 2018, Arista Networks EOS+
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name Arista nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+'''
+Multi data center runs from one input file.
+
+When the input file has more than one data center, the script doesn't pick
+the first one.  It asks for credentials once and then starts one child run
+of itself per data center, in parallel, each limited to its own site with
+--data-center.  Every site gets its own process, so its own NSX Manager and
+CVP connection pools, request budgets, retries and circuit breakers, and a
+site that fails or crashes can't take the others down with it.
+
+Child output is streamed with a [site] prefix.  Each child writes a small
+JSON report of how it went, and those are combined into one table at the
+end.  Files that would clash between sites (the metrics file, the Mlag
+cache file and the journal directory) get the site name added.  Sites share
+one run ID, so an interrupted multi data center run resumes with a single
+--resume, and sites that already finished are left alone.
+
+Credentials can differ per site by setting the site specific environment
+variable, like NSX_PASSWORD_DC02.  Everything else uses the one set of
+answers given at the prompt.
+
+Created by Dimitri Capetz - dcapetz@arista.com
+'''
+
+# Import argparse to hide the child only arguments from help
+# Import subprocess, os and sys for starting and following the child runs
+# Import json and tempfile for the child reports
+# Import atexit so a child that stops early still reports how it went
+# Import threading and concurrent.futures for running sites in parallel
+# Import time for site wall time
+# Import the credential prompt and the journal helpers for resumed runs
+import argparse
+import subprocess
+import os
+import sys
+import json
+import tempfile
+import atexit
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from credentials import prompt_credential, site_credentials
+from journal import new_run_id, run_finished
+
+# Options whose file or directory is given a per site name in child runs
+SITE_PATH_OPTIONS = ('--metrics-file', '--mlag-cache', '--journal-dir', '--output')
+
+class SiteReport(object):
+    ''' How one data center's child run went, written as JSON for the parent.
+        Until finish() is called the site counts as failed, so any early
+        exit of the child is reported as a failure.
+
+    Args:
+        path (str): Where the parent wants the report, None when not running as a child
+        data_center (str): The data center of the run
+    '''
+
+    def __init__(self, path, data_center):
+        self.path = path
+        self.data_center = data_center
+        self.status = 'failed'
+        self.counts = {}
+        self.failures = []
+        self.logical_switches = []
+        if path:
+            atexit.register(self.write)
+
+    def finish(self, status, bindings=(), logical_switches=(), failures=()):
+        ''' Record the outcome of the run
+
+        Args:
+            status (str): planned, applied or partial, or audited or drift for an audit
+            bindings (list): BindingResult objects of the run
+            logical_switches (list): (name, status) of each logical switch handled
+            failures (list): Anything else that went wrong, one line each
+        '''
+        self.status = status
+        self.failures.extend(failures)
+        for result in bindings:
+            self.counts[result.status] = self.counts.get(result.status, 0) + 1
+            if result.status == 'failed':
+                self.failures.append(result.switch + ' ' + result.port + (' - ' + result.message if result.message else ''))
+        self.logical_switches = [list(logical_switch) for logical_switch in logical_switches]
+
+    def write(self):
+        with open(self.path, 'w') as report_file:
+            json.dump({'data_center': self.data_center, 'status': self.status, 'counts': self.counts,
+                       'failures': self.failures, 'logical_switches': self.logical_switches}, report_file)
+
+def select_data_center(args, data):
+    ''' Work out which data center of the input file this run handles
+
+    Args:
+        args (class): The parsed argparse namespace
+        data (dict): The parsed input JSON
+
+    Returns:
+        data_center (str): The data center to run, None if every one should be run as its own child
+    '''
+    names = list(data['data_center'].keys())
+    if args.data_center is not None:
+        if args.data_center not in data['data_center']:
+            print('Data center ' + args.data_center + ' not found in input file.  Options are ' + ', '.join(names) + '.')
+            sys.exit()
+        return args.data_center
+    if len(names) == 1:
+        return names[0]
+    return None
+
+def site_argv(argv, data_center):
+    ''' Copy the command line for a child run, giving per site names to files that would clash
+
+    Args:
+        argv (list): The arguments of the parent run, without the script name
+        data_center (str): The data center of the child
+
+    Returns:
+        argv (list): The arguments for the child
+    '''
+    site_args = []
+    rename = False
+    for arg in argv:
+        if rename:
+            arg = site_path(arg, data_center)
+            rename = False
+        elif arg in SITE_PATH_OPTIONS:
+            rename = True
+        elif arg.split('=', 1)[0] in SITE_PATH_OPTIONS and '=' in arg:
+            option, value = arg.split('=', 1)
+            arg = option + '=' + site_path(value, data_center)
+        site_args.append(arg)
+    return site_args
+
+def site_path(path, data_center):
+    ''' Add the data center to a file name, before the extension '''
+    root, extension = os.path.splitext(path)
+    return root + '-' + data_center + extension
+
+def run_site(command, data_center, env, output_lock):
+    ''' Run one data center as a child process, streaming its output with a site prefix
+
+    Args:
+        command (list): The child command line, without the report argument
+        data_center (str): The data center of the child
+        env (dict): The environment for the child, credentials included
+        output_lock (class): Keeps lines from different sites whole
+
+    Returns:
+        report (dict): The child's report, with exit code and wall time added
+    '''
+    report_file, report_path = tempfile.mkstemp(prefix='arista-nsx-' + data_center + '-', suffix='.json')
+    os.close(report_file)
+    os.remove(report_path)
+    started = time.monotonic()
+    child = subprocess.Popen(command + ['--site-report', report_path], env=env, stdin=subprocess.DEVNULL,
+                             stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+    for line in child.stdout:
+        with output_lock:
+            print('[' + data_center + '] ' + line.rstrip('\n'))
+            sys.stdout.flush()
+    exit_code = child.wait()
+    report = {'data_center': data_center, 'status': 'failed', 'counts': {}, 'failures': [], 'logical_switches': []}
+    try:
+        with open(report_path) as report_file:
+            report.update(json.load(report_file))
+        os.remove(report_path)
+    except (IOError, ValueError):
+        report['failures'].append('no report from the run, it exited with code ' + str(exit_code))
+    # An audit that found drift exits with 1 on purpose.
+    if exit_code != 0 and report['status'] not in ('failed', 'drift'):
+        report['status'] = 'failed'
+        report['failures'].append('exited with code ' + str(exit_code))
+    report['exit_code'] = exit_code
+    report['wall_time'] = time.monotonic() - started
+    return report
+
+def run_sites(args, data, credentials):
+    ''' Run every data center of the input file as its own child run, in parallel,
+        print one combined report and end the run.  One site failing doesn't stop the others.
+
+    Args:
+        args (class): The parsed argparse namespace of the calling script
+        data (dict): The parsed input JSON
+        credentials (list): (prompt, environment variable, secret) of each credential the script needs
+    '''
+    names = list(data['data_center'].keys())
+    print('Input file has ' + str(len(names)) + ' data centers: ' + ', '.join(names) + '.  Running them in parallel.')
+    env = dict(os.environ)
+    for prompt, env_var, secret in credentials:
+        # Skip the prompt when every site has its own value for this credential.
+        if all(os.environ.get(env_var + '_' + name.upper()) for name in names):
+            continue
+        env[env_var] = prompt_credential(prompt, env_var, secret)
+    run_id = args.resume or new_run_id()
+    script = os.path.splitext(os.path.basename(sys.argv[0]))[0]
+    output_lock = threading.Lock()
+
+    def start(name):
+        if args.resume and run_finished(site_path(args.journal_dir, name), run_id, script):
+            return {'data_center': name, 'status': 'finished', 'counts': {}, 'failures': [], 'logical_switches': [],
+                    'exit_code': 0, 'wall_time': 0.0}
+        site_env = dict(env)
+        site_env.update(site_credentials(credentials, name, env))
+        command = [sys.executable, os.path.abspath(sys.argv[0])] + site_argv(sys.argv[1:], name) + ['--data-center', name]
+        if args.apply and not args.resume:
+            command += ['--run-id', run_id]
+        return run_site(command, name, site_env, output_lock)
+
+    with ThreadPoolExecutor(max_workers=args.site_workers or len(names)) as pool:
+        reports = list(pool.map(start, names))
+    print_site_report(reports)
+    if args.apply and any(report['status'] not in ('applied', 'finished') for report in reports):
+        print('Re-run with --resume ' + run_id + ' to finish the data centers that did not complete.')
+    sys.exit(0 if all(report['status'] in ('planned', 'applied', 'finished', 'audited') for report in reports) else 1)
+
+def print_site_report(reports):
+    ''' Print one table of every data center and list what failed
+
+    Args:
+        reports (list): Site reports from run_site
+    '''
+    header = ('Data Center', 'Status', 'Logical Switches', 'Bound', 'Skipped', 'Done', 'Failed', 'Wall (s)')
+    rows = []
+    for report in reports:
+        counts = report['counts']
+        rows.append((report['data_center'], report['status'], str(len(report['logical_switches'])), str(counts.get('bound', 0)),
+                     str(counts.get('skipped', 0)), str(counts.get('done', 0)), str(counts.get('failed', 0)),
+                     '{:.1f}'.format(report['wall_time'])))
+    widths = [max(len(row[column]) for row in [header] + rows) for column in range(len(header))]
+    print('Data center summary:')
+    for row in [header] + rows:
+        print('  '.join(row[column].ljust(widths[column]) for column in range(len(header))).rstrip())
+    for report in reports:
+        for failure in report['failures']:
+            print(report['data_center'] + ': ' + failure)
+
+def add_site_arguments(parser):
+    ''' Add the optional multi data center arguments to a script's parser
+
+    Args:
+        parser (class): The argparse parser of the calling script
+    '''
+    site_arg = parser.add_argument_group('Data Center Arguments')
+    site_arg.add_argument('--data-center', dest='data_center', default=None, help='Run only this data center of the input file (default all of them, in parallel)')
+    site_arg.add_argument('--site-workers', dest='site_workers', default=0, type=int, help='Maximum number of data centers run at once (default all)')
+    # Set by the parent run on each child to collect its report.
+    site_arg.add_argument('--site-report', dest='site_report', default=None, help=argparse.SUPPRESS)
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+
+# BSD 3-Clause License
+#
+# Copyright (c) 2018, Arista Networks EOS+
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name Arista nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+'''
+Switchport config templates shared by the eAPI and CVP scripts.
+
+Each port of the input file is read once into a SwitchPort record.  The
+config lines for every combination of port type (Ethernet, Port-channel or
+Port-channel member), port mode and Mlag are laid out once per target when
+the module is imported, as str.format templates: a list of commands for eAPI
+and one block of text for a configlet.  Rendering a port is a dict lookup and
+a format call instead of a chain of if/elif string building.
+
+    eapi_commands(ports, vlan_id)      flat eAPI config command list
+    configlet_blocks(ports, vlan_id)   configlet interface blocks
+
+Both render a whole batch of ports in one call.  Each target keeps the line
+order it has always used, so configlets written by older runs still compare
+equal line for line.
+
+Created by Dimitri Capetz - dcapetz@arista.com
+'''
+
+# Import namedtuple for the port records
+from collections import namedtuple
+
+SwitchPort = namedtuple('SwitchPort', ['name', 'mode', 'description', 'speed', 'local_members', 'is_port_channel', 'is_mlag', 'channel_id'])
+
+PORT_MODES = ('trunk', 'trunk native', 'access')
+
+# Lines that set the vlan for each port mode.  These templates can be changed at will.
+MODE_LINES = {
+    'trunk': ['switchport trunk allowed vlan {vlan}', 'switchport mode trunk'],
+    'trunk native': ['switchport trunk native vlan {vlan}', 'switchport mode trunk'],
+    'access': ['switchport access vlan {vlan}', 'switchport mode access'],
+}
+MEMBER_LINES = ['description {description}', 'channel-group {channel_id} mode active', 'speed forced {speed}', 'no shutdown']
+
+def template_lines(target, is_port_channel, mode, is_mlag):
+    ''' The config lines of one kind of port, in the order the target has always used
+
+    Args:
+        target (str): 'eapi' or 'configlet'
+        is_port_channel (bool): True for a Port-channel, False for an Ethernet port
+        mode (str): One of PORT_MODES
+        is_mlag (bool): True for an Mlag Port-channel
+
+    Returns:
+        lines (list): The config lines with {description}, {speed}, {channel_id} and {vlan} fields
+    '''
+    lines = ['description {description}']
+    if target == 'eapi':
+        lines += MODE_LINES[mode] + ['no shutdown']
+        if not is_port_channel:
+            lines.append('speed forced {speed}')
+        elif is_mlag:
+            lines.append('mlag {channel_id}')
+    else:
+        if not is_port_channel:
+            lines.append('speed forced {speed}')
+        lines += MODE_LINES[mode]
+        if is_port_channel and is_mlag:
+            lines.append('mlag {channel_id}')
+        lines.append('no shutdown')
+    return lines
+
+def build_templates():
+    ''' Lay out the config lines of every port kind for both targets
+
+    Returns:
+        templates (dict): (target, is_port_channel, mode, is_mlag) to its template, plus (target, 'member').
+            eAPI templates are lists of commands, configlet templates one block of text.
+    '''
+    templates = {}
+    for target in ('eapi', 'configlet'):
+        kinds = [(('member',), MEMBER_LINES)]
+        for mode in PORT_MODES:
+            for is_port_channel in (False, True):
+                for is_mlag in (False, True):
+                    kinds.append(((is_port_channel, mode, is_mlag), template_lines(target, is_port_channel, mode, is_mlag)))
+        for kind, lines in kinds:
+            lines = ['interface {name}'] + lines
+            templates[(target,) + kind] = lines if target == 'eapi' else '\n   '.join(lines)
+    return templates
+
+TEMPLATES = build_templates()
+
+def template_fields(name, port, vlan_id):
+    ''' The values filled into a template for one interface of a port
+
+    Args:
+        name (str): The interface, the port itself or one of its Port-channel members
+        port (namedtuple): The SwitchPort record
+        vlan_id (str): The vlan ID of the logical switch
+
+    Returns:
+        fields (dict): name, description, speed, channel_id and vlan
+    '''
+    return {'name': name, 'description': port.description, 'speed': port.speed, 'channel_id': port.channel_id, 'vlan': vlan_id}
+
+def switch_port_records(switch_ports):
+    ''' Read the port_configs entry of one switch into SwitchPort records.
+        Callers check each mode against PORT_MODES first.
+
+    Args:
+        switch_ports (dict): A dictionary containing configuration attributes
+
+    Returns:
+        ports (list): SwitchPort records, in input order
+    '''
+    ports = []
+    for port, config in switch_ports.items():
+        if port.startswith('Port'):
+            ports.append(SwitchPort(port, config['mode'], config['description'], config['speed'], config['local_members'], True,
+                                    config['is_mlag'] == True, port.split('l')[1]))
+        else:
+            ports.append(SwitchPort(port, config['mode'], config['description'], config['speed'], (), False, False, ''))
+    return ports
+
+def eapi_commands(ports, vlan_id):
+    ''' Render the eAPI config commands for a batch of ports.  Port-channel
+        members are configured ahead of their Port-channel.
+
+    Args:
+        ports (list): SwitchPort records
+        vlan_id (str): The vlan ID of the logical switch
+
+    Returns:
+        commands (list): The config commands for every port, in input order
+    '''
+    member_template = TEMPLATES[('eapi', 'member')]
+    commands = []
+    for port in ports:
+        for member in port.local_members:
+            fields = template_fields(member, port, vlan_id)
+            commands.extend(line.format_map(fields) for line in member_template)
+        fields = template_fields(port.name, port, vlan_id)
+        commands.extend(line.format_map(fields) for line in TEMPLATES[('eapi', port.is_port_channel, port.mode, port.is_mlag)])
+    return commands
+
+def configlet_blocks(ports, vlan_id):
+    ''' Render the configlet interface blocks for a batch of ports
+
+    Args:
+        ports (list): SwitchPort records
+        vlan_id (str): The vlan ID of the logical switch
+
+    Returns:
+        port_channel_blocks (list), ethernet_blocks (list): Block text of the Port-channels, and of
+            the Ethernet ports and Port-channel members, in input order
+    '''
+    member_template = TEMPLATES[('configlet', 'member')]
+    port_channel_blocks = []
+    ethernet_blocks = []
+    for port in ports:
+        for member in port.local_members:
+            ethernet_blocks.append(member_template.format_map(template_fields(member, port, vlan_id)))
+        block = TEMPLATES[('configlet', port.is_port_channel, port.mode, port.is_mlag)].format_map(template_fields(port.name, port, vlan_id))
+        if port.is_port_channel:
+            port_channel_blocks.append(block)
+        else:
+            ethernet_blocks.append(block)
+    return port_channel_blocks, ethernet_blocks
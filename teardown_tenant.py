@@ -0,0 +1,510 @@
+#!/usr/bin/env python
+
+# BSD 3-Clause License
+#
+# Copyright (c) 2018, Arista Networks EOS+
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name Arista nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+'''
+This script is the inverse of the others.  It tears a tenant down using the
+same input file that built it: the NSX hardware bindings of every port are
+deleted, the interface config is taken back off the switches and the
+tenant logical switch is removed.
+
+Work is done in the order NSX needs, with everything that doesn't depend on
+each other running at the same time.  Bindings are deleted in parallel.  Each
+switch is deconfigured in a single pass (one EOS config session, or one
+configlet update) as soon as its own ports are unbound, while the bindings of
+other switches are still going.  The logical switch is deleted as soon as all
+of its bindings are gone.  A switch with a binding that couldn't be deleted
+is left configured, and a logical switch that still has bindings that aren't
+in the input file is kept.
+
+Switch config comes off via eAPI by default, or from the "<switch> Switchports"
+configlets with --switch-config cvp.  Use --switch-config none for ports that
+are shared by every logical switch, like the ones create_logical_switch.py binds.
+If the input file has a "tenants" list, every logical switch in it is torn down.
+
+Nothing is changed unless the script is run with --apply.  Without it, every
+binding, switch and configlet is read and the planned teardown is printed for
+review.  Ports that have already been torn down are left out, so running it
+again is safe.
+
+Please note that all SSL verification is disabled.  If you have signed certs
+in place for NSX Manager, you can set verify=True where the NsxClient is
+built in nsx_client.py.
+
+Created by Dimitri Capetz - dcapetz@arista.com
+'''
+
+# Import the shared NSX client for pooled API Calls to NSX Manager
+# Import the paged logical switch lookup
+# Import the binding index and unbind executor for concurrent binding deletes
+# Import the eAPI helpers for switch connections and cached Mlag domain lookups
+# Import the reconcile helpers for reading running-configs
+# Import argparse for pulling in file input via command line
+# Import json for working with json objects
+# Import pyEAPI for configuration of Arista Switches
+# Import CVP REST API Client for configuration of Arista Switches through CVP
+# Import the CVP task helpers for polling task completion
+# Import the configlet model for removing interface blocks
+# Import the streaming port file reader for large inventories
+# Import the change plan for reviewing changes before they are made
+# Import the run metrics for per phase timings
+# Import the retry and circuit breaker settings
+# Import the per data center request budgets
+# Import the inventory cache for NSX and fabric state kept between runs
+# Import the run journal for resuming interrupted runs
+# Import the credential prompts and the multi data center runner
+# Import the warm pool so the provisioning service keeps the CVP login between jobs
+# Import concurrent.futures for running the teardown stages in parallel
+# Import uuid for naming EOS config sessions
+# Import sys for various error handling
+from nsx_client import NsxUnavailable, add_nsx_arguments, nsx_client_from_args
+from nsx_virtualwires import VirtualWireIndex
+from nsx_bindings import BindingIndex, HardwareUnbindExecutor, add_binding_arguments
+from eapi_client import MlagDomainCache, add_mlag_cache_arguments, eapi_connect
+from reconcile import config_lines
+import argparse
+import json
+import pyeapi
+from cvprac.cvp_client import CvpClient
+from cvprac.cvp_client_errors import CvpApiError, CvpLoginError
+from cvp_tasks import execute_tasks, incomplete_switches, wait_for_pending_tasks, wrap_cvp_client
+from configlet import SwitchportConfiglet
+from port_inventory import add_port_arguments, has_mlag_ports, port_configs_from_args
+from change_plan import ChangePlan, ConfigletChange, add_plan_arguments, review_plan
+from metrics import add_metrics_arguments, metrics_from_args
+from resilience import add_retry_arguments, breaker_from_args, retry_call, retry_policy_from_args
+from rate_limit import EndpointLimits
+from inventory import add_inventory_arguments, inventory_from_args
+from journal import add_journal_arguments, journal_from_args
+from credentials import CVP_CREDENTIALS, NSX_CREDENTIALS, SWITCH_CREDENTIALS, prompt_credential
+from sites import SiteReport, add_site_arguments, run_sites, select_data_center
+from warm_pool import keep_warm
+from concurrent.futures import ThreadPoolExecutor, wait
+import uuid
+import sys
+
+def connect_switch(switch):
+    ''' Connect to a switch over eAPI with the credentials, metrics, retry settings and request budget of the run
+
+    Args:
+        switch (str): The IP address or FQDN of the Arista switch
+
+    Returns:
+        switch_node (class): The connected pyeapi node
+    '''
+    return eapi_connect(switch, switch_username, switch_password, switch_addresses.get(switch), metrics=metrics,
+                        retry_policy=retry_policy_from_args(args), breaker=breaker_from_args(args, 'switch ' + switch),
+                        limiter=limits.switch(switch))
+
+def cvp_login():
+    ''' Log in to the CVP cluster.  Logging in is safe to repeat, so a busy or
+        unreachable cluster is retried with backoff.
+
+    Returns:
+        cvp (class): The logged in CvpClient
+    '''
+    cvp = CvpClient(syslog=True, filename='cvprac_log')
+    try:
+        retry_call(lambda: cvp.connect(cvps, cvp_username, cvp_password, port=cvp_port), retry_policy_from_args(args), None,
+                   retry_exceptions=(CvpLoginError,))
+    except CvpLoginError as error:
+        print('Unable to login to CVP. ' + str(error).strip())
+        sys.exit()
+    return cvp
+
+def teardown_interfaces(switch_ports):
+    ''' List the interfaces of a switch to deconfigure, Port-channel members included
+
+    Args:
+        switch_ports (dict): A dictionary containing configuration attributes
+
+    Returns:
+        interfaces (list): Interface names, each member ahead of its Port-channel
+    '''
+    interfaces = []
+    for port, config in switch_ports.items():
+        if port.startswith('Port'):
+            interfaces.extend(config['local_members'])
+        interfaces.append(port)
+    return interfaces
+
+def eapi_teardown_plan(switch, switch_ports):
+    ''' Connect to a switch and work out the commands that take its ports back
+        to defaults.  Ports without any config are left out.  Nothing is changed.
+
+    Args:
+        switch (str): The IP address or FQDN of the Arista switch
+        switch_ports (dict): A dictionary containing configuration attributes
+
+    Returns:
+        switch_node (class), commands (list): The connected node and the teardown commands, empty if there is nothing to remove
+    '''
+    switch_node = connect_switch(switch)
+    print('Checking current config of ' + switch + ' ports before teardown begins...')
+    interfaces = teardown_interfaces(switch_ports)
+    port_configs = switch_node.enable(['show running-config interfaces ' + interface for interface in interfaces], encoding='text', strict=True)
+    commands = []
+    for interface, port_config in zip(interfaces, port_configs):
+        if not config_lines(port_config['result']['output']):
+            continue
+        if interface.startswith('Port'):
+            commands.append('no interface ' + interface)
+        else:
+            commands.append('default interface ' + interface)
+    return switch_node, commands
+
+def configlet_teardown_plan(switch, switch_ports):
+    ''' Plan taking the interface blocks of a switch's ports out of its
+        switchports configlet.  Only reads from CVP, nothing is changed.
+
+    Args:
+        switch (str): The name of the switch to be deconfigured
+        switch_ports (dict): A dictionary containing configuration attributes
+
+    Returns:
+        configlet_change (class): The planned ConfigletChange, None if the configlet has none of the ports
+    '''
+    switch_configlet_name = switch + ' Switchports'
+    try:
+        switch_configlet_data = cvp.api.get_configlet_by_name(switch_configlet_name)
+    except CvpApiError:
+        switch_configlet_data = None
+    if switch_configlet_data is None:
+        return None
+    switch_configlet = SwitchportConfiglet(switch_configlet_data['config'])
+    if not switch_configlet.remove(teardown_interfaces(switch_ports)):
+        return None
+    return ConfigletChange(switch, switch_configlet_name, switch_configlet_data['key'], switch_configlet_data['config'], switch_configlet.render())
+
+def switch_teardown(switch, binding_futures):
+    ''' Deconfigure one switch once every binding its ports depend on is gone
+
+    Args:
+        switch (str): The IP address or FQDN of the Arista switch
+        binding_futures (list): Futures of the binding deletes for the switch's ports
+
+    Returns:
+        status (str): 'deconfigured', 'kept' if a binding couldn't be deleted, or 'failed'
+    '''
+    wait(binding_futures)
+    if any(future.exception() is not None or future.result().status != 'unbound' for future in binding_futures):
+        print(switch + ' still has NSX bindings.  Leaving its config in place.')
+        return 'kept'
+    if args.switch_config == 'cvp':
+        configlet_change = configlet_changes[switch]
+        print('Removing ' + switch + ' ports from ' + configlet_change.name + ' configlet...')
+        try:
+            cvp.api.update_configlet(configlet_change.new_config, configlet_change.key, configlet_change.name)
+        except CvpApiError as error:
+            print(configlet_change.name + ' configlet update failed: ' + str(error))
+            return 'failed'
+        journal.record('configlet', switch, name=configlet_change.name)
+        return 'deconfigured'
+    switch_node = switch_nodes[switch]
+    commands = switch_commands[switch]
+    print('Deconfiguring ' + switch + ' ' + ', '.join(switch_ports[switch].keys()) + '...')
+    if args.config_session == True:
+        session_name = 'nsx-teardown-' + uuid.uuid4().hex[:8]
+        try:
+            switch_node.run_commands(['configure session ' + session_name] + commands + ['commit'])
+        except pyeapi.eapilib.CommandError as error:
+            print(switch + ' rejected teardown: ' + str(error.message))
+            switch_node.run_commands(['configure session ' + session_name, 'abort'])
+            return 'failed'
+    else:
+        try:
+            switch_node.config(commands)
+        except pyeapi.eapilib.CommandError as error:
+            print(switch + ' rejected teardown: ' + str(error.message))
+            return 'failed'
+    print('Saving ' + switch + ' configuration...')
+    switch_node.enable('write')
+    journal.record('switch_teardown', switch)
+    return 'deconfigured'
+
+def delete_logical_switch(ls_name, virtualwire, unbind_executor, binding_futures):
+    ''' Delete a logical switch once every one of its bindings is gone.  A
+        logical switch that is already gone counts as deleted.
+
+    Args:
+        ls_name (str): The name of the logical switch
+        virtualwire (namedtuple): Its VirtualWire record
+        unbind_executor (class): The HardwareUnbindExecutor of the logical switch
+        binding_futures (list): Futures of every binding delete on it
+
+    Returns:
+        status (str): 'deleted', 'kept' if it still has bindings, or 'failed'
+    '''
+    wait(binding_futures)
+    if len(unbind_executor.binding_index):
+        print('Logical Switch ' + ls_name + ' still has ' + str(len(unbind_executor.binding_index)) + ' binding(s).  Keeping it.')
+        unbind_executor.binding_index.save()
+        return 'kept'
+    try:
+        response = nsx.send('DELETE', 'virtualwires/' + virtualwire.object_id, retry=True)
+    except NsxUnavailable as error:
+        print('Error deleting Logical Switch ' + ls_name + ': ' + str(error))
+        return 'failed'
+    if response.status_code not in (200, 204, 404):
+        print('Error deleting Logical Switch ' + ls_name + ': HTTP ' + str(response.status_code))
+        return 'failed'
+    print('Logical Switch ' + ls_name + ' deleted.')
+    virtualwires.forget(ls_name)
+    inventory.invalidate(nsx_scope, 'bindings', virtualwire.object_id)
+    journal.record('logical_switch_deleted', ls_name, ls_id=virtualwire.object_id)
+    return 'deleted'
+
+def execute_pending_tasks(configured_switches):
+    ''' Executes pending tasks in CVP for the configlets that changed and polls
+        each one until it finishes
+
+    Args:
+        configured_switches (list): The switches that had configlet changes
+
+    Returns:
+        task_results (list): TaskResult objects for every executed task
+    '''
+    pending_tasks = wait_for_pending_tasks(cvp, configured_switches, cvp_username, timeout=args.task_wait)
+    print('Waiting for ' + str(len(pending_tasks)) + ' task(s) to complete...')
+    task_results = execute_tasks(cvp, pending_tasks, timeout=args.task_timeout)
+    for result in task_results:
+        if result.status == 'Completed':
+            journal.record('task', result.switch, task_id=result.task_id)
+    return task_results
+
+# Pull in JSON file from command line argument
+parser = argparse.ArgumentParser(description='Remove the NSX bindings, switchport config and logical switch of a tenant')
+required_arg = parser.add_argument_group('Required Arguments')
+required_arg.add_argument('-j', '--json', dest='json', required=True, help='Input JSON file the tenant was built from', type=open)
+add_port_arguments(parser)
+add_nsx_arguments(parser)
+add_binding_arguments(parser)
+add_mlag_cache_arguments(parser)
+add_inventory_arguments(parser)
+add_plan_arguments(parser)
+add_journal_arguments(parser)
+add_site_arguments(parser)
+add_metrics_arguments(parser)
+add_retry_arguments(parser)
+teardown_arg = parser.add_argument_group('Teardown Arguments')
+teardown_arg.add_argument('--switch-config', dest='switch_config', default='eapi', choices=['eapi', 'cvp', 'none'],
+                          help='Remove switchport config via eAPI (default), from the CVP switchports configlets, or not at all')
+teardown_arg.add_argument('--keep-logical-switch', dest='keep_logical_switch', action='store_true', help='Remove the bindings and switch config but keep the logical switch')
+teardown_arg.add_argument('--switch-workers', dest='switch_workers', default=0, type=int, help='Maximum number of switches deconfigured at once (default all)')
+teardown_arg.add_argument('--no-config-session', dest='config_session', action='store_false', help='Push config without an EOS config session (for EOS versions without session support)')
+teardown_arg.add_argument('--task-wait', dest='task_wait', default=15, type=float, help='Seconds to wait for configlet changes to show up as CVP tasks (default 15)')
+teardown_arg.add_argument('--task-timeout', dest='task_timeout', default=600, type=float, help='Seconds to wait for CVP tasks to finish (default 600)')
+args = parser.parse_args()
+data = json.load(args.json)
+
+# Run every data center in the input file as its own parallel run when there is more than one
+data_center = select_data_center(args, data)
+if data_center is None:
+    mlag_ports = has_mlag_ports(args, data)
+    run_sites(args, data, NSX_CREDENTIALS + (CVP_CREDENTIALS if args.switch_config == 'cvp' else []) +
+              (SWITCH_CREDENTIALS if args.switch_config == 'eapi' or mlag_ports else []))
+site_report = SiteReport(args.site_report, data_center)
+metrics = metrics_from_args(args, 'teardown_tenant')
+# Ports come from --ports when it is given.  Its digest goes into data so a resumed run must use the same file.
+switch_ports = port_configs_from_args(args, data, data_center)
+journal = journal_from_args(args, 'teardown_tenant', data)
+
+# Set Variables from JSON object.  The logical switch names are worked out the same way the other scripts build them.
+if 'tenants' in data:
+    tenants = data['tenants']
+else:
+    tenants = [{'tenant_name': data['tenant_name'], 'zone_name': data['zone_name']}]
+nsx_manager = data['data_center'][data_center]['nsx_manager']
+switches = data['data_center'][data_center]['switches']
+# Optional map of switch name to IP address (or address:port) for switches without DNS
+switch_addresses = data['data_center'][data_center].get('switch_addresses', {})
+# Optional request budgets for NSX Manager, CVP and each switch
+limits = EndpointLimits(data['data_center'][data_center].get('limits'))
+ls_names = ['vls' + data_center + tenant['tenant_name'] + tenant['zone_name'] for tenant in tenants]
+mlag_switches = [switch for switch in switches if any(port.startswith('Port') and config['is_mlag'] == True for port, config in switch_ports[switch].items())]
+
+# Set Variables for Login
+nsx_username = prompt_credential('NSX Manager Username: ', 'NSX_USERNAME')
+nsx_password = prompt_credential('NSX Manager Password: ', 'NSX_PASSWORD', secret=True)
+if args.switch_config == 'eapi' or mlag_switches:
+    switch_username = prompt_credential('Switch Username: ', 'SWITCH_USERNAME')
+    switch_password = prompt_credential('Switch Password: ', 'SWITCH_PASSWORD', secret=True)
+if args.switch_config == 'cvp':
+    cvp_username = prompt_credential('CVP Username: ', 'CVP_USERNAME')
+    cvp_password = prompt_credential('CVP Password: ', 'CVP_PASSWORD', secret=True)
+    cvps = data['data_center'][data_center]['cvps']
+    cvp_port = data['data_center'][data_center].get('cvp_port')
+
+# Open one pooled session to NSX Manager for the whole run
+nsx = nsx_client_from_args(args, nsx_manager, nsx_username, nsx_password, metrics=metrics, limits=limits)
+inventory = inventory_from_args(args)
+nsx_scope = 'nsx:' + nsx_manager
+virtualwires = VirtualWireIndex(nsx, 'virtualwires', page_size=args.nsx_page_size, inventory=inventory)
+if args.switch_config == 'cvp':
+    # The provisioning service keeps the logged in client for later jobs.
+    cvp = keep_warm(('cvp', tuple(cvps), cvp_port, cvp_username, cvp_password), cvp_login)
+    wrap_cvp_client(cvp, metrics=metrics, retry_policy=retry_policy_from_args(args), breaker=breaker_from_args(args, 'CVP'), limiter=limits.cvp(cvps))
+
+metrics.phase('lookup')
+
+# Read everything the plan needs in one concurrent batch: the logical switches and their bindings
+# from NSX, the Mlag Domain IDs, and the current config of every switch or configlet.
+# Switches and logical switches an earlier attempt of this run already finished are left out.
+config_switches = []
+if args.switch_config != 'none':
+    done_step = 'switch_teardown' if args.switch_config == 'eapi' else 'configlet'
+    for switch in switches:
+        if bool(switch_ports[switch]) == False:
+            continue
+        if journal.done(done_step, switch):
+            print(switch + ' was deconfigured by an earlier attempt of this run.')
+            continue
+        config_switches.append(switch)
+mlag_cache = MlagDomainCache(connect_switch, cache_file=args.mlag_cache, ttl=args.mlag_cache_ttl, inventory=inventory)
+with ThreadPoolExecutor(max_workers=(args.switch_workers or len(config_switches)) + len(ls_names) + 1) as pool:
+    mlag_future = pool.submit(mlag_cache.prefetch, mlag_switches, args.switch_workers or len(mlag_switches) or 1)
+    if args.switch_config == 'eapi':
+        switch_futures = dict((switch, pool.submit(eapi_teardown_plan, switch, switch_ports[switch])) for switch in config_switches)
+    elif args.switch_config == 'cvp':
+        switch_futures = dict((switch, pool.submit(configlet_teardown_plan, switch, switch_ports[switch])) for switch in config_switches)
+    virtualwire_futures = dict((ls_name, pool.submit(virtualwires.find, ls_name, True)) for ls_name in ls_names
+                               if not journal.done('logical_switch_deleted', ls_name))
+mlag_future.result()
+
+# Pull the binding list of each logical switch straight from NSX, as deleting a binding needs its ID
+tenant_switches = []
+for ls_name in ls_names:
+    if ls_name not in virtualwire_futures:
+        print('Logical Switch ' + ls_name + ' was deleted by an earlier attempt of this run.')
+        continue
+    virtualwire = virtualwire_futures[ls_name].result()
+    if virtualwire is None:
+        print('Logical Switch ' + ls_name + ' not found in NSX.  Nothing to unbind.')
+        continue
+    tenant_switches.append((ls_name, virtualwire))
+with ThreadPoolExecutor(max_workers=len(tenant_switches) or 1) as pool:
+    binding_indexes = list(pool.map(lambda tenant_switch: BindingIndex(nsx, tenant_switch[1].object_id, None, inventory), tenant_switches))
+for binding_index in binding_indexes:
+    if binding_index.from_inventory:
+        binding_index.refresh()
+
+# Plan every binding delete, switch change and logical switch delete before anything is written
+plan = ChangePlan()
+unbind_executors = []
+for (ls_name, virtualwire), binding_index in zip(tenant_switches, binding_indexes):
+    unbind_executor = HardwareUnbindExecutor(nsx, virtualwire.object_id, ls_name, None, binding_index, mlag_lookup=mlag_cache.lookup,
+                                             max_workers=args.binding_workers, journal=journal)
+    for switch in switches:
+        unbind_executor.add_switch(switch, switch_ports[switch])
+    planned = [result for result in unbind_executor.plan() if result.status == 'planned']
+    plan.add_unbindings(unbind_executor)
+    unbind_executors.append(unbind_executor)
+    if args.keep_logical_switch:
+        continue
+    if len(binding_index) > len(planned):
+        print('Logical Switch ' + ls_name + ' has ' + str(len(binding_index) - len(planned)) + ' binding(s) that aren\'t in the input file.  It will be kept.')
+        continue
+    plan.delete_logical_switch(ls_name)
+switch_nodes = {}
+switch_commands = {}
+configlet_changes = {}
+for switch in config_switches:
+    if args.switch_config == 'eapi':
+        switch_nodes[switch], commands = switch_futures[switch].result()
+        if commands:
+            switch_commands[switch] = commands
+            plan.add_switch_commands(switch, commands)
+    else:
+        configlet_change = switch_futures[switch].result()
+        if configlet_change is not None:
+            configlet_changes[switch] = configlet_change
+            plan.add_configlet(configlet_change)
+teardown_switches = [switch for switch in config_switches if switch in switch_commands or switch in configlet_changes]
+# Tasks are only waited for on switches whose configlet changes in this run or in the attempt being resumed.
+task_switches = [switch for switch in switches
+                 if args.switch_config == 'cvp' and not journal.done('task', switch) and (switch in configlet_changes or journal.done('configlet', switch))]
+if not review_plan(plan, args.apply):
+    site_report.finish('planned')
+    mlag_cache.save()
+    inventory.close()
+    nsx.close()
+    sys.exit()
+journal.announce()
+
+# Delete every binding in parallel.  Each switch is deconfigured as soon as its own ports are unbound
+# and each logical switch is deleted as soon as all of its bindings are gone, while the rest carry on.
+metrics.phase('binding')
+with ThreadPoolExecutor(max_workers=args.binding_workers) as binding_pool, \
+        ThreadPoolExecutor(max_workers=(args.switch_workers or len(teardown_switches) or 1) + len(unbind_executors)) as stage_pool:
+    switch_binding_futures = dict((switch, []) for switch in switches)
+    ls_futures = []
+    for unbind_executor in unbind_executors:
+        executor_futures = unbind_executor.submit(binding_pool)
+        for switch, futures in executor_futures.items():
+            switch_binding_futures[switch].extend(futures)
+        if unbind_executor.ls_name in plan.deleted_logical_switches:
+            virtualwire = dict(tenant_switches)[unbind_executor.ls_name]
+            all_futures = [future for futures in executor_futures.values() for future in futures]
+            ls_futures.append((unbind_executor.ls_name, stage_pool.submit(delete_logical_switch, unbind_executor.ls_name, virtualwire, unbind_executor, all_futures)))
+        else:
+            unbind_executor.binding_index.save()
+    teardown_futures = dict((switch, stage_pool.submit(switch_teardown, switch, switch_binding_futures[switch])) for switch in teardown_switches)
+    switch_status = dict((switch, future.result()) for switch, future in teardown_futures.items())
+    ls_status = dict((ls_name, future.result()) for ls_name, future in ls_futures)
+
+# Push the configlet changes to the switches through CVP tasks
+metrics.phase('task execution')
+task_switches = [switch for switch in task_switches if switch_status.get(switch, 'deconfigured') == 'deconfigured']
+if task_switches:
+    print('All configlets updated.  Pushing Tasks via CVP...')
+    task_results = execute_pending_tasks(task_switches)
+    for switch in incomplete_switches(task_switches, task_results):
+        switch_status[switch] = 'CVP task did not complete'
+
+unbind_results = [result for unbind_executor in unbind_executors for result in unbind_executor.results()]
+for unbind_executor in unbind_executors:
+    unbind_executor.print_summary()
+for switch, status in switch_status.items():
+    print(switch + ' ' + status)
+failed = [result for result in unbind_results if result.status == 'failed'] or \
+    [status for status in list(switch_status.values()) + list(ls_status.values()) if status != 'deconfigured' and status != 'deleted']
+mlag_cache.save()
+if not failed:
+    journal.finish()
+site_report.finish('partial' if failed else 'applied', unbind_results,
+                   [(ls_name, ls_status.get(ls_name, 'kept')) for ls_name, virtualwire in tenant_switches])
+
+# Report NSX Manager connection reuse and any throttling for the run
+nsx.print_stats()
+limits.print_stats()
+inventory.print_stats()
+inventory.close()
+nsx.close()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+
+# BSD 3-Clause License
+#
+# Copyright (c) 2018, Arista Networks EOS+
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name Arista nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+'''
+Clients kept warm between runs in one process.
+
+A script run on its own builds its NSX Manager session, CVP login and
+request budgets from scratch and drops them at exit.  The provisioning
+service runs many jobs in each of its worker processes, so it turns the
+warm pool on.  Those clients are then built by the first job that needs
+them and handed to every job after it: the NSX keep-alive connections and
+auth token, the CVP session and the learned request budgets all carry over.
+Outside the service the pool is off and every call builds a new client.
+
+Created by Dimitri Capetz - dcapetz@arista.com
+'''
+
+# Import threading for building clients from worker threads
+import threading
+
+_lock = threading.Lock()
+_clients = None
+
+def enable_warm_pool():
+    ''' Keep the clients built through keep_warm for the life of the process '''
+    global _clients
+    with _lock:
+        if _clients is None:
+            _clients = {}
+
+def warm_pool_enabled():
+    ''' True if clients are kept between runs in this process '''
+    return _clients is not None
+
+def keep_warm(key, build):
+    ''' Return the client kept under a key, building it on first use
+
+    Args:
+        key (tuple): What the client is for, credentials included, so different logins never share a client
+        build (function): Builds the client when there isn't one yet
+
+    Returns:
+        client (class): The kept client, or a new one when the warm pool is off
+    '''
+    if _clients is None:
+        return build()
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client = build()
+            _clients[key] = client
+        return client